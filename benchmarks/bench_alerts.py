@@ -0,0 +1,168 @@
+"""
+Benchmark the background AlertDispatcher against the old blocking send (a new Twilio client per alert), using a local
+fake of the Twilio messages API with injected latency and failures. Also checks that duplicate and re-run alerts are
+skipped, and shows how a digest window cuts the number of messages sent while keeping each one within WhatsApp's
+1600 character limit.
+
+Usage: python benchmarks/bench_alerts.py --alerts 20 --latency 0.3 --failure-rate 0.2
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from standin import StandInServer
+
+from models import BikeListingData
+from notifier import (
+    TWILIO_WHATSAPP_SANDBOX_NUMBER,
+    AlertDispatcher,
+    format_alert,
+    message_length,
+)
+from pipeline import percentile
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+# the config is loaded on first use, so give it placeholder credentials - every request goes to the stand-in
+for name in [
+    "TWILIO_ACCOUNT_SID",
+    "TWILIO_AUTH_TOKEN",
+    "TWILIO_MESSAGING_SERVICE_SID",
+    "TWILIO_TO_NUMBER",
+]:
+    os.environ.setdefault(name, "unused")
+
+ACCOUNT_SID = "AC" + "0" * 32
+
+
+def make_listings(n: int) -> list:
+    return [
+        BikeListingData(
+            title=f"54cm Trek Emonda SL5 #{i} - Shimano 105",
+            price="$1,200",
+            body="Full Shimano 105 11-speed groupset, carbon frame",
+            url=f"https://sfbay.craigslist.org/bik/d/{7_812_000_000 + i}.html",
+        )
+        for i in range(n)
+    ]
+
+
+def send_blocking(base_url: str, listings: list) -> float:
+    """The old send_whatsapp_alert: a new client per alert, sent inline, no retries"""
+    start = time.monotonic()
+    for listing in listings:
+        client = Client(ACCOUNT_SID, "token", http_client=TwilioHttpClient(timeout=10))
+        client.api.base_url = base_url
+        try:
+            client.messages.create(
+                body=format_alert(listing, "Quality carbon road bike"),
+                from_=TWILIO_WHATSAPP_SANDBOX_NUMBER,
+                to="whatsapp:+15555550100",
+            )
+        except Exception:
+            pass  # the old loop logged and moved on, dropping the alert
+    return time.monotonic() - start
+
+
+def run_dispatcher(base_url: str, listings: list, path: Path, digest_window: float):
+    dispatcher = AlertDispatcher(
+        account_sid=ACCOUNT_SID,
+        auth_token="token",
+        to_number="+15555550100",
+        sent_alerts_path=path,
+        digest_window_seconds=digest_window,
+        backoff_base_seconds=0.1,
+        api_base_url=base_url,
+    )
+    latencies = []
+    start = time.monotonic()
+    for listing in listings:
+        submitted_at = time.monotonic()
+        dispatcher.submit(
+            listing,
+            "Quality carbon road bike",
+            on_sent=lambda t=submitted_at: latencies.append(time.monotonic() - t),
+        )
+    blocked = time.monotonic() - start
+    dispatcher.close()
+    return dispatcher.stats, blocked, time.monotonic() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    parser.add_argument("--digest-window", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    listings = make_listings(args.alerts)
+    sids = itertools.count()
+
+    def route(path: str):
+        body = {"sid": f"SM{next(sids):032x}", "status": "queued"}
+        return 201, {"Content-Type": "application/json"}, json.dumps(body).encode()
+
+    print(
+        f"{'':<22} {'caller blocked':>15} {'total':>8} {'delivered':>10} {'messages':>9} "
+        f"{'retries':>8} {'dupes':>6} {'p50 sent':>9} {'longest msg':>12}"
+    )
+    with StandInServer(
+        route,
+        latency_seconds=args.latency,
+        failure_rate=args.failure_rate,
+        failure_status=503,
+    ) as server, tempfile.TemporaryDirectory() as tmp:
+        blocked = send_blocking(server.base_url, listings)
+        delivered = server.stats.status_counts.get(201, 0)
+        print(
+            f"{'blocking send':<22} {blocked:>14.2f}s {blocked:>7.2f}s {delivered:>10} {delivered:>9} "
+            f"{0:>8} {0:>6} {'':>9} {longest_message(server, 0):>12}"
+        )
+
+        # every listing submitted twice, to check duplicates within a run are skipped
+        for label, window, path in [
+            ("dispatcher", 0.0, Path(tmp) / "a.sqlite3"),
+            (
+                f"dispatcher + {window_label(args.digest_window)}",
+                args.digest_window,
+                Path(tmp) / "b.sqlite3",
+            ),
+            ("dispatcher re-run", 0.0, Path(tmp) / "a.sqlite3"),
+        ]:
+            posted_before = len(server.stats.posted)
+            stats, blocked, total, latencies = run_dispatcher(
+                server.base_url, listings + listings, path, window
+            )
+            print(
+                f"{label:<22} {blocked:>14.2f}s {total:>7.2f}s {stats.alerts_sent:>10} {stats.messages_sent:>9} "
+                f"{stats.retries:>8} {stats.duplicates_skipped:>6} {percentile(latencies, 50):>8.2f}s "
+                f"{longest_message(server, posted_before):>12}"
+            )
+
+
+def longest_message(server: StandInServer, since: int) -> int:
+    """Length of the longest message body posted to the stand-in from its `since`th request on"""
+    return max(
+        (
+            message_length(parse_qs(body.decode())["Body"][0])
+            for _, body in server.stats.posted[since:]
+        ),
+        default=0,
+    )
+
+
+def window_label(seconds: float) -> str:
+    return f"{seconds:g}s digest"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Compare analyzing months of classified listings from the columnar archive against the obvious alternative, a JSON
+lines file of the pydantic models loaded back in full: a scan of two columns (mean price of good bikes), a one-day
+time-range read, and both again once the small per-run segments have been compacted.
+
+The listings are the saved fixture pages parsed once, then varied in URL, price and verdict from a seed.
+
+Usage: python benchmarks/bench_archive.py --days 60 --runs-per-day 96 --listings-per-run 10
+"""
+
+import argparse
+import math
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from standin import load_listing_fixtures
+
+from archive import ListingArchive
+from models import BikeClassification, BikeListingData
+from scraper import parse_craigslist_bike_listing
+
+START = 1_760_000_000
+FIRST_POSTING_ID = 7_800_000_000
+
+
+def make_history(args):
+    """Yield (run start time, [(listing, classification)]) for every run"""
+    rng = random.Random(0)
+    templates = [
+        parse_craigslist_bike_listing(html, "https://sfbay.craigslist.org/bik/0.html")
+        for html in load_listing_fixtures().values()
+    ]
+    posting_id = FIRST_POSTING_ID
+    for run in range(args.days * args.runs_per_day):
+        run_at = START + run * 86400 / args.runs_per_day
+        rows = []
+        for _ in range(args.listings_per_run):
+            posting_id += 1
+            listing = rng.choice(templates).model_copy(
+                update={
+                    "url": f"https://sfbay.craigslist.org/bik/{posting_id}.html",
+                    "price": f"${rng.randint(50, 4000):,}",
+                }
+            )
+            is_good = rng.random() < 0.1
+            rows.append(
+                (
+                    listing,
+                    BikeClassification(
+                        is_good=is_good,
+                        reason=(
+                            "Modern carbon road bike" if is_good else "Not a road bike"
+                        ),
+                        confidence=rng.choice(["high", "medium", "low"]),
+                    ),
+                )
+            )
+        yield run_at, rows
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def mean_good_price_archive(archive: ListingArchive, start=None, end=None):
+    total = count = 0
+    for chunk in archive.scan(["price", "is_good"], start, end):
+        for price, is_good in zip(chunk["price"], chunk["is_good"]):
+            if is_good and not math.isnan(price):
+                total += price
+                count += 1
+    return total / count if count else 0.0, count
+
+
+def mean_good_price_jsonl(path: Path, start=None, end=None):
+    total = count = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            archived_at, listing_json, classification_json = line.rstrip("\n").split(
+                "\t"
+            )
+            if (start is not None and float(archived_at) < start) or (
+                end is not None and float(archived_at) >= end
+            ):
+                continue
+            listing = BikeListingData.model_validate_json(listing_json)
+            classification = BikeClassification.model_validate_json(classification_json)
+            if classification.is_good and listing.price:
+                total += float(listing.price.lstrip("$").replace(",", ""))
+                count += 1
+    return total / count if count else 0.0, count
+
+
+def size_mb(paths) -> float:
+    return sum(path.stat().st_size for path in paths) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--runs-per-day", type=int, default=96)
+    parser.add_argument("--listings-per-run", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ListingArchive(
+            Path(tmp) / "archive", compact_min_segments=8, target_segment_rows=50_000
+        )
+        jsonl_path = Path(tmp) / "listings.jsonl"
+        write_seconds = 0.0
+        with open(jsonl_path, "w", encoding="utf-8") as jsonl:
+            for run_at, rows in make_history(args):
+                for i, (listing, classification) in enumerate(rows):
+                    archived_at = run_at + i
+                    archive.append(listing, classification, archived_at=archived_at)
+                    jsonl.write(
+                        f"{archived_at}\t{listing.model_dump_json()}\t{classification.model_dump_json()}\n"
+                    )
+                start = time.perf_counter()
+                archive.flush()
+                write_seconds += time.perf_counter() - start
+        n_runs = args.days * args.runs_per_day
+        n_rows = n_runs * args.listings_per_run
+        print(
+            f"{n_rows} listings from {n_runs} runs over {args.days} days, "
+            f"{write_seconds / n_runs * 1000:.2f}ms per run to write its segment\n"
+        )
+
+        day_start = START + (args.days // 2) * 86400
+        day_end = day_start + 86400
+        print(
+            f"{'':<24} {'files':>6} {'MB':>7} {'scan 2 columns':>15} {'one day':>9} {'mean price':>11}"
+        )
+
+        def report(label, files, scan, one_day):
+            scan_seconds, (mean, count) = timed(scan)
+            day_seconds, _ = timed(one_day)
+            print(
+                f"{label:<24} {len(files):>6} {size_mb(files):>7.1f} {scan_seconds:>14.3f}s "
+                f"{day_seconds:>8.3f}s {mean:>11.2f}"
+            )
+
+        report(
+            "jsonl + pydantic",
+            [jsonl_path],
+            lambda: mean_good_price_jsonl(jsonl_path),
+            lambda: mean_good_price_jsonl(jsonl_path, day_start, day_end),
+        )
+        report(
+            "archive, per-run files",
+            archive.segment_paths(),
+            lambda: mean_good_price_archive(archive),
+            lambda: mean_good_price_archive(archive, day_start, day_end),
+        )
+        compact_seconds, merged = timed(archive.compact)
+        report(
+            "archive, compacted",
+            archive.segment_paths(),
+            lambda: mean_good_price_archive(archive),
+            lambda: mean_good_price_archive(archive, day_start, day_end),
+        )
+        print(f"\ncompaction merged {merged} segments in {compact_seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmark a backfill over a multi-day posting history replayed by a local stand-in: SAPI snapshots are answered from
+the history as of each requested timestamp, and listing pages from the saved fixtures. Compares a serial backfill
+(one request at a time, parsing in-thread) against the parallel one (thread pool for I/O, process pool for parsing),
+then interrupts a backfill partway and resumes it from its checkpoint.
+
+The posting history is generated from a seed rather than recorded, with postings arriving at a steady rate and some
+of them taken down again later.
+
+Usage: python benchmarks/bench_backfill.py --days 2 --listings-per-hour 4 --sapi-latency 0.2 --page-latency 0.1
+"""
+
+import argparse
+import collections
+import logging
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from fake_llm import FakeChatModel
+from standin import StandInServer, load_listing_fixtures, make_sapi_payload
+
+import change_data_capture
+from backfill import BackfillCheckpoint, Backfiller
+from llm_classifier import BikeClassifier
+from models import SearchProfile
+from pipeline import ListingPipeline
+from scraper import ListingFetcher
+
+# the config is loaded on first use, so give it placeholder credentials - nothing is called here
+for name in [
+    "ANTHROPIC_API_KEY",
+    "TWILIO_ACCOUNT_SID",
+    "TWILIO_AUTH_TOKEN",
+    "TWILIO_MESSAGING_SERVICE_SID",
+    "TWILIO_TO_NUMBER",
+]:
+    os.environ.setdefault(name, "unused")
+
+FIRST_POSTING_ID = 7_800_000_000
+REPLAY_END = 1_760_000_000
+
+
+@dataclass
+class Posting:
+    posting_id: int
+    posted_at: int
+    removed_at: Optional[int]
+
+
+def make_posting_history(
+    days: int, listings_per_hour: float, removed_rate: float, seed: int = 0
+) -> List[Posting]:
+    """Postings arriving as a Poisson process over the `days` before REPLAY_END, some of them removed later"""
+    rng = random.Random(seed)
+    postings = []
+    t = REPLAY_END - days * 24 * 3600
+    while True:
+        t += rng.expovariate(listings_per_hour / 3600)
+        if t >= REPLAY_END:
+            return postings
+        removed_at = None
+        if rng.random() < removed_rate:
+            removed_at = int(t + rng.uniform(0, REPLAY_END - t))
+        postings.append(Posting(FIRST_POSTING_ID + len(postings), int(t), removed_at))
+
+
+def run(args, server, postings, checkpoint_path: Path, parallel: bool, deadline=None):
+    profile = SearchProfile(
+        name="replay",
+        search_path="san-francisco-ca/bia",
+        lat=37.789,
+        lon=-122.394,
+        distance_miles=15,
+        url_base=f"{server.base_url}/bik/",
+    )
+    alerts = collections.Counter()
+
+    def notify(listing, reason, on_sent=None) -> bool:
+        alerts[listing.url] += 1
+        if on_sent:
+            on_sent()
+        return True
+
+    classifier = BikeClassifier(
+        api_key="unused",
+        chat_model=FakeChatModel(latency_seconds=args.llm_latency),
+        max_concurrency=4 if parallel else 1,
+    )
+    fetcher = ListingFetcher(requests_per_second=50, burst=8, backoff_base_seconds=0.1)
+    parse_pool = ProcessPoolExecutor(args.parse_processes) if parallel else None
+    try:
+        pipeline = ListingPipeline(
+            fetcher,
+            classifier,
+            notify,
+            fetch_workers=8 if parallel else 1,
+            parse_workers=args.parse_processes if parallel else 1,
+            classify_concurrency=4 if parallel else 1,
+            parse_executor=parse_pool,
+        )
+        backfiller = Backfiller(
+            pipeline,
+            BackfillCheckpoint(checkpoint_path),
+            [profile],
+            window_seconds=args.window_minutes * 60,
+            snapshot_workers=8 if parallel else 1,
+            deadline=deadline,
+        )
+        start = REPLAY_END - args.days * 24 * 3600
+        stats = backfiller.run(start, REPLAY_END)
+    finally:
+        if parse_pool:
+            parse_pool.shutdown()
+    return stats, alerts
+
+
+def report(label: str, stats, alerts) -> None:
+    duplicate_alerts = sum(count - 1 for count in alerts.values())
+    print(
+        f"{label:<16} {stats.elapsed_seconds:>8.2f}s {stats.windows_completed:>8} "
+        f"{stats.snapshots_fetched:>10} {stats.listings_processed:>9} {len(alerts):>7} {duplicate_alerts:>11}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--listings-per-hour", type=float, default=4)
+    parser.add_argument("--removed-rate", type=float, default=0.2)
+    parser.add_argument("--window-minutes", type=int, default=60)
+    parser.add_argument("--sapi-latency", type=float, default=0.2)
+    parser.add_argument("--page-latency", type=float, default=0.1)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--parse-processes", type=int, default=4)
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    postings = make_posting_history(
+        args.days, args.listings_per_hour, args.removed_rate
+    )
+    active = [p for p in postings if p.removed_at is None]
+    pages = list(load_listing_fixtures().values())
+    print(
+        f"{len(postings)} postings over {args.days} days, {len(active)} still active\n"
+    )
+
+    def route(path: str):
+        url = urlsplit(path)
+        if url.path.startswith("/bik/"):
+            posting_id = int(url.path.rsplit("/", 1)[-1].removesuffix(".html"))
+            return (
+                200,
+                {"Content-Type": "text/html"},
+                pages[posting_id % len(pages)].encode(),
+            )
+
+        # SAPI: listings posted until the batch timestamp that still exist. The stand-in's own latency is the page
+        # latency, so make up the difference here
+        time.sleep(max(0.0, args.sapi_latency - args.page_latency))
+        until = int(parse_qs(url.query)["batch"][0].split("-")[1])
+        posting_ids = [p.posting_id for p in active if p.posted_at <= until]
+        return 200, {"Content-Type": "application/json"}, make_sapi_payload(posting_ids)
+
+    print(
+        f"{'':<16} {'elapsed':>9} {'windows':>8} {'snapshots':>10} {'listings':>9} {'alerts':>7} "
+        f"{'dup alerts':>11}"
+    )
+    with StandInServer(
+        route, latency_seconds=args.page_latency
+    ) as server, tempfile.TemporaryDirectory() as tmp:
+        change_data_capture.SAPI_SEARCH_URL = f"{server.base_url}/search/full"
+
+        if not args.skip_serial:
+            report(
+                "serial",
+                *run(
+                    args, server, postings, Path(tmp) / "serial.sqlite3", parallel=False
+                ),
+            )
+        full_stats, full_alerts = run(
+            args, server, postings, Path(tmp) / "parallel.sqlite3", parallel=True
+        )
+        report("parallel", full_stats, full_alerts)
+
+        # interrupt a backfill a third of the way through, then resume it from the checkpoint
+        checkpoint = Path(tmp) / "resumed.sqlite3"
+        interrupted, first_alerts = run(
+            args,
+            server,
+            postings,
+            checkpoint,
+            parallel=True,
+            deadline=time.monotonic() + full_stats.elapsed_seconds / 3,
+        )
+        report("interrupted", interrupted, first_alerts)
+        resumed, resumed_alerts = run(args, server, postings, checkpoint, parallel=True)
+        report("resumed", resumed, resumed_alerts)
+
+    both = first_alerts + resumed_alerts
+    print(
+        f"\ninterrupted + resumed: {interrupted.listings_processed + resumed.listings_processed} listings, "
+        f"{len(both)} alerts, {sum(count - 1 for count in both.values())} duplicate alerts "
+        f"(full run: {full_stats.listings_processed} listings)"
+    )
+
+
+if __name__ == "__main__":
+    main()
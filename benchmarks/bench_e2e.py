@@ -0,0 +1,262 @@
+"""
+End-to-end benchmark of `main.run_pipeline` at several scales, fully offline: a local stand-in serves SAPI snapshots,
+the saved listing pages and a fake Twilio messages API, and a stub chat model stands in for Claude, each with
+configurable latency. Each scale runs in its own process so peak RSS is measured per run. Reports throughput,
+per-stage latency and peak RSS, and compares them against a stored baseline.
+
+The SAPI snapshots are generated in the shape of Craigslist's responses (see `standin.make_sapi_payload`), with the
+requested number of listings posted since the previous snapshot.
+
+Usage:
+    python benchmarks/bench_e2e.py --scales 10 100 1000
+    python benchmarks/bench_e2e.py --save-baseline  # after a change that's expected to move the numbers
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from standin import (
+    BENCHMARKS_DIR,
+    StandInServer,
+    load_listing_fixtures,
+    make_sapi_payload,
+)
+
+BASELINE_PATH = BENCHMARKS_DIR / "baselines" / "bench_e2e.json"
+FIRST_POSTING_ID = 7_800_000_000
+ACCOUNT_SID = "AC" + "0" * 32
+# fields compared against the baseline, and whether higher is better
+COMPARED_FIELDS = {
+    "listings_per_second": True,
+    "fetch_p95": False,
+    "parse_p95": False,
+    "classify_p95": False,
+    "notify_p95": False,
+    "peak_rss_mb": False,
+}
+
+
+def run_scale(args) -> dict:
+    """Run `run_pipeline` once for `args.scale` new listings, in this process"""
+    tmp = Path(tempfile.mkdtemp())
+    active = list(range(FIRST_POSTING_ID, FIRST_POSTING_ID + args.active_listings))
+    new = list(range(active[-1] + 1, active[-1] + 1 + args.scale))
+    started_at = int(time.time())
+    pages = list(load_listing_fixtures().values())
+    sids = iter(range(1_000_000))
+
+    def route(path: str):
+        url = urlsplit(path)
+        if url.path.startswith("/bik/"):
+            time.sleep(args.page_latency)
+            posting_id = int(url.path.rsplit("/", 1)[-1].removesuffix(".html"))
+            return (
+                200,
+                {"Content-Type": "text/html"},
+                pages[posting_id % len(pages)].encode(),
+            )
+        if url.path.endswith("/Messages.json"):
+            time.sleep(args.twilio_latency)
+            body = {"sid": f"SM{next(sids):032x}", "status": "queued"}
+            return 201, {"Content-Type": "application/json"}, json.dumps(body).encode()
+
+        # SAPI: the bootstrap snapshot from before the run has none of the new listings, the current one has them all
+        time.sleep(args.sapi_latency)
+        until = int(parse_qs(url.query)["batch"][0].split("-")[1])
+        posting_ids = active + new if until >= started_at else active
+        return 200, {"Content-Type": "application/json"}, make_sapi_payload(posting_ids)
+
+    with StandInServer(route) as server:
+        os.environ.update(
+            {
+                "ANTHROPIC_API_KEY": "unused",
+                "TWILIO_ACCOUNT_SID": ACCOUNT_SID,
+                "TWILIO_AUTH_TOKEN": "unused",
+                "TWILIO_MESSAGING_SERVICE_SID": "unused",
+                "TWILIO_TO_NUMBER": "+15555550100",
+                "TWILIO_API_BASE_URL": server.base_url,
+                "SEARCH_URL_BASE": f"{server.base_url}/bik/",
+                "CDC_STATE_PATH": str(tmp / "cdc.sqlite3"),
+                "ALERT_SENT_PATH": str(tmp / "alerts.sqlite3"),
+                "ARCHIVE_PATH": str(tmp / "archive"),
+                "LISTING_INDEX_PATH": str(tmp / "listing_index.sqlite"),
+                # the saved pages repeat, so the cache would answer most listings after the first few
+                "CLASSIFICATION_CACHE_ENABLED": "false",
+                "FETCH_REQUESTS_PER_SECOND": "1000",
+                "FETCH_BURST": "50",
+            }
+        )
+        # imported once the environment is set, as the config is loaded once per process
+        import change_data_capture
+        import container
+        import main
+        from fake_llm import FakeChatModel
+        from metrics import get_metrics
+
+        # measure a warm instance: the SDKs the pipeline imports on first use are bench_startup.py's concern
+        import bs4  # noqa: F401
+        import pipeline  # noqa: F401
+
+        logging.getLogger().setLevel(logging.WARNING)
+        change_data_capture.SAPI_SEARCH_URL = f"{server.base_url}/search/full"
+        container.build_classifier = partial(
+            container.build_classifier,
+            chat_model=FakeChatModel(latency_seconds=args.llm_latency),
+        )
+
+        main.run_pipeline()
+
+    summary = get_metrics().summary()
+
+    def histogram(name: str, **labels) -> dict:
+        for series in summary.get(name, []):
+            if series["labels"] == {k: str(v) for k, v in labels.items()}:
+                return series
+        return {"count": 0, "p50": 0.0, "p95": 0.0}
+
+    run_seconds = histogram("run_seconds")["sum"]
+    result = {
+        "listings": args.scale,
+        "run_seconds": round(run_seconds, 3),
+        "listings_per_second": round(args.scale / run_seconds, 2),
+        "sapi_p50": histogram("sapi_request_seconds", search="default")["p50"],
+        "llm_request_p50": histogram("llm_request_seconds", kind="batch")["p50"],
+        "alerts_sent": sum(
+            series["value"] for series in summary.get("alerts_sent_total", [])
+        ),
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+    for stage in ["fetch", "parse", "classify", "notify"]:
+        series = histogram("pipeline_stage_seconds", stage=stage)
+        result[f"{stage}_p50"] = series["p50"]
+        result[f"{stage}_p95"] = series["p95"]
+    return result
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, min_delta_seconds: float
+) -> list:
+    """
+    Print each result next to its baseline, returning the regressions beyond `tolerance`. Latencies within
+    `min_delta_seconds` of the baseline aren't flagged, as a few milliseconds either way is just noise
+    """
+    regressions = []
+    print(f"\n{'vs baseline':<12} " + " ".join(f"{f:>20}" for f in COMPARED_FIELDS))
+    for scale, result in results.items():
+        base = baseline.get(scale)
+        if not base:
+            print(f"{scale:<12} no baseline")
+            continue
+        cells = []
+        for field, higher_is_better in COMPARED_FIELDS.items():
+            if not base[field]:
+                cells.append(f"{'-':>20}")
+                continue
+            change = (result[field] - base[field]) / base[field]
+            worse = -change if higher_is_better else change
+            noise = (
+                field.endswith("_p95")
+                and abs(result[field] - base[field]) < min_delta_seconds
+            )
+            flag = " !" if worse > tolerance and not noise else ""
+            if flag:
+                regressions.append(f"{scale} listings: {field} {change:+.0%}")
+            cells.append(f"{change:>+18.0%}{flag:>2}")
+        print(f"{scale:<12} " + " ".join(cells))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--active-listings", type=int, default=2_000)
+    parser.add_argument("--sapi-latency", type=float, default=0.2)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--twilio-latency", type=float, default=0.02)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Flag changes this much worse than the baseline",
+    )
+    parser.add_argument(
+        "--min-delta-seconds",
+        type=float,
+        default=0.01,
+        help="Don't flag latencies within this many seconds of the baseline",
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    if args.scale is not None:
+        # child process running a single scale: report back on the last line of stdout
+        print(json.dumps(run_scale(args)))
+        return
+
+    results = {}
+    header = (
+        f"{'listings':>8} {'elapsed':>9} {'listings/s':>11} {'fetch p50/p95':>15} {'parse p50/p95':>15} "
+        f"{'classify p50/p95':>17} {'notify p50/p95':>15} {'alerts':>7} {'peak RSS':>9}"
+    )
+    print(header)
+    for scale in args.scales:
+        child_args = [a for a in sys.argv[1:] if a != "--save-baseline"]
+        output = subprocess.run(
+            [sys.executable, __file__, *child_args, "--scale", str(scale)],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results[str(scale)] = result
+        print(
+            f"{scale:>8} {result['run_seconds']:>8.2f}s {result['listings_per_second']:>11.1f} "
+            f"{stage(result, 'fetch'):>15} {stage(result, 'parse'):>15} {stage(result, 'classify'):>17} "
+            f"{stage(result, 'notify'):>15} "
+            f"{result['alerts_sent']:>7} {result['peak_rss_mb']:>7.1f}MB"
+        )
+
+    if args.save_baseline:
+        BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE_PATH.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nSaved baseline to {BASELINE_PATH}")
+        return
+    if not BASELINE_PATH.exists():
+        print(
+            f"\nNo baseline at {BASELINE_PATH}, run with --save-baseline to store one"
+        )
+        return
+
+    regressions = compare(
+        results,
+        json.loads(BASELINE_PATH.read_text()),
+        args.tolerance,
+        args.min_delta_seconds,
+    )
+    if regressions:
+        print("\nRegressions beyond the tolerance:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+def stage(result: dict, name: str) -> str:
+    """p50/p95 of a pipeline stage in a run's result"""
+    return f"{result[name + '_p50']:.3f}/{result[name + '_p95']:.3f}"
+
+
+if __name__ == "__main__":
+    main()
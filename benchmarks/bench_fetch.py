@@ -0,0 +1,80 @@
+"""
+Benchmark the concurrent `ListingFetcher` against the old serial fetch loop, using a local stand-in that serves canned
+listing pages with injected latency and 429s.
+
+Usage: python benchmarks/bench_fetch.py --listings 60 --latency 0.3 --failure-rate 0.05
+"""
+
+import argparse
+import logging
+import time
+
+from standin import StandInServer, load_listing_fixtures
+
+from scraper import ListingFetcher, fetch_and_parse_listing
+
+# the serial loop used to sleep this long between listings
+SERIAL_SLEEP_SECONDS = 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--rps", type=float, default=10.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    pages = list(load_listing_fixtures().values())
+
+    def route(path: str):
+        listing_id = int(path.rsplit("/", 1)[-1].removesuffix(".html"))
+        return (
+            200,
+            {"Content-Type": "text/html"},
+            pages[listing_id % len(pages)].encode(),
+        )
+
+    with StandInServer(
+        route, latency_seconds=args.latency, failure_rate=args.failure_rate
+    ) as server:
+        urls = [f"{server.base_url}/bik/{i}.html" for i in range(args.listings)]
+
+        start = time.monotonic()
+        serial_ok = sum(1 for url in urls if fetch_and_parse_listing(url))
+        serial_seconds = time.monotonic() - start
+
+        fetcher = ListingFetcher(
+            max_workers=args.workers,
+            max_concurrency_per_host=args.per_host,
+            requests_per_second=args.rps,
+            burst=args.per_host,
+            backoff_base_seconds=0.1,
+        )
+        start = time.monotonic()
+        first_result_seconds = None
+        for _ in fetcher.fetch_all(urls):
+            if first_result_seconds is None:
+                first_result_seconds = time.monotonic() - start
+        concurrent_seconds = time.monotonic() - start
+
+    stats = fetcher.stats
+    print(
+        f"listings: {args.listings}, latency: {args.latency}s, failure rate: {args.failure_rate}"
+    )
+    print(
+        f"serial:     {serial_ok}/{args.listings} ok in {serial_seconds:.2f}s "
+        f"(+{SERIAL_SLEEP_SECONDS * args.listings}s of sleeps in the old loop)"
+    )
+    print(
+        f"concurrent: {stats.succeeded}/{stats.requested} ok in {concurrent_seconds:.2f}s, "
+        f"{stats.listings_per_second:.2f} listings/s, {stats.retries} retries, "
+        f"first result after {first_result_seconds:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare the shared `HttpClient` against bare `requests.get` calls, using two local stand-in hosts (one serving SAPI-style
+JSON, one serving listing pages) that count the connections they accept.
+
+Usage: python benchmarks/bench_http_client.py --requests 50 --latency 0.02
+"""
+
+import argparse
+import random
+import time
+
+import requests
+from standin import StandInServer, load_listing_fixtures, make_sapi_payload
+
+from http_client import HttpClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    pages = list(load_listing_fixtures().values())
+    sapi_payload = make_sapi_payload(random.Random(0).sample(range(10**9), 2_000))
+
+    def sapi_route(path: str):
+        return 200, {"Content-Type": "application/json"}, sapi_payload
+
+    def listing_route(path: str):
+        listing_id = int(path.rsplit("/", 1)[-1].removesuffix(".html"))
+        return (
+            200,
+            {"Content-Type": "text/html"},
+            pages[listing_id % len(pages)].encode(),
+        )
+
+    for name in ("requests.get", "HttpClient"):
+        with StandInServer(
+            sapi_route, latency_seconds=args.latency, compress=True
+        ) as sapi, StandInServer(
+            listing_route, latency_seconds=args.latency, compress=True, etags=True
+        ) as listings:
+            client = HttpClient()
+
+            def get(url: str, conditional: bool) -> None:
+                if name == "requests.get":
+                    requests.get(url, timeout=10)
+                    return
+                response = client.get(url, conditional=conditional)
+                if conditional:
+                    # stand in for the parsed listing the scraper keeps for revalidation
+                    client.store(response, response.content)
+
+            start = time.perf_counter()
+            for i in range(args.requests):
+                get(f"{sapi.base_url}/web/v8/postings/search/full", False)
+                # every listing gets fetched twice, like a retried or overlapping run would
+                get(f"{listings.base_url}/bik/{i // 2}.html", True)
+            seconds = time.perf_counter() - start
+
+        print(
+            f"{name:>12}: {2 * args.requests} requests in {seconds:.2f}s, "
+            f"connections: sapi={sapi.stats.connections} listings={listings.stats.connections}, "
+            f"bytes sent: {(sapi.stats.bytes_sent + listings.stats.bytes_sent) / 1024:.0f}KB, "
+            f"304s: {listings.stats.not_modified}"
+        )
+
+    for host, stats in client.stats.items():
+
+        def avg(seconds: float) -> float:
+            return seconds / stats.requests * 1000
+
+        print(
+            f"  {host}: avg connect={avg(stats.connect_seconds):.2f}ms "
+            f"ttfb={avg(stats.ttfb_seconds):.2f}ms body={avg(stats.body_seconds):.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
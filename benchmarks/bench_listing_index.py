@@ -0,0 +1,190 @@
+"""
+Compare queries over months of parsed listings against the listing index with rescanning raw data, a JSON lines file
+of the pydantic models loaded back in full, like the analysis in `data_exploration.ipynb`. Also reports how long each
+run takes to write its listings to the index, and the index's size. Both sides must return the same listings.
+
+The listings are the recorded corpus varied in URL, manufacturer, model, material, frame size, price and a few body
+words from a seed.
+
+Usage: python benchmarks/bench_listing_index.py --listings 300000 --listings-per-run 100
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from eval_prefilter import load_corpus
+from standin import FIXTURES_DIR
+
+from listing_index import ListingIndex, listing_terms, query_terms
+from models import BikeListingData, ListingQuery
+from pricing import parse_frame_size_cm, parse_price
+
+START = 1_760_000_000
+DAYS = 180
+FIRST_POSTING_ID = 7_800_000_000
+
+MODELS = {
+    "Cannondale": ["CAAD 10", "CAAD 12", "SuperSix Evo", "Synapse", "Topstone"],
+    "Trek": ["Emonda SL5", "Domane AL2", "Madone SLR", "Checkpoint ALR", "FX 3"],
+    "Specialized": ["Allez", "Tarmac SL6", "Roubaix", "Diverge", "Sirrus"],
+    "Giant": ["Contend", "TCR Advanced", "Defy", "Revolt", "Escape 3"],
+    "Bianchi": ["Via Nirone 7", "Oltre", "Sprint", "Infinito"],
+    "Fuji": ["Roubaix 1.3", "Sportif", "Jari"],
+}
+MATERIALS = ["Carbon Fiber", "carbon", "Aluminum", "aluminium", "Steel", "Titanium"]
+COMPONENTS = ["105", "Ultegra", "Dura-Ace", "Tiagra", "Sora", "Rival", "Force", "GRX"]
+EXTRAS = ["tubeless", "disc", "rim", "power meter", "new tires", "garage kept"]
+
+QUERIES = {
+    "Cannondale, 54-56cm, carbon, <$1500, 30 days": lambda now: ListingQuery(
+        manufacturer="cannondale",
+        frame_material="carbon",
+        min_frame_size_cm=54,
+        max_frame_size_cm=56,
+        max_price=1500,
+        since=now - 30 * 86400,
+        limit=None,
+    ),
+    "text 'ultegra disc', 58cm+, newest 100": lambda now: ListingQuery(
+        text="ultegra disc", min_frame_size_cm=58
+    ),
+    "Trek Emonda, newest 20": lambda now: ListingQuery(
+        manufacturer="trek", model="emonda", limit=20
+    ),
+    "$500-800, last 7 days": lambda now: ListingQuery(
+        min_price=500, max_price=800, since=now - 7 * 86400, limit=None
+    ),
+    "titanium, 'power meter', newest 100": lambda now: ListingQuery(
+        frame_material="titanium", text="power meter"
+    ),
+    "titanium, 'power meter', all": lambda now: ListingQuery(
+        frame_material="titanium", text="power meter", limit=None
+    ),
+}
+
+
+def make_listings(n: int, rng: random.Random):
+    """Yield (indexed_at, listing), oldest first"""
+    corpus = [
+        listing for listing, _ in load_corpus(FIXTURES_DIR / "recorded_verdicts.jsonl")
+    ]
+    for i in range(n):
+        manufacturer = rng.choice(list(MODELS))
+        template = rng.choice(corpus)
+        words = rng.sample(COMPONENTS, 2) + rng.sample(EXTRAS, 2)
+        listing = template.model_copy(
+            update={
+                "body": f"{template.body}\n{' '.join(words)}",
+                "url": f"https://sfbay.craigslist.org/bik/d/{FIRST_POSTING_ID + i}.html",
+                "manufacturer": manufacturer,
+                "model": rng.choice(MODELS[manufacturer]),
+                "frame_material": rng.choice(MATERIALS),
+                "frame_size": (
+                    f"{rng.randint(48, 62)}cm"
+                    if rng.random() < 0.9
+                    else rng.choice(["M", None])
+                ),
+                "price": (
+                    f"${rng.randint(10, 400) * 10:,}" if rng.random() < 0.95 else None
+                ),
+            }
+        )
+        yield START + DAYS * 86400 * i / n, listing
+
+
+def rescan(path: Path, query: ListingQuery):
+    """Answer a query by loading every listing, newest first like the index"""
+    terms = query_terms(query)
+    matches = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            indexed_at, listing_json = line.rstrip("\n").split("\t")
+            indexed_at = float(indexed_at)
+            if (query.since is not None and indexed_at < query.since) or (
+                query.until is not None and indexed_at >= query.until
+            ):
+                continue
+            listing = BikeListingData.model_validate_json(listing_json)
+            if not in_range(
+                parse_price(listing.price), query.min_price, query.max_price
+            ):
+                continue
+            if not in_range(
+                parse_frame_size_cm(listing.frame_size),
+                query.min_frame_size_cm,
+                query.max_frame_size_cm,
+            ):
+                continue
+            if terms <= listing_terms(listing):
+                matches.append(listing)
+    matches.reverse()
+    return matches[: query.limit] if query.limit is not None else matches
+
+
+def in_range(value, low, high) -> bool:
+    if value is None:
+        return low is None and high is None
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=300_000)
+    parser.add_argument("--listings-per-run", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = ListingIndex(Path(tmp) / "index.sqlite")
+        jsonl_path = Path(tmp) / "listings.jsonl"
+        flush_seconds, runs = 0.0, 0
+        with open(jsonl_path, "w", encoding="utf-8") as jsonl:
+            for i, (indexed_at, listing) in enumerate(
+                make_listings(args.listings, rng), 1
+            ):
+                index.add(listing, indexed_at=indexed_at)
+                jsonl.write(f"{indexed_at}\t{listing.model_dump_json()}\n")
+                if i % args.listings_per_run == 0 or i == args.listings:
+                    start = time.perf_counter()
+                    index.flush()
+                    flush_seconds += time.perf_counter() - start
+                    runs += 1
+        index_mb = (
+            sum(path.stat().st_size for path in Path(tmp).glob("index.sqlite*")) / 1e6
+        )
+        print(
+            f"{args.listings} listings over {DAYS} days: {flush_seconds / runs * 1000:.1f}ms per run of "
+            f"{args.listings_per_run} to index, index {index_mb:.0f}MB, "
+            f"jsonl {jsonl_path.stat().st_size / 1e6:.0f}MB\n"
+        )
+
+        now = START + DAYS * 86400
+        print(
+            f"{'':<46} {'matches':>8} {'index p50':>10} {'index max':>10} {'rescan':>8}"
+        )
+        for label, make_query in QUERIES.items():
+            query = make_query(now)
+            timings = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                listings = index.query(query)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            start = time.perf_counter()
+            expected = rescan(jsonl_path, query)
+            rescan_seconds = time.perf_counter() - start
+            assert [listing.url for listing in listings] == [
+                listing.url for listing in expected
+            ], f"{label}: index and rescan disagree"
+            print(
+                f"{label:<46} {len(listings):>8} {timings[len(timings) // 2] * 1000:>8.1f}ms "
+                f"{timings[-1] * 1000:>8.1f}ms {rescan_seconds:>7.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
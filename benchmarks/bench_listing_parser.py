@@ -0,0 +1,80 @@
+"""
+Check that the single-pass listing extractor matches the BeautifulSoup parser on every saved listing page, then
+compare their throughput in pages per second.
+
+Pages whose layout the single-pass extractor doesn't recognize must fall back to BeautifulSoup; those are reported
+but not counted as parity failures.
+
+Usage: python benchmarks/bench_listing_parser.py --seconds 2
+"""
+
+import argparse
+import sys
+import time
+
+from standin import load_listing_fixtures
+
+from scraper import (
+    parse_craigslist_bike_listing,
+    parse_listing_single_pass,
+    parse_listing_with_soup,
+)
+
+URL = "https://sfbay.craigslist.org/bik/7812345678.html"
+
+
+def check_parity(pages: dict) -> bool:
+    ok = True
+    for name, html in pages.items():
+        expected = parse_listing_with_soup(html, URL)
+        fast = parse_listing_single_pass(html, URL)
+
+        if fast is None:
+            # the fallback has to kick in and produce the BeautifulSoup result
+            status = "fallback"
+            ok &= parse_craigslist_bike_listing(html, URL) == expected
+        elif fast == expected:
+            status = "match"
+        else:
+            status = "MISMATCH"
+            ok = False
+            for field_name in type(fast).model_fields:
+                got, want = getattr(fast, field_name), getattr(expected, field_name)
+                if got != want:
+                    print(f"  {name}.{field_name}: {got!r} != {want!r}")
+
+        print(f"{status:>9}  {name}")
+    return ok
+
+
+def pages_per_second(parse, pages: list, seconds: float) -> float:
+    parsed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for html in pages:
+            parse(html, URL)
+        parsed += len(pages)
+    return parsed / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    fixtures = load_listing_fixtures()
+    if not check_parity(fixtures):
+        print("Parity check failed")
+        sys.exit(1)
+
+    # only time pages the fast path handles, so both parsers do the same work
+    pages = [html for html in fixtures.values() if parse_listing_single_pass(html, URL)]
+    soup_rate = pages_per_second(parse_listing_with_soup, pages, args.seconds)
+    fast_rate = pages_per_second(parse_listing_single_pass, pages, args.seconds)
+
+    print(f"\nBeautifulSoup: {soup_rate:,.0f} pages/s")
+    print(f"single pass:   {fast_rate:,.0f} pages/s ({fast_rate / soup_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare sequential `classify_batch` against concurrent `aclassify_many` at different concurrency caps, against a stub
+chat model with injected latency that answers with 429s once too many requests are in flight. Shows the AIMD limiter
+settling below the stub's concurrency limit, and that a deadline bounds how long retries can run.
+
+Usage: python benchmarks/bench_llm_async.py --listings 200 --latency 0.5 --server-concurrency 6
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from bench_llm_batching import make_listings
+from fake_llm import FakeChatModel
+
+from llm_classifier import BikeClassifier
+
+
+def make_classifier(args, max_concurrency: int):
+    model = FakeChatModel(
+        latency_seconds=args.latency,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrent_requests=args.server_concurrency,
+    )
+    classifier = BikeClassifier(
+        api_key="unused",
+        chat_model=model,
+        batch_size=args.batch_size,
+        max_concurrency=max_concurrency,
+        max_retries=args.max_retries,
+        backoff_base_seconds=args.latency / 2,
+        backoff_max_seconds=args.latency * 4,
+    )
+    return classifier, model
+
+
+def report(label: str, results, classifier, model, elapsed: float) -> None:
+    failed = sum(c.reason.startswith("Classification failed") for _, c in results)
+    print(
+        f"{label:<24} {elapsed:>7.2f}s {model.stats.requests:>9} {model.stats.rate_limited:>5} "
+        f"{model.stats.max_in_flight:>10} {classifier.limiter.limit:>11.1f} {failed:>7}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--server-concurrency", type=int, default=6)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.02)
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    # retries and failures are expected here, and show up in the table below
+    logging.basicConfig(level=logging.CRITICAL)
+    listings = make_listings(args.listings)
+    print(
+        f"{'':<24} {'elapsed':>8} {'requests':>9} {'429s':>5} {'max flight':>10} "
+        f"{'final limit':>11} {'failed':>7}"
+    )
+
+    classifier, model = make_classifier(args, max_concurrency=1)
+    start = time.perf_counter()
+    results = classifier.classify_batch(listings)
+    report("classify_batch", results, classifier, model, time.perf_counter() - start)
+
+    for concurrency in args.concurrency:
+        classifier, model = make_classifier(args, concurrency)
+        start = time.perf_counter()
+        results = asyncio.run(classifier.aclassify_many(listings))
+        report(
+            f"aclassify_many (cap {concurrency})",
+            results,
+            classifier,
+            model,
+            time.perf_counter() - start,
+        )
+
+    # with a deadline shorter than the work, retries stop in time and the rest of the listings fail fast
+    budget = args.latency * 3
+    classifier, model = make_classifier(args, max(args.concurrency))
+    start = time.perf_counter()
+    results = asyncio.run(
+        classifier.aclassify_many(listings, deadline=time.monotonic() + budget)
+    )
+    report(
+        f"deadline {budget:.1f}s",
+        results,
+        classifier,
+        model,
+        time.perf_counter() - start,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare input/output tokens and wall-clock time per listing when `BikeClassifier.classify_batch` packs K listings into
+each LLM request, against a stub chat model with simulated latency and prompt caching. Also checks that batched
+verdicts match per-listing ones, and that malformed batch responses fall back to per-listing calls.
+
+Prompt caching only kicks in once the tool schema + system prompt reach the model's minimum cacheable length, which
+our current few-shot prompt is close to; pass `--min-cacheable-tokens 0` to see its effect regardless.
+
+Usage: python benchmarks/bench_llm_batching.py --listings 60 --latency 0.5 --batch-sizes 1 2 5 10
+"""
+
+import argparse
+import time
+
+from eval_prefilter import load_corpus
+from fake_llm import FakeChatModel
+from standin import FIXTURES_DIR
+
+from llm_classifier import BikeClassifier
+
+
+def make_listings(n: int) -> list:
+    corpus = [
+        listing for listing, _ in load_corpus(FIXTURES_DIR / "recorded_verdicts.jsonl")
+    ]
+    return [
+        corpus[i % len(corpus)].model_copy(
+            update={
+                "url": f"https://sfbay.craigslist.org/bik/d/{7_900_000_000 + i}.html"
+            }
+        )
+        for i in range(n)
+    ]
+
+
+def run(listings: list, batch_size: int, args, malformed_rate: float = 0.0):
+    model = FakeChatModel(
+        latency_seconds=args.latency,
+        seconds_per_output_token=args.seconds_per_token,
+        malformed_rate=malformed_rate,
+        min_cacheable_tokens=args.min_cacheable_tokens,
+    )
+    classifier = BikeClassifier(api_key="unused", chat_model=model)
+
+    start = time.perf_counter()
+    results = classifier.classify_batch(listings, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return results, classifier.usage, model.stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--seconds-per-token", type=float, default=0.01)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument("--malformed-rate", type=float, default=0.3)
+    parser.add_argument(
+        "--min-cacheable-tokens",
+        type=int,
+        default=1024,
+        help="Shortest prompt prefix the model will cache",
+    )
+    args = parser.parse_args()
+
+    listings = make_listings(args.listings)
+    baseline = None
+
+    print(
+        f"{'K':>3} {'requests':>9} {'input tok/listing':>18} {'uncached tok/listing':>21} "
+        f"{'output tok/listing':>19} {'ms/listing':>11}"
+    )
+    for batch_size in args.batch_sizes:
+        results, usage, _, elapsed = run(listings, batch_size, args)
+        verdicts = [classification for _, classification in results]
+        baseline = baseline or verdicts
+        assert (
+            verdicts == baseline
+        ), f"K={batch_size} verdicts differ from K={args.batch_sizes[0]}"
+
+        uncached = usage.input_tokens - usage.cache_read_tokens
+        print(
+            f"{batch_size:>3} {usage.requests:>9} {usage.input_tokens / len(listings):>18.0f} "
+            f"{uncached / len(listings):>21.0f} {usage.output_tokens / len(listings):>19.0f} "
+            f"{elapsed / len(listings) * 1000:>11.0f}"
+        )
+
+    # drop a listing from some batch responses: those listings must be retried one by one
+    batch_size = max(args.batch_sizes)
+    results, usage, stats, _ = run(listings, batch_size, args, args.malformed_rate)
+    assert [classification for _, classification in results] == baseline
+    print(
+        f"\nK={batch_size} with {stats.malformed_responses} malformed batch responses: {usage.requests} requests, "
+        f"verdicts unchanged"
+    )
+
+
+if __name__ == "__main__":
+    main()
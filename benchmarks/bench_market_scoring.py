@@ -0,0 +1,197 @@
+"""
+Market-value scoring: how fast prices are read from the archive and listings scored against them, and what scoring
+buys a run with more new listings than LLM budget. A run's listings - a few of them deals, priced well under their
+model's usual price - go through the staged pipeline against a local stand-in and a stub LLM, classified in arrival
+order or best score first, with and without a budget on LLM classifications.
+
+The price history and the run's listings are generated from a seed, on top of a saved Trek listing page.
+
+Usage: python benchmarks/bench_market_scoring.py --history 50000 --listings 200 --budget 50 --llm-latency 1.0
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from fake_llm import FakeChatModel
+from standin import StandInServer, load_listing_fixtures
+
+from archive import ListingArchive
+from llm_classifier import BikeClassifier
+from models import BikeClassification, BikeListingData
+from pipeline import ListingPipeline, percentile
+from pricing import MarketValueScorer
+from scraper import ListingFetcher
+
+# model -> median asking price
+MODELS = {
+    "Emonda SL5": 1_800,
+    "Emonda SL6": 2_600,
+    "Emonda ALR": 1_100,
+    "Domane AL2": 700,
+    "Domane SL5": 2_000,
+    "Madone SLR": 6_500,
+    "Checkpoint ALR": 1_500,
+    "FX 3": 650,
+}
+TEMPLATE_PRICE = "$1,200"
+TEMPLATE_MODEL = "Emonda SL5"
+DEAL_DISCOUNT = 0.5
+
+
+def asking_price(rng: random.Random, model: str) -> int:
+    return max(20, round(MODELS[model] * rng.lognormvariate(0, 0.25), -1))
+
+
+def build_history(archive: ListingArchive, rows: int, rng: random.Random) -> None:
+    now = time.time()
+    classification = BikeClassification(
+        is_good=False, reason="Archived", confidence="high"
+    )
+    for i in range(rows):
+        model = rng.choice(list(MODELS))
+        listing = BikeListingData(
+            title=f"Trek {model}",
+            price=f"${asking_price(rng, model):,}",
+            manufacturer="Trek",
+            model=model,
+            body="",
+            url=f"https://sfbay.craigslist.org/bik/{i}.html",
+        )
+        archive.append(
+            listing, classification, archived_at=now - 90 * 86400 * (1 - i / rows)
+        )
+        # about one segment per run's worth of listings, like the archive sees in production
+        if i % 500 == 499:
+            archive.flush()
+    archive.flush()
+    archive.compact()
+
+
+def make_run(listings: int, deal_rate: float, rng: random.Random):
+    """(model, price, is_deal) for each of a run's new listings"""
+    run = []
+    for _ in range(listings):
+        model = rng.choice(list(MODELS))
+        is_deal = rng.random() < deal_rate
+        price = (
+            round(MODELS[model] * DEAL_DISCOUNT, -1)
+            if is_deal
+            else asking_price(rng, model)
+        )
+        run.append((model, price, is_deal))
+    return run
+
+
+def run_pipeline(args, server, run, scorer, budget):
+    urls = [f"{server.base_url}/bik/{i}.html" for i in range(len(run))]
+    deal_urls = {url for url, (_, _, is_deal) in zip(urls, run) if is_deal}
+    classified_at = {}
+    lock = threading.Lock()
+
+    def on_classified(listing, classification):
+        with lock:
+            classified_at[listing.url] = time.monotonic()
+
+    def notify(listing, reason, on_sent=None) -> bool:
+        if on_sent:
+            on_sent()
+        return True
+
+    pipeline = ListingPipeline(
+        ListingFetcher(requests_per_second=1000, burst=50),
+        BikeClassifier(
+            api_key="unused",
+            chat_model=FakeChatModel(latency_seconds=args.llm_latency),
+        ),
+        notify,
+        fetch_workers=8,
+        classify_concurrency=args.llm_concurrency,
+        on_classified=on_classified,
+        score=scorer.score if scorer else None,
+        max_classifications=budget,
+    )
+    seen_at = time.monotonic()
+    stats = pipeline.run(urls, seen_at=seen_at)
+    deal_latencies = [
+        classified_at[url] - seen_at for url in deal_urls if url in classified_at
+    ]
+    return stats, len(classified_at), deal_latencies, len(deal_urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--history", type=int, default=50_000)
+    parser.add_argument("--listings", type=int, default=200)
+    parser.add_argument("--deal-rate", type=float, default=0.1)
+    parser.add_argument("--budget", type=int, default=50)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--llm-concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ListingArchive(Path(tmp) / "archive")
+        build_history(archive, args.history, rng)
+        start = time.perf_counter()
+        scorer = MarketValueScorer.from_archive(archive)
+        build_seconds = time.perf_counter() - start
+
+    run = make_run(args.listings, args.deal_rate, rng)
+    listings = [
+        BikeListingData(
+            title="",
+            price=f"${price:,}",
+            manufacturer="Trek",
+            model=model,
+            body="",
+            url="",
+        )
+        for model, price, _ in run
+    ]
+    start = time.perf_counter()
+    for _ in range(10):
+        scorer.score_many(listings)
+    score_seconds = (time.perf_counter() - start) / (10 * len(listings))
+    print(
+        f"Read {scorer.samples} archived prices in {build_seconds:.3f}s "
+        f"({scorer.samples / build_seconds:,.0f} rows/s), scored listings at {score_seconds * 1e6:.1f}us each\n"
+    )
+
+    print(
+        f"{'':<30} {'classified':>11} {'deals':>8} {'deal p50':>9} {'deal max':>9} {'elapsed':>8}"
+    )
+    page = load_listing_fixtures()["trek_emonda_105"]
+
+    def route(path: str):
+        model, price, _ = run[int(path.rsplit("/", 1)[-1].removesuffix(".html"))]
+        html = page.replace(TEMPLATE_PRICE, f"${price:,}").replace(
+            TEMPLATE_MODEL, model
+        )
+        return 200, {"Content-Type": "text/html"}, html.encode()
+
+    with StandInServer(route, latency_seconds=args.page_latency) as server:
+        for label, use_scorer, budget in [
+            ("arrival order", False, None),
+            ("best score first", True, None),
+            (f"arrival order, budget {args.budget}", False, args.budget),
+            (f"best score first, budget {args.budget}", True, args.budget),
+        ]:
+            stats, classified, deal_latencies, deals = run_pipeline(
+                args, server, run, scorer if use_scorer else None, budget
+            )
+            print(
+                f"{label:<30} {classified:>11} {len(deal_latencies):>4}/{deals:<3} "
+                f"{percentile(deal_latencies, 50):>8.1f}s {max(deal_latencies, default=0):>8.1f}s "
+                f"{stats.elapsed_seconds:>7.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
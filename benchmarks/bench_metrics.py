@@ -0,0 +1,109 @@
+"""
+Measure the overhead of our metrics layer: the cost of a single counter increment, histogram observation and timer,
+enabled and disabled, and the end-to-end cost on a staged pipeline run against the stand-in. Prints the resulting
+JSON summary and a sample of the Prometheus output.
+
+Usage: python benchmarks/bench_metrics.py --listings 60
+"""
+
+import argparse
+import logging
+import time
+import timeit
+
+from fake_llm import FakeChatModel
+from standin import StandInServer, load_listing_fixtures
+
+from llm_classifier import BikeClassifier
+from metrics import MetricsRegistry, get_metrics
+from pipeline import ListingPipeline
+from scraper import ListingFetcher
+
+N_CALLS = 200_000
+
+
+def per_call_ns(stmt) -> float:
+    return min(timeit.repeat(stmt, number=N_CALLS, repeat=3)) / N_CALLS * 1e9
+
+
+def micro() -> None:
+    print(f"{'':<24} {'enabled':>10} {'disabled':>10}")
+    for label, make_stmt in [
+        ("counter inc", lambda m: lambda: m.inc("llm_requests_total", outcome="ok")),
+        (
+            "histogram observe",
+            lambda m: lambda: m.observe("pipeline_stage_seconds", 0.01, stage="fetch"),
+        ),
+        ("timer", lambda m: lambda: m.timer("classify_seconds").__enter__()),
+    ]:
+        enabled, disabled = MetricsRegistry(), MetricsRegistry(enabled=False)
+        if label == "timer":
+            # time the whole with-block, not just entering it
+            def timed(m):
+                def stmt():
+                    with m.timer("classify_seconds"):
+                        pass
+
+                return stmt
+
+            make_stmt = timed
+        print(
+            f"{label:<24} {per_call_ns(make_stmt(enabled)):>8.0f}ns "
+            f"{per_call_ns(make_stmt(disabled)):>8.0f}ns"
+        )
+
+
+def run_pipeline(args, base_url: str, enabled: bool) -> float:
+    metrics = get_metrics()
+    metrics.enabled = enabled
+    metrics.reset()
+    classifier = BikeClassifier(
+        api_key="unused", chat_model=FakeChatModel(latency_seconds=args.llm_latency)
+    )
+    fetcher = ListingFetcher(requests_per_second=200, burst=16)
+    pipeline = ListingPipeline(fetcher, classifier, lambda *a, **kw: True)
+    urls = [f"{base_url}/bik/{i}.html" for i in range(args.listings)]
+    start = time.perf_counter()
+    pipeline.run(urls)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=60)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    micro()
+
+    pages = list(load_listing_fixtures().values())
+
+    def route(path: str):
+        listing_id = int(path.rsplit("/", 1)[-1].removesuffix(".html"))
+        return (
+            200,
+            {"Content-Type": "text/html"},
+            pages[listing_id % len(pages)].encode(),
+        )
+
+    with StandInServer(route) as server:
+        # alternate, so drift in the machine's load doesn't favor either side
+        timings = {True: [], False: []}
+        for _ in range(args.repeat):
+            for enabled in (False, True):
+                timings[enabled].append(run_pipeline(args, server.base_url, enabled))
+    off, on = min(timings[False]), min(timings[True])
+    print(
+        f"\npipeline, {args.listings} listings: {off:.3f}s without metrics, {on:.3f}s with "
+        f"({(on - off) / off:+.1%})"
+    )
+
+    metrics = get_metrics()
+    print(f"\n{metrics.to_json()[:600]}...")
+    print("\n" + "\n".join(metrics.to_prometheus().splitlines()[:12]))
+
+
+if __name__ == "__main__":
+    main()
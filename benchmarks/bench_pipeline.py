@@ -0,0 +1,104 @@
+"""
+End-to-end benchmark of the staged listing pipeline against the old one-listing-at-a-time loop, with the listing pages
+served by a local stand-in, a stub LLM and a stub notifier, all with injected latency. Reports time to the first alert
+and p50/p95 "posting seen -> alert sent" latency.
+
+Usage: python benchmarks/bench_pipeline.py --listings 60 --page-latency 0.2 --llm-latency 1.0 --notify-latency 0.3
+"""
+
+import argparse
+import logging
+import time
+
+from fake_llm import FakeChatModel
+from standin import StandInServer, load_listing_fixtures
+
+from llm_classifier import BikeClassifier
+from pipeline import ListingPipeline, percentile
+from scraper import ListingFetcher, fetch_and_parse_listing
+
+
+def run_sequential(urls, classifier, notify) -> list:
+    """The old run_pipeline loop: fetch, parse, classify and notify each listing before moving on to the next"""
+    start = time.monotonic()
+    latencies = []
+    for url in urls:
+        listing = fetch_and_parse_listing(url)
+        if not listing:
+            continue
+        classification = classifier.classify(listing)
+        if classification.is_good and classification.confidence == "high":
+            notify(listing, classification.reason)
+            latencies.append(time.monotonic() - start)
+    return latencies
+
+
+def report(label: str, latencies: list, elapsed: float) -> None:
+    first = min(latencies, default=0.0)
+    print(
+        f"{label:<12} {elapsed:>8.2f}s {len(latencies):>7} {first:>12.2f}s "
+        f"{percentile(latencies, 50):>8.2f}s {percentile(latencies, 95):>8.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=60)
+    parser.add_argument("--page-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--notify-latency", type=float, default=0.3)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    pages = list(load_listing_fixtures().values())
+
+    def route(path: str):
+        listing_id = int(path.rsplit("/", 1)[-1].removesuffix(".html"))
+        return (
+            200,
+            {"Content-Type": "text/html"},
+            pages[listing_id % len(pages)].encode(),
+        )
+
+    def notify(listing, reason, on_sent=None) -> bool:
+        time.sleep(args.notify_latency)
+        if on_sent:
+            on_sent()
+        return True
+
+    def make_classifier():
+        return BikeClassifier(
+            api_key="unused",
+            chat_model=FakeChatModel(latency_seconds=args.llm_latency),
+        )
+
+    print(
+        f"{'':<12} {'elapsed':>9} {'alerts':>7} {'first alert':>13} {'p50':>9} {'p95':>9}"
+    )
+    with StandInServer(route, latency_seconds=args.page_latency) as server:
+        urls = [f"{server.base_url}/bik/{i}.html" for i in range(args.listings)]
+
+        if not args.skip_sequential:
+            start = time.monotonic()
+            latencies = run_sequential(urls, make_classifier(), notify)
+            report("sequential", latencies, time.monotonic() - start)
+
+        fetcher = ListingFetcher(
+            requests_per_second=20, burst=4, backoff_base_seconds=0.1
+        )
+        pipeline = ListingPipeline(fetcher, make_classifier(), notify)
+        stats = pipeline.run(urls)
+        report("staged", stats.alert_latencies, stats.elapsed_seconds)
+
+    print()
+    for stage, stage_stats in stats.stages.items():
+        print(
+            f"{stage:<9} {stage_stats.processed:>4} processed by {stage_stats.workers} workers, "
+            f"{stage_stats.busy_seconds:>6.2f}s busy, queue depth mean={stage_stats.mean_queue_depth:.1f} "
+            f"max={stage_stats.max_queue_depth}"
+        )
+
+
+if __name__ == "__main__":
+    main()
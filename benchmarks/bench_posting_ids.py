@@ -0,0 +1,80 @@
+"""
+Microbenchmark `PostingIdSet` against the original set-based snapshot diff at 10k, 100k and 1M posting IDs.
+
+Each scenario simulates two consecutive SAPI snapshots: 1% of the oldest listings expire, 1% of the rest are deleted
+at random, and 1% new listings with higher IDs are posted.
+
+Usage: python benchmarks/bench_posting_ids.py
+"""
+
+import json
+import random
+import time
+
+import standin  # noqa: F401 - puts `src/` on the path
+
+from posting_ids import PostingIdSet
+
+MIN_POSTING_ID = 7_800_000_000
+
+
+def make_snapshots(n: int, rng: random.Random):
+    """Build SAPI-style `items` arrays for a previous and current snapshot of roughly `n` listings"""
+    prev = sorted(rng.sample(range(50 * n), n))
+    deleted = set(rng.sample(prev, n // 100))
+    posted = sorted(rng.sample(range(50 * n, 51 * n), n // 100))
+    curr = [i for i in prev[n // 100 :] if i not in deleted] + posted
+
+    return to_items(prev), to_items(curr)
+
+
+def to_items(ids):
+    # real items carry ~10 extra columns we never look at
+    return [[i, 12345, "title", 1, 2, 3] for i in ids]
+
+
+def set_based_diff(prev_items, curr_items):
+    """The diff `get_new_listing_urls` used to do"""
+    old_ids = {item[0] for item in prev_items}
+    new_items = [item for item in curr_items if item[0] not in old_ids]
+    return [MIN_POSTING_ID + item[0] for item in new_items]
+
+
+def timed(fn, *args, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    rng = random.Random(0)
+    print(
+        f"{'ids':>9} | {'set diff':>9} | {'build':>9} | {'diff':>9} | {'json size':>10} | {'compact size':>12}"
+    )
+
+    for n in (10_000, 100_000, 1_000_000):
+        prev_items, curr_items = make_snapshots(n, rng)
+        expected, set_seconds = timed(set_based_diff, prev_items, curr_items)
+
+        prev, build_seconds = timed(
+            PostingIdSet.from_offsets, MIN_POSTING_ID, [i[0] for i in prev_items]
+        )
+        curr = PostingIdSet.from_offsets(MIN_POSTING_ID, [i[0] for i in curr_items])
+        diff, diff_seconds = timed(curr.diff, prev)
+        assert list(diff.added) == expected
+
+        serialized = prev.to_bytes()
+        assert PostingIdSet.from_bytes(serialized) == prev
+        json_size = len(json.dumps(list(prev)))
+
+        print(
+            f"{n:>9,} | {set_seconds * 1000:>7.1f}ms | {build_seconds * 1000:>7.1f}ms | "
+            f"{diff_seconds * 1000:>7.1f}ms | {json_size / 1024:>8.0f}KB | {len(serialized) / 1024:>10.1f}KB"
+        )
+
+
+if __name__ == "__main__":
+    main()
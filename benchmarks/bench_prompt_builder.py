@@ -0,0 +1,126 @@
+"""
+Compare the prompt builder's listings against the prompts it replaced, which sent every field (`Unknown` if missing)
+and the first 500 characters of the description. Reports tokens per listing and how often verdicts agree with the
+old prompts' verdicts on the listings as recorded, and with the recorded LLM verdicts, classifying against a stub LLM
+that judges by keywords.
+
+Runs on the recorded corpus as is, and on copies with each description buried in a few sentences of the usual
+Craigslist chatter (moving sale, pickup, payment), so the groupset line falls past the old 500 character cut - once
+with the original titles, and once with titles that only give the brand, so the verdict rests on the description.
+
+Usage: python benchmarks/bench_prompt_builder.py --budgets 50 100 150
+"""
+
+import argparse
+import random
+
+from eval_prefilter import load_corpus
+from fake_llm import FakeChatModel, count_tokens
+from standin import FIXTURES_DIR
+
+from llm_classifier import BikeClassifier
+from models import BikeListingData
+from prompt_builder import PromptBuilder
+
+CHATTER = [
+    "Moving out of state at the end of the month and need this gone, so it's priced to sell quickly.",
+    "I've had it for a few years and put a lot of happy miles on it with my Sunday group ride up the coast.",
+    "It has been stored indoors in the garage the whole time and was never left out in the rain.",
+    "Pickup only near the Mission, I can't deliver or ship, sorry.",
+    "Cash or Venmo only, no trades, no holds and no payment plans please.",
+    "If the ad is up it's still available, no need to ask.",
+    "Serious buyers only, lowballers will be ignored.",
+    "Happy to answer any questions by text, I usually reply within a few hours.",
+    "My partner says it's time to clear out the garage, so everything has to go.",
+    "Feel free to come take it for a spin around the block before buying.",
+]
+
+
+class TruncatingPromptBuilder(PromptBuilder):
+    """The listing format used before the prompt builder"""
+
+    def format_listing(self, listing: BikeListingData) -> str:
+        return f"""Title: "{listing.title}"
+Price: {listing.price or "Not listed"}
+Bicycle Type: {listing.bicycle_type or "Unknown"}
+Frame Size: {listing.frame_size or "Not specified"}
+Frame Material: {listing.frame_material or "Unknown"}
+Wheel Size: {listing.wheel_size or "Unknown"}
+Manufacturer: {listing.manufacturer or "Unknown"}
+Model: {listing.model or "Unknown"}
+Condition: {listing.condition or "Not specified"}
+Description: {listing.body[:500]}{"..." if len(listing.body) > 500 else ""}"""
+
+
+def bury(
+    listing: BikeListingData, rng: random.Random, plain_title: bool = False
+) -> BikeListingData:
+    chatter = rng.sample(CHATTER, 7)
+    update = {"body": " ".join(chatter[:6] + [listing.body] + chatter[6:])}
+    if plain_title:
+        # many titles say little more than the brand, leaving the description to say what the bike is
+        update["title"] = f"{listing.manufacturer or 'Nice'} bike for sale"
+    return listing.model_copy(update=update)
+
+
+def classify(listings, builder: PromptBuilder, batch_size: int):
+    classifier = BikeClassifier(
+        api_key="unused",
+        chat_model=FakeChatModel(),
+        batch_size=batch_size,
+        prompt_builder=builder,
+    )
+    results = classifier.classify_batch(listings)
+    listing_tokens = sum(
+        count_tokens(builder.format_listing(listing)) for listing in listings
+    )
+    return [classification for _, classification in results], listing_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[50, 100, 150])
+    parser.add_argument("--batch-size", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(FIXTURES_DIR / "recorded_verdicts.jsonl")
+    recorded = [verdict for _, verdict in corpus]
+    rng = random.Random(0)
+    corpora = {
+        "recorded": [listing for listing, _ in corpus],
+        "buried": [bury(listing, rng) for listing, _ in corpus],
+        "buried, plain title": [
+            bury(listing, rng, plain_title=True) for listing, _ in corpus
+        ],
+    }
+
+    print(
+        f"{'corpus':<20} {'prompt':<18} {'tok/listing':>12} {'vs old prompt':>14} {'vs recorded':>12}"
+    )
+    # verdicts from the old prompts on the listings as recorded, before any burying
+    baseline, _ = classify(
+        corpora["recorded"], TruncatingPromptBuilder(), args.batch_size
+    )
+    for name, listings in corpora.items():
+        builders = [("old, body[:500]", TruncatingPromptBuilder())] + [
+            (f"budget {budget} tokens", PromptBuilder(max_description_tokens=budget))
+            for budget in args.budgets
+        ]
+        for label, builder in builders:
+            verdicts, listing_tokens = classify(listings, builder, args.batch_size)
+            vs_old = sum(
+                verdict.is_good == old.is_good
+                for verdict, old in zip(verdicts, baseline)
+            )
+            vs_recorded = sum(
+                verdict.is_good == truth.is_good
+                for verdict, truth in zip(verdicts, recorded)
+            )
+            print(
+                f"{name:<20} {label:<18} {listing_tokens / len(listings):>12.0f} "
+                f"{vs_old:>10}/{len(listings):<3} {vs_recorded:>8}/{len(listings):<3}"
+            )
+
+
+if __name__ == "__main__":
+    main()
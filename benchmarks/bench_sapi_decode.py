@@ -0,0 +1,68 @@
+"""
+Compare peak memory and parse time of the streaming SAPI decoder against `response.json()` on the whole payload.
+
+Usage: python benchmarks/bench_sapi_decode.py
+"""
+
+import json
+import random
+import time
+import tracemalloc
+
+from standin import make_sapi_payload
+
+from sapi_stream import decode_snapshot_stream
+
+CHUNK_BYTES = 64 * 1024
+
+
+def json_path(payload: bytes):
+    data = json.loads(payload)["data"]
+    return data["decode"]["minPostingId"], [item[0] for item in data["items"]]
+
+
+def streaming_path(payload: bytes):
+    view = memoryview(payload)
+    chunks = (
+        bytes(view[i : i + CHUNK_BYTES]) for i in range(0, len(payload), CHUNK_BYTES)
+    )
+    return decode_snapshot_stream(chunks)
+
+
+def measure(fn, payload: bytes):
+    """Returns (result, seconds, peak bytes allocated on top of the raw payload)"""
+    start = time.perf_counter()
+    fn(payload)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = fn(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    rng = random.Random(0)
+    print(
+        f"{'items':>8} | {'payload':>8} | {'json time':>9} | {'json peak':>9} | {'stream time':>11} | {'stream peak':>11}"
+    )
+
+    for n in (1_000, 10_000, 100_000):
+        posting_ids = rng.sample(range(7_800_000_000, 7_800_000_000 + 50 * n), n)
+        payload = make_sapi_payload(posting_ids)
+
+        (json_base, json_offsets), json_seconds, json_peak = measure(json_path, payload)
+        (stream_base, stream_offsets), stream_seconds, stream_peak = measure(
+            streaming_path, payload
+        )
+        assert (json_base, json_offsets) == (stream_base, list(stream_offsets))
+
+        print(
+            f"{n:>8,} | {len(payload) / 2**20:>6.1f}MB | {json_seconds * 1000:>7.1f}ms | "
+            f"{json_peak / 2**20:>7.1f}MB | {stream_seconds * 1000:>9.1f}ms | {stream_peak / 2**20:>9.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
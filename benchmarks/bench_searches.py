@@ -0,0 +1,128 @@
+"""
+Compare checking several searches one after another against the concurrent fan-out in
+`get_new_listing_urls_for_searches`, with SAPI served by a local stand-in with injected latency. The searches overlap,
+so it also shows how many new listings are deduplicated across searches before scraping.
+
+Usage: python benchmarks/bench_searches.py --searches 4 --latency 0.5 --new-listings 40 --overlap 0.3
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from standin import StandInServer, make_sapi_payload
+
+import change_data_capture
+from cdc_state import SQLiteStateStore
+from change_data_capture import get_new_listing_urls_for_searches
+from models import SearchProfile
+
+# the config is loaded on first use, so give it placeholder credentials - nothing is called here
+for name in [
+    "ANTHROPIC_API_KEY",
+    "TWILIO_ACCOUNT_SID",
+    "TWILIO_AUTH_TOKEN",
+    "TWILIO_MESSAGING_SERVICE_SID",
+    "TWILIO_TO_NUMBER",
+]:
+    os.environ.setdefault(name, "unused")
+
+FIRST_POSTING_ID = 7_800_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--searches", type=int, default=4)
+    parser.add_argument("--active-listings", type=int, default=2_000)
+    parser.add_argument("--new-listings", type=int, default=40)
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.3,
+        help="Fraction of each search's new listings also found by the next search",
+    )
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rng = random.Random(0)
+    profiles = [
+        SearchProfile(
+            name=f"search-{i}",
+            search_path=f"area-{i}/bia",
+            lat=37.7 + i / 10,
+            lon=-122.4,
+            distance_miles=15,
+            url_base="https://sfbay.craigslist.org/bik/",
+        )
+        for i in range(args.searches)
+    ]
+    next_id = FIRST_POSTING_ID
+    active = {}
+    for profile in profiles:
+        active[profile.search_path] = list(
+            range(next_id, next_id + args.active_listings)
+        )
+        next_id += args.active_listings
+
+    def route(path: str):
+        search_path = parse_qs(urlsplit(path).query)["searchPath"][0]
+        return (
+            200,
+            {"Content-Type": "application/json"},
+            make_sapi_payload(active[search_path]),
+        )
+
+    with StandInServer(
+        route, latency_seconds=args.latency
+    ) as server, tempfile.TemporaryDirectory() as tmp:
+        change_data_capture.SAPI_SEARCH_URL = f"{server.base_url}/search/full"
+        searches = [
+            (profile, SQLiteStateStore(Path(tmp) / "cdc.sqlite3", key=profile.name))
+            for profile in profiles
+        ]
+
+        # first run bootstraps every search's CDC state
+        _, results = get_new_listing_urls_for_searches(searches, n_minutes=15)
+        for result, (_, state_store) in zip(results, searches):
+            state_store.save(result.snapshot)
+
+        # then new listings come in, some of them within the radius of the next search too
+        for i, profile in enumerate(profiles):
+            new_ids = list(range(next_id, next_id + args.new_listings))
+            next_id += args.new_listings
+            active[profile.search_path] += new_ids
+            neighbour = profiles[(i + 1) % len(profiles)]
+            if neighbour is not profile:
+                shared = rng.sample(new_ids, int(len(new_ids) * args.overlap))
+                active[neighbour.search_path] += shared
+
+        print(f"{'':<12} {'elapsed':>8} {'found':>6} {'unique':>7} {'duplicates':>11}")
+        for label, max_workers in [("sequential", 1), ("concurrent", len(profiles))]:
+            start = time.perf_counter()
+            new_urls, results = get_new_listing_urls_for_searches(
+                searches, n_minutes=15, max_workers=max_workers
+            )
+            elapsed = time.perf_counter() - start
+            found = sum(len(result.new_urls) for result in results)
+            duplicates = sum(result.duplicate_count for result in results)
+            print(
+                f"{label:<12} {elapsed:>7.2f}s {found:>6} {len(new_urls):>7} {duplicates:>11}"
+            )
+
+    print()
+    for result in results:
+        print(
+            f"{result.profile.name:<10} {len(result.snapshot.posting_ids):>6} active, "
+            f"{len(result.new_urls):>4} new, {result.duplicate_count:>3} duplicates, "
+            f"{result.elapsed_seconds:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
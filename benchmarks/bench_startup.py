@@ -0,0 +1,161 @@
+"""
+Cold start report for the cloud function entry point: an `-X importtime` breakdown of `import main` by top-level
+package, then the latency of the first run of a fresh process against a warm one, on a run that finds no new listings
+(the common case, where cold start dominates). SAPI is served by a local stand-in, so nothing leaves the machine.
+
+Each cold start is a fresh interpreter, sharing a CDC state database bootstrapped beforehand, so every measured run is
+an ordinary "nothing new since last time" check.
+
+Usage: python benchmarks/bench_startup.py --repeat 5 --sapi-latency 0.1
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from standin import BENCHMARKS_DIR, StandInServer, make_sapi_payload
+
+SRC_DIR = BENCHMARKS_DIR.parent / "src"
+FIRST_POSTING_ID = 7_800_000_000
+# SDKs that a run with no new listings shouldn't need to import
+HEAVY_PACKAGES = ["langchain_core", "langchain_anthropic", "anthropic", "twilio", "bs4"]
+
+
+def child_env(tmp: Path) -> dict:
+    return {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "unused",
+        "TWILIO_ACCOUNT_SID": "unused",
+        "TWILIO_AUTH_TOKEN": "unused",
+        "TWILIO_MESSAGING_SERVICE_SID": "unused",
+        "TWILIO_TO_NUMBER": "unused",
+        "CDC_STATE_PATH": str(tmp / "cdc.sqlite3"),
+        "METRICS_ENABLED": "false",
+    }
+
+
+def import_breakdown(env: dict, top: int) -> None:
+    """Print where the time goes in `import main`, summing each module's own import time into its top-level package"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=SRC_DIR,
+        env=env,
+        check=True,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stderr
+    by_package = collections.Counter()
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us)
+        if name.strip() == "main":
+            total_us = int(cumulative_us)
+
+    print(f"`import main`: {total_us / 1000:.0f}ms\n")
+    print(f"{'package':<24} {'ms':>8} {'share':>6}")
+    for package, self_us in by_package.most_common(top):
+        print(
+            f"{package:<24} {self_us / 1000:>8.1f} {self_us / max(total_us, 1):>6.0%}"
+        )
+
+
+def run_child(args) -> None:
+    """In a fresh process: time `import main`, then a cold and a few warm runs, reporting on the last line of stdout"""
+    start = time.perf_counter()
+    import change_data_capture
+    import main
+
+    import_seconds = time.perf_counter() - start
+    logging.getLogger().setLevel(logging.WARNING)
+    change_data_capture.SAPI_SEARCH_URL = args.sapi_url
+    run_seconds = []
+    for _ in range(1 + args.warm_runs):
+        start = time.perf_counter()
+        main.run_pipeline()
+        run_seconds.append(time.perf_counter() - start)
+
+    result = {
+        "import_seconds": import_seconds,
+        "first_run_seconds": run_seconds[0],
+        "warm_run_seconds": statistics.median(run_seconds[1:]),
+        "heavy_imported": [p for p in HEAVY_PACKAGES if p in sys.modules],
+    }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warm-runs", type=int, default=3)
+    parser.add_argument("--active-listings", type=int, default=2_000)
+    parser.add_argument("--sapi-latency", type=float, default=0.1)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--sapi-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    posting_ids = list(range(FIRST_POSTING_ID, FIRST_POSTING_ID + args.active_listings))
+    payload = make_sapi_payload(posting_ids)
+
+    def route(path: str):
+        return 200, {"Content-Type": "application/json"}, payload
+
+    with StandInServer(
+        route, latency_seconds=args.sapi_latency
+    ) as server, tempfile.TemporaryDirectory() as tmp:
+        env = child_env(Path(tmp))
+        import_breakdown(env, args.top)
+
+        command = [
+            sys.executable,
+            __file__,
+            "--child",
+            "--sapi-url",
+            f"{server.base_url}/search/full",
+            "--warm-runs",
+            str(args.warm_runs),
+        ]
+
+        def cold_start() -> dict:
+            stdout = subprocess.run(
+                command, env=env, check=True, stdout=subprocess.PIPE, text=True
+            ).stdout
+            return json.loads(stdout.strip().splitlines()[-1])
+
+        # bootstrap the CDC state, so every measured run has a previous snapshot to diff against
+        cold_start()
+        results = [cold_start() for _ in range(args.repeat)]
+
+    def median(field: str) -> float:
+        return statistics.median(result[field] for result in results) * 1000
+
+    print(
+        f"\nRuns with no new listings, median of {args.repeat} fresh processes "
+        f"(SAPI latency {args.sapi_latency * 1000:.0f}ms):"
+    )
+    print(f"  import main         {median('import_seconds'):>8.0f}ms")
+    print(f"  first run           {median('first_run_seconds'):>8.0f}ms")
+    print(f"  warm run            {median('warm_run_seconds'):>8.0f}ms")
+    print(
+        f"  first request total {median('import_seconds') + median('first_run_seconds'):>8.0f}ms"
+    )
+    print(f"  heavy SDKs imported {results[-1]['heavy_imported'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
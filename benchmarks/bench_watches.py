@@ -0,0 +1,176 @@
+"""
+What checking listings against several watch profiles costs: N watches run as N separate single-watch passes over the
+same listings, like N separate deployments, against one pass that checks every listing against all N watches at
+once. Both apply each watch's pre-checks first; the single pass then sends each listing once, with the watches it's
+still a candidate for, against a stub chat model with simulated latency and prompt caching.
+
+Usage: python benchmarks/bench_watches.py --listings 60 --latency 0.5 --watches 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import time
+
+from bench_llm_batching import make_listings
+from fake_llm import FakeChatModel
+
+from llm_classifier import BikeClassifier
+from models import WatchProfile
+from watches import WatchSet
+
+WATCHES = [
+    WatchProfile(
+        name="road-105",
+        criteria="Road bike with Shimano 105 or better, or SRAM Rival or better, in good condition",
+        to_numbers=["+15550000001"],
+        bicycle_types=["road"],
+        max_price=2500,
+    ),
+    WatchProfile(
+        name="big-road",
+        criteria="Road bike with a 58cm or bigger frame, any groupset from 105 up, ready to ride",
+        to_numbers=["+15550000002"],
+        bicycle_types=["road"],
+        min_frame_size_cm=57,
+    ),
+    WatchProfile(
+        name="small-road",
+        criteria="Road bike with a 50-53cm frame for a shorter rider, 105 or better, carbon or aluminium",
+        to_numbers=["+15550000003"],
+        bicycle_types=["road"],
+        max_frame_size_cm=53,
+    ),
+    WatchProfile(
+        name="budget-road",
+        criteria="Cheap but sound road bike for commuting, any groupset, no major repairs needed",
+        to_numbers=["+15550000001"],
+        bicycle_types=["road"],
+        max_price=700,
+    ),
+    WatchProfile(
+        name="carbon",
+        criteria="Carbon road frame with Ultegra, Dura-Ace, Force or Red, priced well under retail",
+        to_numbers=["+15550000004"],
+        bicycle_types=["road"],
+        min_price=1000,
+        exclude=[r"\baluminum\b", r"\bsteel\b"],
+    ),
+    WatchProfile(
+        name="mtb",
+        criteria="Full suspension mountain bike with a 2015 or newer frame and a dropper post",
+        to_numbers=["+15550000005"],
+        bicycle_types=["mountain"],
+    ),
+    WatchProfile(
+        name="e-bike",
+        criteria="Commuter e-bike from a known brand (Bosch, Shimano or Yamaha motor), with its charger",
+        to_numbers=["+15550000002"],
+        bicycle_types=["electric", "e-?bike"],
+        max_price=2000,
+    ),
+    WatchProfile(
+        name="any-road",
+        criteria="Any ride-ready road bike with 105 or better, whatever the size, for resale",
+        to_numbers=["+15550000006"],
+        bicycle_types=["road"],
+    ),
+]
+
+
+def run(listings: list, watches: list, args):
+    """Check the listings against the watches in one pass, returning the verdicts, LLM usage and elapsed seconds"""
+    model = FakeChatModel(
+        latency_seconds=args.latency,
+        seconds_per_output_token=args.seconds_per_token,
+        min_cacheable_tokens=args.min_cacheable_tokens,
+    )
+    classifier = BikeClassifier(
+        api_key="unused", chat_model=model, batch_size=args.batch_size
+    )
+    watch_set = WatchSet(watches)
+
+    start = time.perf_counter()
+    candidates = [watch_set.candidates(listing) for listing in listings]
+    verdicts = asyncio.run(
+        classifier.aclassify_watches(listings, candidates, watch_set.watches)
+    )
+    elapsed = time.perf_counter() - start
+    return verdicts, classifier.usage, elapsed
+
+
+def print_row(
+    n, label, requests, input_tokens, uncached, output_tokens, verdicts, secs
+):
+    print(
+        f"{n:>7} {label:<9} {requests:>9} {input_tokens:>10} {uncached:>13} "
+        f"{output_tokens:>11} {verdicts:>9} {secs:>7.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--listings", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--seconds-per-token", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--watches", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--min-cacheable-tokens",
+        type=int,
+        default=1024,
+        help="Shortest prompt prefix the model will cache",
+    )
+    args = parser.parse_args()
+
+    listings = make_listings(args.listings)
+    print(
+        f"{'watches':>7} {'pass':<9} {'requests':>9} {'input tok':>10} {'uncached tok':>13} "
+        f"{'output tok':>11} {'verdicts':>9} {'elapsed':>8}"
+    )
+    for n in args.watches:
+        watches = WATCHES[:n]
+        rows = []
+
+        # N separate passes, one watch each
+        separate = [run(listings, [watch], args) for watch in watches]
+        rows.append(
+            (
+                "separate",
+                sum(usage.requests for _, usage, _ in separate),
+                sum(usage.input_tokens for _, usage, _ in separate),
+                sum(
+                    usage.input_tokens - usage.cache_read_tokens
+                    for _, usage, _ in separate
+                ),
+                sum(usage.output_tokens for _, usage, _ in separate),
+                sum(
+                    len(listing_verdicts)
+                    for verdicts, _, _ in separate
+                    for listing_verdicts in verdicts
+                ),
+                sum(elapsed for _, _, elapsed in separate),
+            )
+        )
+
+        # one pass checking every watch
+        verdicts, usage, elapsed = run(listings, watches, args)
+        rows.append(
+            (
+                "combined",
+                usage.requests,
+                usage.input_tokens,
+                usage.input_tokens - usage.cache_read_tokens,
+                usage.output_tokens,
+                sum(len(listing_verdicts) for listing_verdicts in verdicts),
+                elapsed,
+            )
+        )
+        # both ways must ask for the same verdicts
+        assert rows[0][5] == rows[1][5], f"{n} watches: verdict counts differ"
+
+        for label, *values in rows:
+            print_row(n, label, *values)
+
+
+if __name__ == "__main__":
+    main()
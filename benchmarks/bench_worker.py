@@ -0,0 +1,181 @@
+"""
+Run the long-running worker against a local stand-in whose posting rate changes over time - a busy spell, a quiet
+spell, then busy again - with a stub LLM and a fake Twilio API. Compares adaptive polling against polling at a fixed
+interval with the same number of SAPI requests, on how long new listings wait before we pick them up.
+
+The posting history is generated from a seed, compressed into a few minutes so the whole thing runs quickly.
+
+Usage: python benchmarks/bench_worker.py --busy-rate 1 --quiet-rate 0.05 --busy-seconds 30 --quiet-seconds 90
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from fake_llm import FakeChatModel
+from standin import StandInServer, load_listing_fixtures, make_sapi_payload
+
+from config import Config
+from container import AppContainer, build_classifier
+import change_data_capture
+from worker import build_worker
+
+FIRST_POSTING_ID = 7_800_000_000
+ACCOUNT_SID = "AC" + "0" * 32
+
+
+def make_arrivals(phases, seed: int = 0):
+    """Offsets in seconds at which postings arrive, as a Poisson process with a rate per (duration, rate) phase"""
+    rng = random.Random(seed)
+    arrivals = []
+    phase_start = 0.0
+    for duration, rate in phases:
+        t = phase_start
+        while rate > 0:
+            t += rng.expovariate(rate)
+            if t >= phase_start + duration:
+                break
+            arrivals.append(t)
+        phase_start += duration
+    return arrivals
+
+
+def run(args, label: str, arrivals, min_interval: float, max_interval: float, jitter):
+    pages = list(load_listing_fixtures().values())
+    base = list(range(FIRST_POSTING_ID, FIRST_POSTING_ID + args.active_listings))
+    new_ids = [base[-1] + 1 + i for i in range(len(arrivals))]
+    started_at = time.time() + 1
+    picked_up_at = {}
+    sapi_requests = 0
+    lock = threading.Lock()
+
+    def route(path: str):
+        nonlocal sapi_requests
+        url = urlsplit(path)
+        if url.path.startswith("/bik/"):
+            posting_id = int(url.path.rsplit("/", 1)[-1].removesuffix(".html"))
+            with lock:
+                picked_up_at.setdefault(posting_id, time.time())
+            return (
+                200,
+                {"Content-Type": "text/html"},
+                pages[posting_id % len(pages)].encode(),
+            )
+        if url.path.endswith("/Messages.json"):
+            body = {"sid": "SM" + "0" * 32, "status": "queued"}
+            return 201, {"Content-Type": "application/json"}, json.dumps(body).encode()
+
+        with lock:
+            sapi_requests += 1
+        until = int(parse_qs(url.query)["batch"][0].split("-")[1])
+        visible = [
+            posting_id
+            for posting_id, offset in zip(new_ids, arrivals)
+            if started_at + offset <= until
+        ]
+        return (
+            200,
+            {"Content-Type": "application/json"},
+            make_sapi_payload(base + visible),
+        )
+
+    with StandInServer(
+        route, latency_seconds=args.latency
+    ) as server, tempfile.TemporaryDirectory() as tmp:
+        change_data_capture.SAPI_SEARCH_URL = f"{server.base_url}/search/full"
+        config = Config(
+            anthropic_api_key="unused",
+            twilio_account_sid=ACCOUNT_SID,
+            twilio_auth_token="unused",
+            twilio_messaging_service_sid="unused",
+            twilio_to_number="+15555550100",
+            twilio_api_base_url=server.base_url,
+            search_url_base=f"{server.base_url}/bik/",
+            cdc_state_path=Path(tmp) / "cdc.sqlite3",
+            alert_sent_path=Path(tmp) / "alerts.sqlite3",
+            archive_path=Path(tmp) / "archive",
+            listing_index_path=Path(tmp) / "listing_index.sqlite",
+            classification_cache_enabled=False,
+            fetch_requests_per_second=1000,
+            fetch_burst=50,
+            metrics_enabled=False,
+            worker_min_interval_seconds=min_interval,
+            worker_max_interval_seconds=max_interval,
+            worker_interval_jitter=jitter,
+            worker_sapi_requests_per_hour=args.budget_per_hour,
+        )
+        container = AppContainer(config, cache_state=True)
+        container.classifier = build_classifier(
+            config, chat_model=FakeChatModel(latency_seconds=args.llm_latency)
+        )
+        worker = build_worker(container)
+        worker.scheduler.rng = random.Random(0)
+
+        duration = sum(phase for phase, _ in phases(args))
+        timer = threading.Timer(1 + duration, worker.stop)
+        timer.start()
+        stats = worker.run()
+        timer.cancel()
+
+    waits = [
+        picked_up_at[posting_id] - (started_at + offset)
+        for posting_id, offset in zip(new_ids, arrivals)
+        if posting_id in picked_up_at
+    ]
+    print(
+        f"{label:<10} {stats.polls:>6} {sapi_requests:>6} {len(waits):>4}/{len(arrivals):<4} "
+        f"{statistics.median(waits):>8.1f}s {max(waits):>8.1f}s "
+        f"{min(stats.intervals):>6.1f}s/{statistics.median(stats.intervals):.1f}s/{max(stats.intervals):.1f}s"
+    )
+    return stats
+
+
+def phases(args):
+    return [
+        (args.busy_seconds, args.busy_rate),
+        (args.quiet_seconds, args.quiet_rate),
+        (args.busy_seconds, args.busy_rate),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--busy-rate", type=float, default=1.0, help="Postings/s")
+    parser.add_argument("--quiet-rate", type=float, default=0.05, help="Postings/s")
+    parser.add_argument("--busy-seconds", type=float, default=30)
+    parser.add_argument("--quiet-seconds", type=float, default=90)
+    parser.add_argument("--min-interval", type=float, default=1.0)
+    parser.add_argument("--max-interval", type=float, default=10.0)
+    parser.add_argument("--budget-per-hour", type=int, default=3600)
+    parser.add_argument("--active-listings", type=int, default=2_000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # importing `main` set up INFO logging, quiet it down
+    logging.getLogger().setLevel(logging.CRITICAL)
+    arrivals = make_arrivals(phases(args))
+    duration = sum(phase for phase, _ in phases(args))
+    print(
+        f"{len(arrivals)} postings over {duration:.0f}s: busy, quiet, then busy again\n"
+    )
+    print(
+        f"{'':<10} {'polls':>6} {'SAPI':>6} {'found':>9} {'p50 wait':>9} {'max wait':>9} {'interval min/p50/max':>22}"
+    )
+    adaptive = run(
+        args, "adaptive", arrivals, args.min_interval, args.max_interval, jitter=0.2
+    )
+    # the same number of polls, evenly spaced
+    fixed_interval = duration / adaptive.polls
+    run(args, "fixed", arrivals, fixed_interval, fixed_interval, jitter=0.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Evaluate the rule-based pre-filter offline against a corpus of listings with recorded LLM verdicts, reporting how many
+LLM calls it saves and how often it disagrees with the LLM. A false reject (a listing the pre-filter rejects but the
+LLM called good) is a missed alert, so precision should stay at 100%.
+
+Each corpus line is a JSON object `{"listing": <BikeListingData>, "verdict": <BikeClassification>}`.
+
+Usage: python benchmarks/eval_prefilter.py [--corpus path/to/verdicts.jsonl] [--rules path/to/rules.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from standin import FIXTURES_DIR
+
+from models import BikeClassification, BikeListingData
+from prefilter import PreFilter
+
+
+def load_corpus(path) -> list:
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                corpus.append(
+                    (
+                        BikeListingData.model_validate(record["listing"]),
+                        BikeClassification.model_validate(record["verdict"]),
+                    )
+                )
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=FIXTURES_DIR / "recorded_verdicts.jsonl")
+    parser.add_argument("--rules", default=None, help="JSON rules file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    prefilter = PreFilter.from_file(args.rules) if args.rules else PreFilter()
+
+    start = time.perf_counter()
+    rejections = [prefilter.check(listing) for listing, _ in corpus]
+    elapsed = time.perf_counter() - start
+
+    llm_rejects = sum(not verdict.is_good for _, verdict in corpus)
+    true_rejects = false_rejects = 0
+    for (listing, verdict), rejection in zip(corpus, rejections):
+        if rejection is None:
+            continue
+        if verdict.is_good:
+            false_rejects += 1
+            print(f"FALSE REJECT  {listing.title!r}: {rejection.reason}")
+        else:
+            true_rejects += 1
+
+    rejected = true_rejects + false_rejects
+    precision = true_rejects / rejected if rejected else 1.0
+    recall = true_rejects / llm_rejects if llm_rejects else 1.0
+
+    print(f"\n{len(corpus)} listings, {llm_rejects} rejected by the LLM")
+    print(f"pre-filter rejected {rejected}: {prefilter.stats.rejected_by_rule}")
+    print(f"precision: {precision:.1%} ({false_rejects} good bikes wrongly rejected)")
+    print(f"recall:    {recall:.1%} of LLM rejects caught")
+    print(f"LLM calls saved: {rejected}/{len(corpus)} ({rejected / len(corpus):.0%})")
+    print(f"pre-filter time: {elapsed / len(corpus) * 1e6:.0f}us/listing")
+
+    if false_rejects:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Stub chat model standing in for Claude in our benchmarks. Answers structured output requests from keyword rules,
+with simulated latency, token usage and prompt caching, and can inject malformed responses and rate limit errors.
+"""
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import anthropic
+import httpx
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+
+import standin  # noqa: F401 - makes our src/ modules importable
+from models import (
+    BatchClassification,
+    BikeClassification,
+    ListingClassification,
+    WatchBatchClassification,
+    WatchClassification,
+)
+
+# rough chars per token for English text, good enough to compare prompt shapes
+CHARS_PER_TOKEN = 4
+
+# Anthropic doesn't cache prompt prefixes shorter than this many tokens (Sonnet), and expires them after 5 minutes
+MIN_CACHEABLE_TOKENS = 1024
+CACHE_TTL_SECONDS = 300
+
+_BIKE = re.compile(r"^Bike \d+:\nURL: (\S+)\n", re.MULTILINE)
+_WATCHES = re.compile(r"^Watches: (.*)$", re.MULTILINE)
+_GOOD = re.compile(r"\b105\b|ultegra|dura-?ace|\brival\b|\bforce\b|sram red", re.I)
+_BAD = re.compile(
+    r"hybrid|cruiser|e-?bike|electric|mountain|\bkids?\b|sora|claris|tiagra|vintage|19[789]\d|downtube",
+    re.I,
+)
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def judge(listing_text: str) -> BikeClassification:
+    """Keyword verdict on a listing, roughly following the classifier's system prompt"""
+    if _BAD.search(listing_text):
+        return BikeClassification(
+            is_good=False, reason="Wrong type or low-end components", confidence="high"
+        )
+    if _GOOD.search(listing_text):
+        return BikeClassification(
+            is_good=True, reason="Road bike with 105+ components", confidence="high"
+        )
+    return BikeClassification(
+        is_good=False, reason="No component details", confidence="medium"
+    )
+
+
+@dataclass
+class FakeLLMStats:
+    requests: int = 0
+    malformed_responses: int = 0
+    rate_limited: int = 0
+    max_in_flight: int = 0
+
+
+class FakeChatModel:
+    """
+    Duck-typed stand-in for a langchain chat model, supporting `with_structured_output(...).invoke(messages)` and
+    `.ainvoke(messages)` for the BikeClassification, BatchClassification and WatchBatchClassification schemas.
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        seconds_per_output_token: float = 0.0,
+        malformed_rate: float = 0.0,
+        min_cacheable_tokens: int = MIN_CACHEABLE_TOKENS,
+        rate_limit_rate: float = 0.0,
+        max_concurrent_requests: Optional[int] = None,
+        retry_after_seconds: Optional[float] = None,
+        seed: int = 0,
+    ):
+        """
+        :param latency_seconds: Fixed latency of every request, e.g. time to first token
+        :param seconds_per_output_token: Latency per generated token
+        :param malformed_rate: Fraction of batch responses that drop one of the listings
+        :param min_cacheable_tokens: Min length of a prompt prefix for its cache breakpoint to take effect
+        :param rate_limit_rate: Fraction of requests that fail with a 429
+        :param max_concurrent_requests: Requests arriving while this many are in flight fail with a 429, like an API
+            enforcing a concurrency limit
+        :param retry_after_seconds: `retry-after` header sent with 429s
+        :param seed: Seed for the malformed response / rate limit RNG
+        """
+        self.latency_seconds = latency_seconds
+        self.seconds_per_output_token = seconds_per_output_token
+        self.malformed_rate = malformed_rate
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.max_concurrent_requests = max_concurrent_requests
+        self.retry_after_seconds = retry_after_seconds
+        self.stats = FakeLLMStats()
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # cached prompt prefix -> expiry time
+        self._prompt_cache = {}
+        self._in_flight = 0
+
+    def with_structured_output(self, schema, include_raw: bool = False):
+        return _FakeStructuredModel(self, schema, include_raw)
+
+    def _cache_lookup(self, prefix: str) -> str:
+        """Return whether a cacheable prefix was a cache 'read' or 'creation', refreshing its TTL either way"""
+        now = time.monotonic()
+        with self._lock:
+            hit = self._prompt_cache.get(prefix, 0) > now
+            self._prompt_cache[prefix] = now + CACHE_TTL_SECONDS
+        return "cache_read" if hit else "cache_creation"
+
+    def _start_request(self) -> None:
+        """Count a request as in flight, raising a 429 if it's rate limited"""
+        with self._lock:
+            self.stats.requests += 1
+            over_capacity = (
+                self.max_concurrent_requests is not None
+                and self._in_flight >= self.max_concurrent_requests
+            )
+            if over_capacity or self._rng.random() < self.rate_limit_rate:
+                self.stats.rate_limited += 1
+                headers = {}
+                if self.retry_after_seconds is not None:
+                    headers["retry-after"] = str(self.retry_after_seconds)
+                response = httpx.Response(
+                    429,
+                    headers=headers,
+                    request=httpx.Request(
+                        "POST", "https://api.anthropic.com/v1/messages"
+                    ),
+                )
+                raise anthropic.RateLimitError(
+                    "Number of concurrent connections has exceeded your rate limit",
+                    response=response,
+                    body=None,
+                )
+            self._in_flight += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, self._in_flight)
+
+    def _end_request(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def invoke(self, schema, messages: List[BaseMessage]) -> dict:
+        self._start_request()
+        try:
+            response, delay = self.respond(schema, messages)
+            time.sleep(delay)
+            return response
+        finally:
+            self._end_request()
+
+    async def ainvoke(self, schema, messages: List[BaseMessage]) -> dict:
+        self._start_request()
+        try:
+            response, delay = self.respond(schema, messages)
+            await asyncio.sleep(delay)
+            return response
+        finally:
+            self._end_request()
+
+    def respond(self, schema, messages: List[BaseMessage]):
+        """Build the response to a request, returning it along with how long it should take"""
+        system_text, cacheable = "", False
+        user_text = ""
+        for message in messages:
+            if isinstance(message, SystemMessage):
+                blocks = message.content
+                if isinstance(blocks, str):
+                    blocks = [{"type": "text", "text": blocks}]
+                system_text = "".join(block["text"] for block in blocks)
+                cacheable = any("cache_control" in block for block in blocks)
+            else:
+                user_text += message.content
+
+        # the structured output tool definition is part of the prompt prefix too
+        prefix_tokens = count_tokens(
+            json.dumps(schema.model_json_schema()) + system_text
+        )
+        input_tokens = prefix_tokens + count_tokens(user_text)
+        details = {"cache_read": 0, "cache_creation": 0}
+        if cacheable and prefix_tokens >= self.min_cacheable_tokens:
+            details[self._cache_lookup(schema.__name__ + system_text)] = prefix_tokens
+
+        with self._lock:
+            malformed = self._rng.random() < self.malformed_rate
+
+        if schema is BatchClassification:
+            bikes = _BIKE.split(user_text)[1:]  # [url, text, url, text, ...]
+            results = [
+                ListingClassification(url=url, **judge(text).model_dump())
+                for url, text in zip(bikes[::2], bikes[1::2])
+            ]
+            if malformed and results:
+                with self._lock:
+                    self.stats.malformed_responses += 1
+                results.pop(self._rng.randrange(len(results)))
+            parsed = BatchClassification(classifications=results)
+        elif schema is WatchBatchClassification:
+            # every watch gets the keyword verdict - enough to compare the cost of prompt shapes
+            bikes = _BIKE.split(user_text)[1:]
+            results = [
+                WatchClassification(url=url, watch=watch, **judge(text).model_dump())
+                for url, text in zip(bikes[::2], bikes[1::2])
+                for watch in _WATCHES.search(text).group(1).split(", ")
+            ]
+            if malformed and results:
+                with self._lock:
+                    self.stats.malformed_responses += 1
+                results.pop(self._rng.randrange(len(results)))
+            parsed = WatchBatchClassification(classifications=results)
+        else:
+            parsed = judge(user_text)
+
+        output_tokens = count_tokens(parsed.model_dump_json())
+        delay = self.latency_seconds + output_tokens * self.seconds_per_output_token
+
+        raw = AIMessage(
+            content="",
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": details,
+            },
+        )
+        return {"raw": raw, "parsed": parsed, "parsing_error": None}, delay
+
+
+class _FakeStructuredModel:
+    def __init__(self, model: FakeChatModel, schema, include_raw: bool):
+        self.model = model
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def invoke(self, messages: List[BaseMessage]):
+        result = self.model.invoke(self.schema, messages)
+        return result if self.include_raw else result["parsed"]
+
+    async def ainvoke(self, messages: List[BaseMessage]):
+        result = await self.model.ainvoke(self.schema, messages)
+        return result if self.include_raw else result["parsed"]
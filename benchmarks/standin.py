@@ -0,0 +1,226 @@
+"""
+Local HTTP stand-in for Craigslist, used by our benchmarks to exercise the pipeline without hitting the real site.
+Serves canned responses with injected latency and failures.
+"""
+
+import gzip
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+FIXTURES_DIR = BENCHMARKS_DIR / "fixtures"
+
+# make our flat `src/` modules importable the same way they are inside the cloud function
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+# (status code, headers, body)
+CannedResponse = Tuple[int, Dict[str, str], bytes]
+
+
+@dataclass
+class StandInStats:
+    """Counts of what the stand-in server has seen, so benchmarks can assert on client behavior"""
+
+    requests: int = 0
+    connections: int = 0
+    injected_failures: int = 0
+    not_modified: int = 0
+    bytes_sent: int = 0
+    status_counts: Dict[int, int] = field(default_factory=dict)
+    # (path, body) of every POST request
+    posted: List[Tuple[str, bytes]] = field(default_factory=list)
+
+
+class StandInServer:
+    """
+    Threaded local HTTP server that routes GET and POST requests to a handler function. Usable as a context manager, which
+    starts the server on a free port on localhost and shuts it down on exit.
+    """
+
+    def __init__(
+        self,
+        route: Callable[[str], CannedResponse],
+        latency_seconds: float = 0.0,
+        latency_jitter_seconds: float = 0.0,
+        failure_rate: float = 0.0,
+        failure_status: int = 429,
+        seed: Optional[int] = 0,
+        compress: bool = False,
+        etags: bool = False,
+    ):
+        """
+        :param route: Function mapping a request path (including query string) to a canned response
+        :param latency_seconds: Latency injected before every response
+        :param latency_jitter_seconds: Uniform random jitter added on top of `latency_seconds`
+        :param failure_rate: Fraction of requests that fail with `failure_status` instead of being routed
+        :param failure_status: Status code returned for injected failures
+        :param seed: Seed for the latency/failure RNG, so benchmark runs are repeatable
+        :param compress: Gzip response bodies for clients that accept it
+        :param etags: Send ETags, and answer matching If-None-Match requests with a 304
+        """
+        self.route = route
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.compress = compress
+        self.etags = etags
+        self.stats = StandInStats()
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        with self._lock:
+            self.stats.requests += 1
+            delay = self.latency_seconds + self._rng.uniform(
+                0, self.latency_jitter_seconds
+            )
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.stats.injected_failures += 1
+
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            status, headers, body = self.failure_status, {}, b"injected failure"
+        else:
+            status, headers, body = self.route(handler.path)
+
+        headers = dict(headers)
+        if self.etags and status == 200:
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            headers["ETag"] = etag
+            if handler.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+        if (
+            self.compress
+            and body
+            and "gzip" in handler.headers.get("Accept-Encoding", "")
+        ):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        with self._lock:
+            self.stats.status_counts[status] = (
+                self.stats.status_counts.get(status, 0) + 1
+            )
+            self.stats.not_modified += status == 304
+            self.stats.bytes_sent += len(body)
+
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def __enter__(self) -> "StandInServer":
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, so clients that pool connections can actually reuse them. Headers and body go out in
+            # separate writes, so disable Nagle to avoid stalling on delayed ACKs over a reused connection
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with standin._lock:
+                    standin.stats.connections += 1
+
+            def do_GET(self):
+                standin._handle(self)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with standin._lock:
+                    standin.stats.posted.append((self.path, body))
+                standin._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def load_listing_fixtures() -> Dict[str, str]:
+    """Load the saved Craigslist listing pages, keyed by fixture name"""
+    return {
+        path.stem: path.read_text(encoding="utf-8")
+        for path in sorted((FIXTURES_DIR / "listings").glob("*.html"))
+    }
+
+
+def make_sapi_payload(
+    posting_ids: List[int], posted_at: int = 1_760_000_000, seed: int = 0
+) -> bytes:
+    """
+    Build a SAPI `search/full` response body shaped like Craigslist's, with a row per posting ID.
+
+    :param posting_ids: Absolute posting IDs of the active listings
+    :param posted_at: Base posting timestamp for the rows
+    :param seed: Seed for the RNG filling in the row columns
+    :return: JSON response body
+    """
+    rng = random.Random(seed)
+    min_posting_id = min(posting_ids, default=0)
+    titles = ["Trek Emonda SL5 - Shimano 105", "Specialized Allez", "Kids bike 20in"]
+
+    items = []
+    for posting_id in sorted(posting_ids):
+        title = rng.choice(titles)
+        price = rng.randrange(50, 4000)
+        items.append(
+            [
+                posting_id - min_posting_id,
+                rng.randrange(0, 86_400),
+                f"5:1~{37.7 + rng.random() / 10:.4f}~{-122.4 - rng.random() / 10:.4f}",
+                price,
+                title,
+                [4, f"3:00k0k_{rng.getrandbits(40):x}_0CI0t2"],
+                [6, title.lower().replace(" ", "-")],
+                [10, f"${price:,}"],
+                [13, 1],
+            ]
+        )
+
+    payload = {
+        "data": {
+            "decode": {
+                "locationDescriptions": ["san francisco", "oakland", "berkeley"],
+                "locations": [[1, "sfbay", "sfc"], [1, "sfbay", "eby"]],
+                "maxPostingId": max(posting_ids, default=0),
+                "minPostedDate": posted_at,
+                "minPostingId": min_posting_id,
+            },
+            "items": items,
+            "totalResultCount": len(items),
+        },
+        "errors": [],
+    }
+    return json.dumps(payload).encode()
@@ -0,0 +1,514 @@
+"""
+Append-only columnar archive of every listing we classify - its parsed attributes, price and verdict - so history can
+be analyzed without re-scraping or loading it all into pydantic objects.
+
+Each run's listings are written as one segment file with a chunk per column, sorted by archive time:
+    magic | column chunks, 8-byte aligned | JSON footer | footer length (uint64)
+Numeric columns are raw arrays that are memory-mapped and read without copying, so scanning a column only touches
+that column's bytes. String columns are an int64 offset array, a UTF-8 blob and a null byte per row. The footer holds
+every chunk's position and the segment's time range, so time-range reads skip segments outside the range and bisect
+within the rest. Small per-run segments are merged into larger ones by a background compaction.
+"""
+
+import bisect
+import fcntl
+import json
+import logging
+import mmap
+import struct
+import sys
+import threading
+import time
+import uuid
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+from models import BikeClassification, BikeListingData
+from pricing import parse_frame_size_cm, parse_price, parse_wheel_size_mm
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"CLARCHV1"
+SEGMENT_SUFFIX = ".col"
+_FOOTER_LENGTH = struct.Struct("<Q")
+
+# column name -> type: "f8" (float64, NaN for missing), "i8" (int64), "u1" (uint8) or "str" (nullable UTF-8)
+SCHEMA = {
+    "archived_at": "f8",  # Unix epoch timestamp the listing was classified at
+    "posting_id": "i8",
+    "url": "str",
+    "title": "str",
+    "price": "f8",  # parsed from the listing's price text, e.g. `$1,250` -> 1250.0
+    "bicycle_type": "str",
+    "wheel_size": "str",
+    "wheel_size_mm": "f8",  # ISO bead seat diameter, e.g. `700C` -> 622.0
+    "frame_size": "str",
+    "frame_size_cm": "f8",  # e.g. `21"` -> 53.3
+    "frame_material": "str",
+    "manufacturer": "str",
+    "model": "str",
+    "condition": "str",
+    "body": "str",
+    "is_good": "u1",
+    "confidence": "str",
+    "reason": "str",
+}
+_ARRAY_TYPECODES = {"f8": "d", "i8": "q", "u1": "B"}
+
+
+def _posting_id(url: str) -> int:
+    try:
+        return int(url.rsplit("/", 1)[-1].removesuffix(".html"))
+    except ValueError:
+        return 0
+
+
+def _row(
+    listing: BikeListingData, classification: BikeClassification, archived_at: float
+) -> dict:
+    def number(value: Optional[float]) -> float:
+        return value if value is not None else float("nan")
+
+    return {
+        "archived_at": archived_at,
+        "posting_id": _posting_id(listing.url),
+        "url": listing.url,
+        "title": listing.title,
+        "price": number(parse_price(listing.price)),
+        "bicycle_type": listing.bicycle_type,
+        "wheel_size": listing.wheel_size,
+        "wheel_size_mm": number(parse_wheel_size_mm(listing.wheel_size)),
+        "frame_size": listing.frame_size,
+        "frame_size_cm": number(parse_frame_size_cm(listing.frame_size)),
+        "frame_material": listing.frame_material,
+        "manufacturer": listing.manufacturer,
+        "model": listing.model,
+        "condition": listing.condition,
+        "body": listing.body,
+        "is_good": int(classification.is_good),
+        "confidence": classification.confidence,
+        "reason": classification.reason,
+    }
+
+
+class StringColumn(Sequence):
+    """A string column chunk, decoding values only as they're read"""
+
+    def __init__(self, offsets: memoryview, blob: memoryview, nulls: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+        self._nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self._nulls)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            # offsets are into the whole blob, so a slice just narrows down the offsets and nulls
+            return StringColumn(
+                self._offsets[start : stop + 1], self._blob, self._nulls[start:stop]
+            )
+        if i < 0:
+            i += len(self)
+        if self._nulls[i]:
+            return None
+        return str(self._blob[self._offsets[i] : self._offsets[i + 1]], "utf-8")
+
+
+Column = Union[memoryview, StringColumn]
+
+
+def _write_segment(path: Path, columns: Dict[str, list]) -> None:
+    """Write columns of equal length, already sorted by `archived_at`, as a segment file"""
+    n_rows = len(columns["archived_at"])
+    chunks: List[bytes] = []
+    position = len(MAGIC)
+    footer = {
+        "rows": n_rows,
+        "byteorder": sys.byteorder,
+        "min_archived_at": columns["archived_at"][0],
+        "max_archived_at": columns["archived_at"][-1],
+        "columns": {},
+    }
+
+    def add_chunk(data: bytes) -> List[int]:
+        nonlocal position
+        padding = -position % 8
+        chunks.append(b"\0" * padding + data)
+        position += padding
+        location = [position, len(data)]
+        position += len(data)
+        return location
+
+    for name, kind in SCHEMA.items():
+        values = columns[name]
+        if kind == "str":
+            encoded = [value.encode() if value is not None else b"" for value in values]
+            offsets = array("q", [0])
+            for value in encoded:
+                offsets.append(offsets[-1] + len(value))
+            footer["columns"][name] = {
+                "type": kind,
+                "offsets": add_chunk(offsets.tobytes()),
+                "blob": add_chunk(b"".join(encoded)),
+                "nulls": add_chunk(bytes(value is None for value in values)),
+            }
+        else:
+            data = array(_ARRAY_TYPECODES[kind], values).tobytes()
+            footer["columns"][name] = {"type": kind, "data": add_chunk(data)}
+
+    footer_bytes = json.dumps(footer, separators=(",", ":")).encode()
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        for chunk in chunks:
+            f.write(chunk)
+        f.write(footer_bytes)
+        f.write(_FOOTER_LENGTH.pack(len(footer_bytes)))
+    tmp.replace(path)
+
+
+def _missing_column(kind: str, rows: int) -> Column:
+    """A column of `rows` missing values: NaN, 0 or None depending on its type"""
+    if kind == "str":
+        return StringColumn(
+            memoryview(array("q", [0] * (rows + 1))),
+            memoryview(b""),
+            memoryview(b"\1" * rows),
+        )
+    missing = float("nan") if kind == "f8" else 0
+    return memoryview(array(_ARRAY_TYPECODES[kind], [missing] * rows))
+
+
+class Segment:
+    """A memory-mapped segment file"""
+
+    def __init__(self, path: Path):
+        """
+        :param path: Path to the segment file
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if self._view[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not an archive segment: {self.path}")
+        (footer_length,) = _FOOTER_LENGTH.unpack(self._view[-_FOOTER_LENGTH.size :])
+        footer_end = len(self._view) - _FOOTER_LENGTH.size
+        self.footer = json.loads(
+            bytes(self._view[footer_end - footer_length : footer_end])
+        )
+        self.rows: int = self.footer["rows"]
+        self.min_archived_at: float = self.footer["min_archived_at"]
+        self.max_archived_at: float = self.footer["max_archived_at"]
+
+    def _chunk(self, location: List[int], typecode: Optional[str] = None) -> memoryview:
+        start, length = location
+        chunk = self._view[start : start + length]
+        if typecode is None:
+            return chunk
+        if self.footer["byteorder"] != sys.byteorder:
+            swapped = array(typecode, chunk)
+            swapped.byteswap()
+            return memoryview(swapped)
+        return chunk.cast(typecode)
+
+    def column(self, name: str) -> Column:
+        """
+        :param name: Column name, from `SCHEMA`
+        :return: The column, as a zero-copy memoryview for numeric columns or a lazily decoded StringColumn
+        """
+        meta = self.footer["columns"].get(name)
+        if meta is None:
+            # a column added to the schema after this segment was written
+            return _missing_column(SCHEMA[name], self.rows)
+        if meta["type"] == "str":
+            return StringColumn(
+                self._chunk(meta["offsets"], "q"),
+                self._chunk(meta["blob"]),
+                self._chunk(meta["nulls"], "B"),
+            )
+        return self._chunk(meta["data"], _ARRAY_TYPECODES[meta["type"]])
+
+    def row_range(self, start: Optional[float], end: Optional[float]) -> range:
+        """
+        :param start: Earliest archive time to include
+        :param end: Archive time to stop before
+        :return: Range of the rows archived in [start, end)
+        """
+        archived_at = self.column("archived_at")
+        first = bisect.bisect_left(archived_at, start) if start is not None else 0
+        last = bisect.bisect_left(archived_at, end) if end is not None else self.rows
+        return range(first, last)
+
+    def close(self) -> None:
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # a column is still in use, the file is unmapped once it's garbage collected instead
+            pass
+
+
+@dataclass
+class ArchiveStats:
+    rows_appended: int = 0
+    segments_written: int = 0
+    segments_compacted: int = 0
+
+
+class ListingArchive:
+    """
+    Directory of segment files. Rows appended during a run are buffered in memory and written as one segment by
+    `flush`. Safe to append to from several threads, and to compact from several processes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        compact_min_segments: int = 8,
+        target_segment_rows: int = 50_000,
+    ):
+        """
+        :param path: Directory to keep the archive in, created if it doesn't exist
+        :param compact_min_segments: Number of small segments it takes to trigger a compaction
+        :param target_segment_rows: Number of rows compaction aims for per segment. Segments at least this big are
+            left alone
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.compact_min_segments = compact_min_segments
+        self.target_segment_rows = target_segment_rows
+        self.stats = ArchiveStats()
+        self._rows: List[dict] = []
+        self._lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+
+    def append(
+        self,
+        listing: BikeListingData,
+        classification: BikeClassification,
+        archived_at: Optional[float] = None,
+    ) -> None:
+        """
+        Buffer a classified listing, to be written by the next `flush`.
+
+        :param listing: Parsed listing
+        :param classification: Its verdict
+        :param archived_at: Unix epoch timestamp to archive it at, defaults to now
+        """
+        row = _row(listing, classification, archived_at or time.time())
+        with self._lock:
+            self._rows.append(row)
+            self.stats.rows_appended += 1
+
+    def flush(self) -> Optional[Path]:
+        """
+        Write the buffered rows as a new segment.
+
+        :return: Path of the segment written, or None if there was nothing to write
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return None
+        rows.sort(key=lambda row: row["archived_at"])
+        path = self._write({name: [row[name] for row in rows] for name in SCHEMA})
+        self.stats.segments_written += 1
+        log.info(f"Archived {len(rows)} listings to {path.name}")
+        return path
+
+    def _write(self, columns: Dict[str, list]) -> Path:
+        # named by start time, so listing the directory gives segments roughly in time order
+        path = self.path / (
+            f"{int(columns['archived_at'][0] * 1000)}-{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+        )
+        _write_segment(path, columns)
+        return path
+
+    def segment_paths(self) -> List[Path]:
+        return sorted(self.path.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def scan(
+        self,
+        columns: Sequence[str],
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Iterator[Dict[str, Column]]:
+        """
+        Read columns segment by segment, only for rows archived in [start, end). Segments entirely outside the range
+        aren't read beyond their footer.
+
+        :param columns: Names of the columns to read
+        :param start: Earliest archive time to include
+        :param end: Archive time to stop before
+        :return: Iterator of {column name: column chunk} per segment, in time order within each segment. Numeric
+            chunks are memoryviews into the mapped file
+        """
+        for path in self.segment_paths():
+            try:
+                segment = Segment(path)
+            except FileNotFoundError:
+                # compacted away since we listed the directory - its rows are in the compacted segment
+                continue
+            if (start is not None and segment.max_archived_at < start) or (
+                end is not None and segment.min_archived_at >= end
+            ):
+                segment.close()
+                continue
+            rows = segment.row_range(start, end)
+            if rows:
+                # the file stays mapped for as long as the caller holds on to its columns
+                yield {
+                    name: segment.column(name)[rows.start : rows.stop]
+                    for name in columns
+                }
+
+    def read(
+        self,
+        columns: Sequence[str],
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Dict[str, list]:
+        """
+        Read columns into lists, e.g. to build a pandas DataFrame.
+
+        :param columns: Names of the columns to read
+        :param start: Earliest archive time to include
+        :param end: Archive time to stop before
+        :return: {column name: list of values} over every matching row
+        """
+        result = {name: [] for name in columns}
+        for chunk in self.scan(columns, start, end):
+            for name, values in chunk.items():
+                result[name].extend(values)
+        return result
+
+    @contextmanager
+    def _compaction_lock(self) -> Iterator[bool]:
+        with open(self.path / ".compaction.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def compact(self) -> int:
+        """
+        Merge small segments into segments of up to `target_segment_rows`, once there are at least
+        `compact_min_segments` of them. Small segments are merged a group at a time, each group's rows adding up to at
+        most `target_segment_rows`, so that's all compaction holds in memory at once. Merged segments are written before
+        the small ones are deleted, so readers never miss rows, though a scan running across the swap may see some
+        twice.
+
+        :return: Number of segments merged away
+        """
+        with self._compaction_lock() as locked:
+            if not locked:
+                log.info("Archive compaction already running in another process")
+                return 0
+            small = []
+            for path in self.segment_paths():
+                segment = Segment(path)
+                if segment.rows < self.target_segment_rows:
+                    small.append(segment)
+                else:
+                    segment.close()
+            if len(small) < self.compact_min_segments:
+                for segment in small:
+                    segment.close()
+                return 0
+
+            # consecutive segments, in time order, of up to `target_segment_rows` rows between them
+            groups: List[List[Segment]] = [[]]
+            group_rows = 0
+            for segment in small:
+                if groups[-1] and group_rows + segment.rows > self.target_segment_rows:
+                    groups.append([])
+                    group_rows = 0
+                groups[-1].append(segment)
+                group_rows += segment.rows
+
+            merged = rows = 0
+            for group in groups:
+                if len(group) == 1:
+                    group[0].close()
+                    continue
+                rows += self._merge(group)
+                merged += len(group)
+
+        self.stats.segments_compacted += merged
+        log.info(f"Compacted {merged} archive segments ({rows} rows)")
+        return merged
+
+    def _merge(self, segments: List[Segment]) -> int:
+        """
+        Write segments' rows as one segment sorted by archive time, then delete them.
+
+        :param segments: Segments to merge, closed once read
+        :return: Number of rows merged
+        """
+        columns: Dict[str, list] = {name: [] for name in SCHEMA}
+        for segment in segments:
+            for name in SCHEMA:
+                columns[name].extend(segment.column(name))
+            segment.close()
+        order = sorted(
+            range(len(columns["archived_at"])), key=columns["archived_at"].__getitem__
+        )
+        self._write(
+            {name: [values[i] for i in order] for name, values in columns.items()}
+        )
+        for segment in segments:
+            segment.path.unlink()
+        return len(order)
+
+    def start_compaction(self) -> threading.Thread:
+        """
+        Compact in a background thread, unless a compaction started here is still running.
+
+        :return: The compaction thread
+        """
+        with self._lock:
+            if self._compaction is None or not self._compaction.is_alive():
+                self._compaction = threading.Thread(
+                    target=self._compact_logging_errors,
+                    name="archive-compaction",
+                    daemon=True,
+                )
+                self._compaction.start()
+            return self._compaction
+
+    def _compact_logging_errors(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            log.error(f"Archive compaction failed: {e}", exc_info=True)
+
+    def wait_for_compaction(self, timeout: Optional[float] = None) -> None:
+        """
+        :param timeout: Max number of seconds to wait for a running compaction to finish
+        """
+        if self._compaction is not None:
+            self._compaction.join(timeout)
+
+    def reset_stats(self) -> None:
+        """Start counting from zero, e.g. at the start of each run of a long-lived archive"""
+        self.stats = ArchiveStats()
+
+    def log_stats(self) -> None:
+        """Log what was archived this run"""
+        log.info(
+            f"Archive: {self.stats.rows_appended} listings appended in {self.stats.segments_written} segments, "
+            f"{self.stats.segments_compacted} segments compacted"
+        )
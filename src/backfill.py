@@ -0,0 +1,472 @@
+"""
+Backfill of listings posted in an arbitrary past time range, e.g. to catch up on runs that failed. The range is split
+into windows, each window's new listings are found by diffing the SAPI snapshots at its start and end, and they're run
+through the normal fetch -> parse -> classify -> notify pipeline. Finished windows are checkpointed, so an interrupted
+backfill picks up where it left off.
+
+Usage: python backfill.py --start 2026-10-14T00:00 --end 2026-10-16T00:00
+"""
+
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from change_data_capture import fetch_listing_snapshot, posting_id_from_url
+from config import Config, get_config
+from container import (
+    build_archive,
+    build_classifier,
+    build_fetcher,
+    build_listing_index,
+    build_market_scorer,
+    build_notifier,
+    build_watch_set,
+    log_classifier_stats,
+)
+from metrics import get_metrics
+from models import ListingSnapshot, SearchProfile
+from pipeline import ListingPipeline
+
+if TYPE_CHECKING:
+    from notifier import AlertDispatcher
+    from watches import WatchNotifier
+
+log = logging.getLogger(__name__)
+
+
+def split_windows(start: int, end: int, window_seconds: int) -> List[Tuple[int, int]]:
+    """
+    Split a time range into consecutive windows.
+
+    :param start: Unix epoch timestamp to start at
+    :param end: Unix epoch timestamp to end at
+    :param window_seconds: Length of each window. The last one is cut short at `end`
+    :return: (window start, window end) pairs covering the range
+    """
+    if window_seconds <= 0:
+        raise ValueError("window_seconds must be positive")
+    return [
+        (window_start, min(window_start + window_seconds, end))
+        for window_start in range(start, end, window_seconds)
+    ]
+
+
+class BackfillCheckpoint:
+    """
+    Records which windows of a backfill have been processed, and the posting IDs already run through the pipeline, in a
+    local SQLite database. Lets an interrupted backfill be resumed, and keeps a listing found in several windows or
+    searches (or by an earlier backfill over an overlapping range) from being classified twice.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Path to the SQLite database file, created if it doesn't exist
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS backfill_windows (
+                    search TEXT NOT NULL,
+                    window_start INTEGER NOT NULL,
+                    window_end INTEGER NOT NULL,
+                    listings INTEGER NOT NULL,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (search, window_start, window_end)
+                )
+                """)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS backfill_postings (posting_id INTEGER PRIMARY KEY)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def completed_windows(self, search: str) -> Set[Tuple[int, int]]:
+        """
+        :param search: Name of the search
+        :return: (window start, window end) pairs already processed for the search
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT window_start, window_end FROM backfill_windows WHERE search = ?",
+                (search,),
+            ).fetchall()
+        return {(window_start, window_end) for window_start, window_end in rows}
+
+    def processed_posting_ids(self) -> Set[int]:
+        """
+        :return: Posting IDs of every listing already run through the pipeline by a backfill
+        """
+        with self._connect() as conn:
+            return {
+                posting_id
+                for (posting_id,) in conn.execute(
+                    "SELECT posting_id FROM backfill_postings"
+                )
+            }
+
+    def record_processed(self, posting_ids: Iterable[int]) -> None:
+        """
+        :param posting_ids: Posting IDs of listings that have been run through the pipeline
+        """
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO backfill_postings VALUES (?)",
+                [(posting_id,) for posting_id in posting_ids],
+            )
+
+    def complete_window(
+        self, searches: Iterable[str], window: Tuple[int, int], listings: int
+    ) -> None:
+        """
+        Mark a window as processed for the given searches.
+
+        :param searches: Names of the searches
+        :param window: (window start, window end)
+        :param listings: Number of new listings run through the pipeline for the window
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO backfill_windows VALUES (?, ?, ?, ?, ?)",
+                [(search, window[0], window[1], listings, now) for search in searches],
+            )
+
+
+@dataclass
+class BackfillStats:
+    """Outcome of a backfill"""
+
+    windows: int = 0
+    windows_completed: int = 0
+    windows_skipped: int = 0  # already completed by an earlier, interrupted backfill
+    windows_failed: int = 0
+    snapshots_fetched: int = 0
+    listings_found: int = 0
+    # listings found more than once - by several searches, or already processed in another window
+    duplicates_skipped: int = 0
+    listings_processed: int = 0
+    good_bikes: int = 0
+    high_confidence_matches: int = 0
+    snapshot_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+
+class Backfiller:
+    """
+    Finds the listings posted in each window of a time range and runs them through a ListingPipeline, one window at a
+    time in order. The SAPI snapshots at every window boundary are fetched up front on a thread pool, so later windows'
+    snapshots are ready by the time the pipeline gets to them.
+
+    A window's listings are the ones in the snapshot at its end but not the one at its start. Like CDC, this only sees
+    listings that are still active - anything posted and taken down since is gone from every snapshot.
+
+    With a `notifier`, a window is only checkpointed once its alerts have been sent, so a window whose alerts failed to
+    send is retried by the next backfill.
+    """
+
+    def __init__(
+        self,
+        pipeline: ListingPipeline,
+        checkpoint: BackfillCheckpoint,
+        searches: Sequence[SearchProfile],
+        window_seconds: int = 3600,
+        snapshot_workers: int = 8,
+        deadline: Optional[float] = None,
+        notifier: Optional[Union["AlertDispatcher", "WatchNotifier"]] = None,
+    ):
+        """
+        Initialize the backfiller.
+
+        :param pipeline: Pipeline to run each window's listings through
+        :param checkpoint: Checkpoint of windows and listings already processed
+        :param searches: Searches to backfill
+        :param window_seconds: Length of each window
+        :param snapshot_workers: Max number of SAPI snapshot requests in flight at once
+        :param deadline: `time.monotonic()` time by which to stop starting new windows. Unstarted windows are left for
+            the next backfill over the same range
+        :param notifier: Dispatcher the pipeline sends its alerts with, flushed before each window is checkpointed
+        """
+        self.pipeline = pipeline
+        self.checkpoint = checkpoint
+        self.searches = list(searches)
+        self.window_seconds = window_seconds
+        self.snapshot_workers = snapshot_workers
+        self.deadline = deadline
+        self.notifier = notifier
+        self.stats = BackfillStats()
+        self._lock = threading.Lock()
+
+    def _fetch_snapshot(
+        self, profile: SearchProfile, timestamp: int
+    ) -> ListingSnapshot:
+        start = time.perf_counter()
+        snapshot = fetch_listing_snapshot(timestamp, profile)
+        with self._lock:
+            self.stats.snapshot_seconds += time.perf_counter() - start
+            self.stats.snapshots_fetched += 1
+        return snapshot
+
+    def _window_urls(
+        self,
+        window: Tuple[int, int],
+        searches: List[SearchProfile],
+        snapshots: Dict[Tuple[str, int], Future],
+        seen_posting_ids: Set[int],
+    ) -> List[str]:
+        """New listing URLs in a window across the given searches, skipping any we've already seen"""
+        # diff every search first, so a failed snapshot doesn't leave some of the window's listings marked as seen
+        added = []
+        for profile in searches:
+            start = snapshots[profile.name, window[0]].result()
+            end = snapshots[profile.name, window[1]].result()
+            added.append((profile, end.posting_ids.diff(start.posting_ids).added))
+
+        urls = []
+        for profile, posting_ids in added:
+            for posting_id in posting_ids:
+                self.stats.listings_found += 1
+                if posting_id in seen_posting_ids:
+                    self.stats.duplicates_skipped += 1
+                    continue
+                seen_posting_ids.add(posting_id)
+                urls.append(f"{profile.url_base}{posting_id}.html")
+        return urls
+
+    def run(self, start: int, end: int) -> BackfillStats:
+        """
+        Backfill the listings posted between two timestamps, skipping windows an earlier backfill already completed.
+
+        :param start: Unix epoch timestamp to start at
+        :param end: Unix epoch timestamp to end at
+        :return: BackfillStats for the run
+        """
+        run_start = time.monotonic()
+        self.stats = BackfillStats()
+        windows = split_windows(start, end, self.window_seconds)
+        self.stats.windows = len(windows)
+
+        # the searches each window still needs to be processed for
+        completed = {
+            profile.name: self.checkpoint.completed_windows(profile.name)
+            for profile in self.searches
+        }
+        pending: Dict[Tuple[int, int], List[SearchProfile]] = {}
+        for window in windows:
+            searches = [p for p in self.searches if window not in completed[p.name]]
+            if searches:
+                pending[window] = searches
+            else:
+                self.stats.windows_skipped += 1
+        log.info(
+            f"Backfilling {len(pending)} of {len(windows)} windows from {start} to {end} "
+            f"({self.stats.windows_skipped} already completed)"
+        )
+
+        seen_posting_ids = self.checkpoint.processed_posting_ids()
+        with ThreadPoolExecutor(
+            max_workers=self.snapshot_workers, thread_name_prefix="backfill-snapshot"
+        ) as executor:
+            # submitted in window order, so the snapshots for the first windows come back first
+            snapshots: Dict[Tuple[str, int], Future] = {}
+            for window, searches in pending.items():
+                for profile in searches:
+                    for timestamp in window:
+                        if (profile.name, timestamp) not in snapshots:
+                            snapshots[profile.name, timestamp] = executor.submit(
+                                self._fetch_snapshot, profile, timestamp
+                            )
+
+            for window, searches in pending.items():
+                if self.deadline is not None and time.monotonic() >= self.deadline:
+                    log.warning(
+                        f"Backfill deadline reached, leaving windows from {window[0]} on for the next run"
+                    )
+                    for future in snapshots.values():
+                        future.cancel()
+                    break
+
+                try:
+                    urls = self._window_urls(
+                        window, searches, snapshots, seen_posting_ids
+                    )
+                except Exception as e:
+                    log.error(
+                        f"Failed to fetch snapshots for window {window}: {e}",
+                        exc_info=True,
+                    )
+                    self.stats.windows_failed += 1
+                    continue
+
+                unfinished = set()
+                if urls:
+                    stats = self.pipeline.run(urls)
+                    unfinished = set(stats.unfinished_urls)
+                    if self.notifier:
+                        # alerts are sent in the background, so wait for this window's to go out first
+                        self.notifier.flush()
+                        unfinished.update(
+                            set(self.notifier.pending_urls()).intersection(urls)
+                        )
+                    self.stats.listings_processed += len(urls) - len(unfinished)
+                    self.stats.good_bikes += stats.good_bikes
+                    self.stats.high_confidence_matches += stats.high_confidence_matches
+                    self.checkpoint.record_processed(
+                        posting_id_from_url(url)
+                        for url in urls
+                        if url not in unfinished
+                    )
+
+                if unfinished:
+                    # leave the window for the next backfill to finish
+                    seen_posting_ids.difference_update(
+                        posting_id_from_url(url) for url in unfinished
+                    )
+                    self.stats.windows_failed += 1
+                    continue
+                self.checkpoint.complete_window(
+                    [profile.name for profile in searches], window, len(urls)
+                )
+                self.stats.windows_completed += 1
+                log.info(f"Backfilled window {window}: {len(urls)} new listings")
+
+        self.stats.elapsed_seconds = time.monotonic() - run_start
+        return self.stats
+
+    def log_stats(self) -> None:
+        """Log what the last backfill did"""
+        stats = self.stats
+        log.info(
+            f"\tWindows: {stats.windows_completed} of {stats.windows} completed ({stats.windows_skipped} by an "
+            f"earlier backfill, {stats.windows_failed} failed or unfinished), {stats.snapshots_fetched} snapshots "
+            f"fetched in {stats.snapshot_seconds:.2f}s total"
+        )
+        log.info(
+            f"\tListings: {stats.listings_found} found, {stats.duplicates_skipped} duplicates skipped, "
+            f"{stats.listings_processed} processed in {stats.elapsed_seconds:.2f}s"
+        )
+        log.info(
+            f"\tGood bikes found: {stats.good_bikes}, high-confidence matches: {stats.high_confidence_matches}"
+        )
+
+
+def run_backfill(
+    start: int, end: int, config: Optional[Config] = None
+) -> BackfillStats:
+    """
+    Backfill the listings posted between two timestamps for every configured search, alerting on good ones.
+
+    :param start: Unix epoch timestamp to start at
+    :param end: Unix epoch timestamp to end at
+    :param config: Application config, loaded from the environment if not given
+    :return: BackfillStats for the run
+    """
+    config = config or get_config()
+    classifier = build_classifier(config)
+    watches = build_watch_set(config)
+    dispatcher = build_notifier(config, watches)
+    archive = build_archive(config)
+    index = build_listing_index(config)
+    scorer = build_market_scorer(config, archive)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=config.backfill_parse_processes
+        ) as parse_pool:
+            pipeline = ListingPipeline(
+                build_fetcher(config),
+                classifier,
+                notify=dispatcher.submit,
+                fetch_workers=config.fetch_max_workers,
+                parse_workers=config.backfill_parse_processes,
+                classify_concurrency=config.llm_max_concurrency,
+                batch_size=config.llm_batch_size,
+                queue_size=config.pipeline_queue_size,
+                parse_executor=parse_pool,
+                on_parsed=index.add if index else None,
+                on_classified=archive.append if archive else None,
+                score=scorer.score if scorer else None,
+                watches=watches,
+            )
+            backfiller = Backfiller(
+                pipeline,
+                BackfillCheckpoint(config.backfill_checkpoint_path),
+                config.get_search_profiles(),
+                window_seconds=config.backfill_window_minutes * 60,
+                snapshot_workers=config.backfill_snapshot_workers,
+                notifier=dispatcher,
+            )
+            stats = backfiller.run(start, end)
+    finally:
+        # even if the backfill fails, send the alerts it queued and keep the listings it got through
+        dispatcher.close()
+        if index:
+            index.flush()
+        if archive:
+            archive.flush()
+            archive.compact()
+
+    log.info(f"\n{'=' * 60}")
+    log.info("Backfill complete!")
+    backfiller.log_stats()
+    log.info(f"{'=' * 60}")
+    dispatcher.log_stats()
+    log_classifier_stats(classifier)
+    if index:
+        index.log_stats()
+    if archive:
+        archive.log_stats()
+    get_metrics().export(config.metrics_json_path, config.metrics_prometheus_path)
+    return stats
+
+
+def _parse_timestamp(value: str) -> int:
+    """Unix epoch timestamp from either an epoch timestamp or an ISO 8601 date/time (local time if no offset)"""
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    parser = argparse.ArgumentParser(
+        description="Backfill listings posted in a past time range"
+    )
+    parser.add_argument(
+        "--start", required=True, help="ISO 8601 date/time or epoch timestamp"
+    )
+    parser.add_argument(
+        "--end",
+        help="ISO 8601 date/time or epoch timestamp, defaults to now",
+    )
+    args = parser.parse_args()
+
+    start = _parse_timestamp(args.start)
+    end = _parse_timestamp(args.end) if args.end else int(time.time())
+    if start >= end:
+        parser.error("--start must be before --end")
+    run_backfill(start, end)
+
+
+if __name__ == "__main__":
+    main()
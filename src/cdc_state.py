@@ -0,0 +1,167 @@
+"""Persistent state for Change Data Capture - stores the listing snapshot from our last successful run"""
+
+import json
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+from config import Config
+from models import ListingSnapshot
+
+log = logging.getLogger(__name__)
+
+
+class StateStore(ABC):
+    """Backend for persisting the last seen listing snapshot between runs"""
+
+    @abstractmethod
+    def load(self) -> Optional[ListingSnapshot]:
+        """
+        Load the last saved snapshot.
+
+        :return: The last saved ListingSnapshot, or None if nothing has been saved yet
+        """
+
+    @abstractmethod
+    def save(self, snapshot: ListingSnapshot) -> None:
+        """
+        Save a snapshot, replacing the previously saved one.
+
+        :param snapshot: ListingSnapshot to persist
+        """
+
+
+class SQLiteStateStore(StateStore):
+    """Stores the snapshot in a local SQLite database. Good for local runs and long-lived workers"""
+
+    def __init__(self, path: Path, key: str = "default"):
+        """
+        :param path: Path to the SQLite database file, created if it doesn't exist
+        :param key: Key to store the snapshot under, so several searches can share one database
+        """
+        self.path = Path(path)
+        self.key = key
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cdc_state (
+                    key TEXT PRIMARY KEY,
+                    fetched_at INTEGER NOT NULL,
+                    min_posting_id INTEGER NOT NULL,
+                    posting_ids BLOB NOT NULL
+                )
+                """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def load(self) -> Optional[ListingSnapshot]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT fetched_at, min_posting_id, posting_ids FROM cdc_state WHERE key = ?",
+                (self.key,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        fetched_at, min_posting_id, posting_ids = row
+        if isinstance(posting_ids, str):
+            # state written before posting IDs were stored in their compact form
+            posting_ids = json.loads(posting_ids)
+
+        return ListingSnapshot(
+            fetched_at=fetched_at,
+            min_posting_id=min_posting_id,
+            posting_ids=posting_ids,
+        )
+
+    def save(self, snapshot: ListingSnapshot) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cdc_state (key, fetched_at, min_posting_id, posting_ids) VALUES (?, ?, ?, ?)",
+                (
+                    self.key,
+                    snapshot.fetched_at,
+                    snapshot.min_posting_id,
+                    snapshot.posting_ids.to_bytes(),
+                ),
+            )
+
+
+class GCSStateStore(StateStore):
+    """
+    Stores the snapshot as a JSON blob in Google Cloud Storage. Use this in the cloud function, where local disk does
+    not survive cold starts.
+    """
+
+    def __init__(self, bucket: str, blob_name: str):
+        """
+        :param bucket: Name of the GCS bucket
+        :param blob_name: Name of the blob to store the snapshot in
+        """
+        # imported here so local runs don't need the GCS client installed or authenticated
+        from google.cloud import storage
+
+        self.blob = storage.Client().bucket(bucket).blob(blob_name)
+
+    def load(self) -> Optional[ListingSnapshot]:
+        if not self.blob.exists():
+            return None
+        return ListingSnapshot.model_validate_json(self.blob.download_as_bytes())
+
+    def save(self, snapshot: ListingSnapshot) -> None:
+        self.blob.upload_from_string(
+            snapshot.model_dump_json(), content_type="application/json"
+        )
+
+
+class CachedStateStore(StateStore):
+    """
+    Keeps the last loaded or saved snapshot in memory in front of another store, so a long-lived worker only reads
+    its state from disk or GCS once. Every save is still written through. Only safe while this process is the only
+    one writing to the underlying store.
+    """
+
+    def __init__(self, store: StateStore):
+        """
+        :param store: Store to load from once and write through to
+        """
+        self.store = store
+        self._snapshot: Optional[ListingSnapshot] = None
+        self._loaded = False
+
+    def load(self) -> Optional[ListingSnapshot]:
+        if not self._loaded:
+            self._snapshot = self.store.load()
+            self._loaded = True
+        return self._snapshot
+
+    def save(self, snapshot: ListingSnapshot) -> None:
+        self.store.save(snapshot)
+        self._snapshot = snapshot
+        self._loaded = True
+
+
+def get_state_store(config: Config, key: str = "default") -> StateStore:
+    """
+    Build the CDC state store configured by `config.cdc_state_backend`.
+
+    :param config: Application config
+    :param key: Name of the search whose snapshot the store holds. Each search gets its own SQLite row or GCS blob
+    :return: StateStore instance
+    """
+    if config.cdc_state_backend == "gcs":
+        if not config.cdc_state_gcs_bucket:
+            raise ValueError("cdc_state_gcs_bucket must be set to use the GCS backend")
+        blob_name = config.cdc_state_gcs_blob
+        if key != "default":
+            # e.g. cdc_state.json -> cdc_state-peninsula.json
+            blob = Path(blob_name)
+            blob_name = str(blob.with_name(f"{blob.stem}-{key}{blob.suffix}"))
+        return GCSStateStore(config.cdc_state_gcs_bucket, blob_name)
+
+    return SQLiteStateStore(config.cdc_state_path, key=key)
@@ -1,23 +1,33 @@
 """Change Data Capture for Craigslist bike listings"""
 
+import logging
 import time
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
 
 import requests
 
-from config import Config
+from cdc_state import StateStore
+from config import get_config
+from http_client import get_http_client
+from metrics import get_metrics
+from models import ListingSnapshot, SearchProfile
+from posting_ids import PostingIdSet
+from sapi_stream import decode_snapshot_stream
 
-# load our config
-config = Config()
+log = logging.getLogger(__name__)
 
 
-def fetch_active_listings_until(timestamp: int) -> dict:
-    """
-    Fetch all bike listings posted until the given timestamp that still exist.
+SAPI_SEARCH_URL = "https://sapi.craigslist.org/web/v8/postings/search/full"
+SAPI_STREAM_CHUNK_BYTES = 64 * 1024
 
-    :param timestamp: Unix epoch timestamp
-    :return: JSON response from Craigslist API
-    """
+
+def _search_active_listings_until(
+    profile: SearchProfile, timestamp: int, stream: bool
+) -> requests.Response:
+    """Send the SAPI search request for all listings posted until the given timestamp that still exist"""
     headers = {
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:147.0) Gecko/20100101 Firefox/147.0",
         "Accept": "application/json",
@@ -25,51 +35,262 @@ def fetch_active_listings_until(timestamp: int) -> dict:
 
     params = {
         "batch": f"1-{timestamp}-0-1-0",
-        "lat": config.search_lat,
-        "lon": config.search_lon,
-        "searchPath": config.search_path,
-        "search_distance": config.search_distance_miles,
+        "lat": profile.lat,
+        "lon": profile.lon,
+        "searchPath": profile.search_path,
+        "search_distance": profile.distance_miles,
         "lang": "en",
         "cc": "us",
     }
 
-    response = requests.get(
-        "https://sapi.craigslist.org/web/v8/postings/search/full",
+    response = get_http_client().get(
+        SAPI_SEARCH_URL,
         params=params,
         headers=headers,
         timeout=10,
+        stream=stream,
+    )
+    response.raise_for_status()
+    return response
+
+
+def fetch_active_listings_until(
+    timestamp: int, profile: Optional[SearchProfile] = None
+) -> dict:
+    """
+    Fetch all bike listings posted until the given timestamp that still exist.
+
+    :param timestamp: Unix epoch timestamp
+    :param profile: Search to run, defaults to the first configured search
+    :return: JSON response from Craigslist API
+    """
+    profile = profile or get_config().get_search_profiles()[0]
+    return _search_active_listings_until(profile, timestamp, stream=False).json()
+
+
+def fetch_listing_snapshot(
+    timestamp: int,
+    profile: Optional[SearchProfile] = None,
+    streaming_decode: Optional[bool] = None,
+) -> ListingSnapshot:
+    """
+    Fetch the set of listings active as of the given timestamp.
+
+    With `config.sapi_streaming_decode` set, the response is decoded as it streams in and only the posting IDs are
+    kept, instead of materializing the whole JSON payload.
+
+    :param timestamp: Unix epoch timestamp
+    :param profile: Search to run, defaults to the first configured search
+    :param streaming_decode: Whether to decode the response as it streams in, defaults to
+        `config.sapi_streaming_decode`
+    :return: ListingSnapshot with the absolute posting IDs of the active listings
+    """
+    profile = profile or get_config().get_search_profiles()[0]
+    if streaming_decode is None:
+        streaming_decode = get_config().sapi_streaming_decode
+    metrics = get_metrics()
+    with metrics.timer("sapi_request_seconds", search=profile.name):
+        if streaming_decode:
+            with _search_active_listings_until(
+                profile, timestamp, stream=True
+            ) as response:
+                min_posting_id, offsets = decode_snapshot_stream(
+                    response.iter_content(chunk_size=SAPI_STREAM_CHUNK_BYTES)
+                )
+                # streamed responses are read here rather than by the HTTP client, so count their bytes ourselves
+                metrics.inc(
+                    "http_response_bytes_total",
+                    response.raw.tell(),
+                    host=urlsplit(SAPI_SEARCH_URL).netloc,
+                )
+        else:
+            data = fetch_active_listings_until(timestamp, profile)["data"]
+            min_posting_id = data["decode"]["minPostingId"]
+            offsets = (item[0] for item in data["items"])
+
+        return ListingSnapshot(
+            fetched_at=timestamp,
+            min_posting_id=min_posting_id,
+            posting_ids=PostingIdSet.from_offsets(min_posting_id, offsets),
+        )
+
+
+@dataclass
+class SearchResult:
+    """Outcome of checking one search for new listings"""
+
+    profile: SearchProfile
+    new_urls: List[str]
+    # None if the search failed, in which case its CDC state should be left as is so it's retried next run
+    snapshot: Optional[ListingSnapshot]
+    previous_count: int = 0
+    removed_count: int = 0
+    # new listings that an earlier search in the same run also found, e.g. from overlapping search radii
+    duplicate_count: int = 0
+    elapsed_seconds: float = 0.0
+    error: Optional[Exception] = None
+
+
+def _check_search(
+    profile: SearchProfile,
+    state_store: StateStore,
+    n_minutes: int,
+    now: int,
+    streaming_decode: Optional[bool] = None,
+) -> SearchResult:
+    """Diff a search's current snapshot against the one saved from our last successful run"""
+    metrics = get_metrics()
+    start = time.monotonic()
+    with metrics.timer("cdc_search_seconds", search=profile.name):
+        prev_snapshot = state_store.load()
+
+        if prev_snapshot is None:
+            # Bootstrap: we have no state yet, so fall back to diffing against the state N minutes ago
+            log.info(
+                f"No stored CDC state for search {profile.name}, bootstrapping from {n_minutes} minutes ago"
+            )
+            prev_snapshot = fetch_listing_snapshot(
+                now - (n_minutes * 60), profile, streaming_decode
+            )
+
+        curr_snapshot = fetch_listing_snapshot(now, profile, streaming_decode)
+
+        # Find truly new listings
+        diff = curr_snapshot.posting_ids.diff(prev_snapshot.posting_ids)
+
+    metrics.inc("new_listings_total", len(diff.added), search=profile.name)
+    return SearchResult(
+        profile=profile,
+        new_urls=[f"{profile.url_base}{posting_id}.html" for posting_id in diff.added],
+        snapshot=curr_snapshot,
+        previous_count=len(prev_snapshot.posting_ids),
+        removed_count=len(diff.removed),
+        elapsed_seconds=time.monotonic() - start,
+    )
+
+
+def get_new_listing_urls(
+    state_store: StateStore, n_minutes: int, profile: Optional[SearchProfile] = None
+) -> Tuple[List[str], ListingSnapshot]:
+    """
+    Get URLs of bike listings that are new since our last successful run.
+
+    Only the current snapshot is fetched - it is diffed against the snapshot saved in `state_store`, so missed or failed
+    runs are caught up on automatically. The caller should save the returned snapshot to `state_store` once the new
+    listings have been processed, so that a run that fails midway is retried on the next invocation.
+
+    :param state_store: Store holding the snapshot from our last successful run
+    :param n_minutes: Number of minutes to look back if there is no stored snapshot yet
+    :param profile: Search to check, defaults to the first configured search
+    :return: Tuple of (URLs for new listings, current snapshot)
+    """
+    now = int(time.time())
+    result = _check_search(
+        profile or get_config().get_search_profiles()[0], state_store, n_minutes, now
     )
-    return response.json()
 
+    log.info(f"Previous listing count: {result.previous_count}")
+    log.info(f"Current listing count: {len(result.snapshot.posting_ids)}")
+    log.info(f"Removed listings: {result.removed_count}")
+    log.info(f"New listings: {len(result.new_urls)}")
+
+    return result.new_urls, result.snapshot
 
-def get_new_listing_urls(n_minutes: int) -> List[str]:
+
+def get_new_listing_urls_for_searches(
+    searches: Sequence[Tuple[SearchProfile, StateStore]],
+    n_minutes: int,
+    max_workers: int = 4,
+    streaming_decode: Optional[bool] = None,
+) -> Tuple[List[str], List[SearchResult]]:
     """
-    Get URLs of new bike listings from the last N minutes.
+    Get URLs of listings that are new since our last successful run, across several searches.
+
+    The searches' SAPI requests are sent concurrently. A listing found by more than one search (e.g. from overlapping
+    radii) is only returned once, under the first search in `searches` that found it, so it's only fetched and
+    classified once. A search that fails is logged and skipped, and the others carry on.
 
-    :param n_minutes: Number of minutes to look back
-    :return: List of URLs for new listings
+    :param searches: (search, store holding its snapshot from our last successful run) pairs
+    :param n_minutes: Number of minutes to look back for searches with no stored snapshot yet
+    :param max_workers: Max number of searches to run at once
+    :param streaming_decode: Whether to decode SAPI responses as they stream in, defaults to
+        `config.sapi_streaming_decode`
+    :return: Tuple of (deduplicated URLs for new listings, per-search results in the same order as `searches`). Save
+        each successful result's snapshot to its store once the new listings have been processed
     """
     now = int(time.time())
-    n_minutes_ago = now - (n_minutes * 60)
 
-    # Request 1: State N minutes ago
-    old_listings = fetch_active_listings_until(n_minutes_ago)
-    old_items = old_listings["data"]["items"]
-    old_ids = {item[0] for item in old_items}
+    def check(search: Tuple[SearchProfile, StateStore]) -> SearchResult:
+        profile, state_store = search
+        start = time.monotonic()
+        try:
+            return _check_search(profile, state_store, n_minutes, now, streaming_decode)
+        except Exception as e:
+            log.error(f"Search {profile.name} failed: {e}", exc_info=True)
+            return SearchResult(
+                profile=profile,
+                new_urls=[],
+                snapshot=None,
+                elapsed_seconds=time.monotonic() - start,
+                error=e,
+            )
 
-    # Request 2: Current state
-    curr_listings = fetch_active_listings_until(now)
-    curr_items = curr_listings["data"]["items"]
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(searches))),
+        thread_name_prefix="sapi-search",
+    ) as executor:
+        results = list(executor.map(check, searches))
 
-    # Find truly new listings
-    new_items = [item for item in curr_items if item[0] not in old_ids]
+    new_urls = []
+    seen_posting_ids = set()
+    for result in results:
+        for url in result.new_urls:
+            posting_id = posting_id_from_url(url)
+            if posting_id in seen_posting_ids:
+                result.duplicate_count += 1
+                continue
+            seen_posting_ids.add(posting_id)
+            new_urls.append(url)
 
-    print(f"Old listing count: {len(old_ids)}")
-    print(f"Current listing count: {len(curr_items)}")
-    print(f"New listings in past {n_minutes} minutes: {len(new_items)}")
+    for result in results:
+        if result.error:
+            continue
+        log.info(
+            f"Search {result.profile.name}: {len(result.snapshot.posting_ids)} active listings "
+            f"({result.previous_count} last run, {result.removed_count} removed), {len(result.new_urls)} new "
+            f"of which {result.duplicate_count} were found by an earlier search, in {result.elapsed_seconds:.2f}s"
+        )
+    return new_urls, results
 
-    # Decode the listings to get URLs
-    min_posting_id = curr_listings["data"]["decode"]["minPostingId"]
-    sf_bikes_url_base = "https://sfbay.craigslist.org/bik/"
 
-    return [f"{sf_bikes_url_base}{min_posting_id + item[0]}.html" for item in new_items]
+def posting_id_from_url(url: str) -> int:
+    """
+    Get the posting ID of a listing from its URL.
+
+    :param url: Listing URL, ending in `<posting ID>.html`
+    :return: Posting ID
+    """
+    return int(url.rsplit("/", 1)[-1].removesuffix(".html"))
+
+
+def snapshot_without_urls(
+    snapshot: ListingSnapshot, urls: Iterable[str]
+) -> ListingSnapshot:
+    """
+    Drop listings from a snapshot, so they show up as new again on the next run. Used for listings a run didn't get
+    to before its deadline.
+
+    :param snapshot: Snapshot to save as our CDC state
+    :param urls: URLs of the listings to drop
+    :return: Snapshot without those listings
+    """
+    urls = list(urls)
+    if not urls:
+        return snapshot
+    return snapshot.model_copy(
+        update={
+            "posting_ids": snapshot.posting_ids.without(
+                posting_id_from_url(url) for url in urls
+            )
+        }
+    )
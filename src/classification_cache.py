@@ -0,0 +1,306 @@
+"""Persistent cache of LLM classifications, so reposted listings reuse the verdict from their earlier posting"""
+
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from models import BikeClassification, BikeListingData
+
+log = logging.getLogger(__name__)
+
+# listing fields that must be identical, after normalization, for a near-duplicate body to count as a repost. Dealers
+# reuse the same boilerplate description across different bikes, so a similar body alone isn't enough
+_REPOST_KEY_FIELDS = ("price", "manufacturer", "model", "frame_size")
+
+# MinHash signature length, split into LSH bands of `_ROWS_PER_BAND` rows. Two listings with Jaccard similarity s land in
+# the same bucket of at least one band with probability 1 - (1 - s^4)^16: ~99% at s=0.8, ~20% at s=0.4
+_NUM_HASHES = 64
+_ROWS_PER_BAND = 4
+_NUM_BANDS = _NUM_HASHES // _ROWS_PER_BAND
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_HASH_PARAMS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest())
+        % _MERSENNE_PRIME,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest())
+        % _MERSENNE_PRIME,
+    )
+    for i in range(_NUM_HASHES)
+]
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(_NON_WORD.split((text or "").lower())).strip()
+
+
+def listing_fingerprint(listing: BikeListingData) -> str:
+    """
+    Fingerprint of everything the LLM sees about a listing, ignoring its URL, case, punctuation and whitespace - so an
+    identical repost under a new posting ID gets the same fingerprint.
+
+    :param listing: Parsed BikeListingData
+    :return: Hex digest
+    """
+    fields = [
+        _normalize(value) for value in listing.model_dump(exclude={"url"}).values()
+    ]
+    return hashlib.sha256("\x1f".join(fields).encode()).hexdigest()
+
+
+def minhash_signature(text: str, shingle_words: int = 3) -> array:
+    """
+    MinHash signature of the word shingles in `text`.
+
+    :param text: Text to sign
+    :param shingle_words: Number of words per shingle
+    :return: Array of `_NUM_HASHES` minimum hash values
+    """
+    words = _normalize(text).split()
+    shingles = {
+        " ".join(words[i : i + shingle_words])
+        for i in range(max(1, len(words) - shingle_words + 1))
+    }
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest())
+        for s in shingles
+    ]
+    return array(
+        "Q",
+        (min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _HASH_PARAMS),
+    )
+
+
+def _band_keys(signature: array) -> List[Tuple[int, str]]:
+    return [
+        (
+            band,
+            hashlib.blake2b(
+                signature[
+                    band * _ROWS_PER_BAND : (band + 1) * _ROWS_PER_BAND
+                ].tobytes(),
+                digest_size=8,
+            ).hexdigest(),
+        )
+        for band in range(_NUM_BANDS)
+    ]
+
+
+def _similarity(a: array, b: array) -> float:
+    """Estimated Jaccard similarity of the texts behind two MinHash signatures"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters for a ClassificationCache"""
+
+    exact_hits: int = 0
+    near_duplicate_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.exact_hits + self.near_duplicate_hits + self.misses
+        return (
+            (self.exact_hits + self.near_duplicate_hits) / lookups if lookups else 0.0
+        )
+
+
+class ClassificationCache:
+    """
+    SQLite-backed cache of classifications. A listing hits the cache when it has the same fingerprint as a cached one,
+    or when it has the same price/manufacturer/model/frame size and a near-duplicate body, found via a banded LSH
+    index over MinHash signatures of the title + body. Entries expire after `ttl_seconds`, and the least recently used
+    entries are evicted beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ttl_seconds: float = 30 * 24 * 3600,
+        max_entries: int = 10_000,
+        min_similarity: float = 0.8,
+    ):
+        """
+        :param path: Path to the SQLite database file, created if it doesn't exist
+        :param ttl_seconds: How long a cached classification stays valid
+        :param max_entries: Max number of cached classifications
+        :param min_similarity: Min estimated Jaccard similarity of title + body for a near-duplicate hit
+        """
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self.stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS classifications (
+                    fingerprint TEXT PRIMARY KEY,
+                    repost_key TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    url TEXT NOT NULL,
+                    is_good INTEGER NOT NULL,
+                    reason TEXT NOT NULL,
+                    confidence TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS lsh_buckets (
+                    band INTEGER NOT NULL,
+                    bucket TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL REFERENCES classifications (fingerprint) ON DELETE CASCADE
+                );
+                CREATE INDEX IF NOT EXISTS lsh_buckets_by_bucket ON lsh_buckets (band, bucket);
+                CREATE INDEX IF NOT EXISTS lsh_buckets_by_fingerprint ON lsh_buckets (fingerprint);
+                CREATE INDEX IF NOT EXISTS classifications_by_last_used ON classifications (last_used_at);
+                """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @staticmethod
+    def _repost_key(listing: BikeListingData) -> str:
+        return "\x1f".join(
+            _normalize(getattr(listing, name)) for name in _REPOST_KEY_FIELDS
+        )
+
+    def _count(self, counter: str) -> None:
+        with self._stats_lock:
+            setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+
+    def get(self, listing: BikeListingData) -> Optional[BikeClassification]:
+        """
+        Look up the cached classification of a listing or of an earlier posting of the same bike.
+
+        :param listing: Parsed BikeListingData
+        :return: Cached BikeClassification, or None on a miss
+        """
+        now = time.time()
+        fingerprint = listing_fingerprint(listing)
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT fingerprint, url, is_good, reason, confidence FROM classifications "
+                "WHERE fingerprint = ? AND created_at >= ?",
+                (fingerprint, now - self.ttl_seconds),
+            ).fetchone()
+            counter = "exact_hits"
+
+            if row is None:
+                row = self._find_near_duplicate(conn, listing, now)
+                counter = "near_duplicate_hits"
+
+            if row is None:
+                self._count("misses")
+                return None
+
+            conn.execute(
+                "UPDATE classifications SET last_used_at = ? WHERE fingerprint = ?",
+                (now, row[0]),
+            )
+
+        self._count(counter)
+        _, url, is_good, reason, confidence = row
+        log.info(f"Classification cache hit ({counter}) from earlier posting {url}")
+        return BikeClassification(
+            is_good=bool(is_good), reason=reason, confidence=confidence
+        )
+
+    def _find_near_duplicate(
+        self, conn: sqlite3.Connection, listing: BikeListingData, now: float
+    ) -> Optional[tuple]:
+        signature = minhash_signature(f"{listing.title} {listing.body}")
+        buckets = _band_keys(signature)
+        candidates = conn.execute(
+            f"""
+            SELECT DISTINCT c.fingerprint, c.url, c.is_good, c.reason, c.confidence, c.signature
+            FROM lsh_buckets b JOIN classifications c ON c.fingerprint = b.fingerprint
+            WHERE ({" OR ".join(["(b.band = ? AND b.bucket = ?)"] * len(buckets))})
+              AND c.repost_key = ? AND c.created_at >= ?
+            """,
+            [value for bucket in buckets for value in bucket]
+            + [self._repost_key(listing), now - self.ttl_seconds],
+        ).fetchall()
+
+        best, best_similarity = None, self.min_similarity
+        for *row, candidate_signature in candidates:
+            similarity = _similarity(signature, array("Q", candidate_signature))
+            if similarity >= best_similarity:
+                best, best_similarity = tuple(row), similarity
+        return best
+
+    def put(self, listing: BikeListingData, classification: BikeClassification) -> None:
+        """
+        Cache the classification of a listing, then evict expired and least recently used entries.
+
+        :param listing: Parsed BikeListingData
+        :param classification: BikeClassification returned by the LLM
+        """
+        now = time.time()
+        fingerprint = listing_fingerprint(listing)
+        signature = minhash_signature(f"{listing.title} {listing.body}")
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    fingerprint,
+                    self._repost_key(listing),
+                    signature.tobytes(),
+                    listing.url,
+                    classification.is_good,
+                    classification.reason,
+                    classification.confidence,
+                    now,
+                    now,
+                ),
+            )
+            conn.execute(
+                "DELETE FROM lsh_buckets WHERE fingerprint = ?", (fingerprint,)
+            )
+            conn.executemany(
+                "INSERT INTO lsh_buckets VALUES (?, ?, ?)",
+                [(band, bucket, fingerprint) for band, bucket in _band_keys(signature)],
+            )
+
+            # evict expired entries, then the least recently used ones beyond our size limit
+            conn.execute(
+                "DELETE FROM classifications WHERE created_at < ?",
+                (now - self.ttl_seconds,),
+            )
+            conn.execute(
+                """
+                DELETE FROM classifications WHERE fingerprint IN (
+                    SELECT fingerprint FROM classifications ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def reset_stats(self) -> None:
+        """Start the hit/miss counters from zero, e.g. at the start of each run of a long-lived cache"""
+        with self._stats_lock:
+            self.stats = CacheStats()
+
+    def log_stats(self) -> None:
+        """Log the cache's hit/miss counters"""
+        log.info(
+            f"Classification cache: {self.stats.exact_hits} exact hits, "
+            f"{self.stats.near_duplicate_hits} near-duplicate hits, {self.stats.misses} misses "
+            f"({self.stats.hit_rate:.0%} hit rate)"
+        )
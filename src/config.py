@@ -1,9 +1,15 @@
 """Application configuration."""
 
+import tempfile
+from functools import lru_cache
 from pathlib import Path
+from typing import List, Literal, Optional
 
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from models import SearchProfile, WatchProfile
+
 
 class Config(BaseSettings):
     """
@@ -16,12 +22,98 @@ class Config(BaseSettings):
     search_lon: float = -122.394
     search_distance_miles: int = 15
     search_path: str = "san-francisco-ca/bia"  # filters for bikes in the SF bay area
+    search_url_base: str = "https://sfbay.craigslist.org/bik/"  # base URL of the listing pages found by the search
+    # to watch several categories or areas in one run, set this to a JSON list of `models.SearchProfile` objects. It
+    # replaces the single search above. Listings found by more than one search are only fetched and classified once
+    search_profiles: List[SearchProfile] = []
+    search_max_concurrency: int = 4  # max number of SAPI searches in flight at once
+    # decode SAPI search responses as they stream in, keeping only the posting IDs instead of the whole payload
+    sapi_streaming_decode: bool = True
 
-    # TODO: Look into remote config to allow for backfills on unsuccessful runs
+    # only used to bootstrap CDC when we have no stored state yet, after that we diff against the last stored snapshot
     check_interval_minutes: int = 15  # should match the interval of how often the cloud function that invokes this program runs
+    function_timeout_seconds: int = 540  # should match the cloud function's timeout, so we wrap up before being killed
+
+    # CDC state config - where we persist the listing snapshot from our last successful run. Local disk does not
+    # survive cloud function cold starts, so use the GCS backend there
+    cdc_state_backend: Literal["sqlite", "gcs"] = "sqlite"
+    cdc_state_path: Path = Path(tempfile.gettempdir()) / "craigslist_cdc_state.sqlite3"
+    cdc_state_gcs_bucket: Optional[str] = None
+    cdc_state_gcs_blob: str = "cdc_state.json"
+
+    # Listing fetch engine config - bounds how hard we hit craigslist when a burst of new listings comes in
+    fetch_max_workers: int = 8
+    fetch_max_concurrency_per_host: int = 4
+    fetch_requests_per_second: float = 2.0  # sustained request rate allowed per host
+    # number of requests allowed to go out back to back before the rate limit kicks in
+    fetch_burst: int = 4
+    fetch_max_retries: int = 3  # retries on 429s, 5xxs and connection errors
+
+    # backfill config - `backfill.py` reprocesses an arbitrary time range (e.g. from runs that failed), split into
+    # windows. Finished windows are checkpointed, so an interrupted backfill can be resumed
+    backfill_window_minutes: int = 60
+    backfill_snapshot_workers: int = 8  # max number of SAPI snapshot requests in flight at once
+    backfill_parse_processes: int = 4  # number of processes parsing listing pages
+    backfill_checkpoint_path: Path = Path(tempfile.gettempdir()) / "craigslist_backfill.sqlite3"
+
+    # worker mode - `worker.py` runs the pipeline in a long-lived process instead of on the cloud function's fixed
+    # schedule, polling more often while listings are coming in quickly and backing off when they're not
+    worker_min_interval_seconds: float = 60
+    worker_max_interval_seconds: float = 900
+    worker_target_listings_per_poll: float = 1.0  # poll about as often as this many new listings are expected
+    worker_interval_jitter: float = 0.2  # +/- fraction of each interval, so our polls don't land on a fixed beat
+    worker_sapi_requests_per_hour: int = 120  # budget on SAPI search requests, summed over every search
+
+    # archive of every classified listing - parsed attributes, price and verdict - for offline analysis, see
+    # `archive.py`. Only kept once `archive_path` is set, to a persistent disk: the cloud function's /tmp is held in
+    # memory and doesn't survive cold starts, so an archive there would eat into the function's memory on every run
+    archive_enabled: bool = True
+    archive_path: Optional[Path] = None
+    archive_compact_min_segments: int = 8  # number of small per-run segments it takes to trigger a compaction
+    # rows per compacted segment, which is also the most rows compaction holds in memory at once
+    archive_target_segment_rows: int = 50_000
+    # market-value scoring - listings are classified cheapest first compared to earlier archived listings of the same
+    # model (or manufacturer), see `pricing.py`. Needs the archive
+    market_scoring_enabled: bool = True
+    market_lookback_days: float = 180  # only compare against listings archived this recently
+    market_min_samples: int = 5  # min number of earlier prices of a model or manufacturer to compare against
+    market_refresh_minutes: float = 60  # how often a long-lived instance re-reads prices from the archive
+    # index of every parsed listing by attribute, price, frame size and words, for instant queries over history, see
+    # `listing_index.py`. Like the archive, it's only kept once `listing_index_path` is set, to a persistent disk
+    listing_index_enabled: bool = True
+    listing_index_path: Optional[Path] = None
+
+    # staged pipeline config - listings flow through fetch -> parse -> classify -> notify stages running concurrently
+    pipeline_parse_workers: int = 2
+    pipeline_queue_size: int = 32  # max number of listings waiting between two stages
 
     # LLM config
     anthropic_api_key: str
+    # max number of listings classified per LLM request, so the few-shot system prompt is sent once per batch
+    llm_batch_size: int = 5
+    # max number of LLM requests in flight at once. Concurrency adapts below this when we get rate limited
+    llm_max_concurrency: int = 4
+    llm_max_retries: int = 4  # retries on rate limits, overloaded errors, 5xxs and connection errors
+    # max number of tokens of a listing's description sent to the LLM. Longer descriptions are cut down to their
+    # sentences mentioning components, brands, years, sizes and bike types, see `prompt_builder.py`
+    llm_description_max_tokens: int = 100
+    # max number of listings sent to the LLM per run. When a run finds more than that, the ones priced highest
+    # compared to the market are skipped. Unlimited if not set
+    llm_max_listings_per_run: Optional[int] = None
+
+    # cache of earlier LLM classifications, so reposts of a listing reuse its verdict instead of paying for a new call
+    classification_cache_enabled: bool = True
+    classification_cache_path: Path = (
+        Path(tempfile.gettempdir()) / "craigslist_classification_cache.sqlite3"
+    )
+    classification_cache_ttl_days: float = 30
+    classification_cache_max_entries: int = 10_000
+    # min estimated similarity of title + body for a near-duplicate listing to reuse a cached verdict
+    classification_cache_min_similarity: float = 0.8
+    # rule-based pre-filter rejecting obviously bad listings before the LLM. Rules are loaded from the given JSON
+    # file (a list of `prefilter.PrefilterRule` objects) when set, otherwise the defaults in `prefilter.py` are used
+    prefilter_enabled: bool = True
+    prefilter_rules_path: Optional[Path] = None
     # llm_models: List[str] = ["claude-haiku-4-5", "claude-sonnet-4-5"]
 
     # twilio config
@@ -30,7 +122,74 @@ class Config(BaseSettings):
     # service identifier for our twilio SMS messaging service
     twilio_messaging_service_sid: str
     twilio_to_number: str  # phone number we are sending the twilio message ot
+    twilio_api_base_url: Optional[str] = None  # overrides https://api.twilio.com, e.g. for a local fake
+    # to run several people's watches over the same listings, set this to a JSON list of `models.WatchProfile` objects.
+    # Each listing is then fetched and parsed once and checked against every watch in the same LLM requests, and
+    # alerts go to each watch's own numbers instead of `twilio_to_number`, see `watches.py`
+    watch_profiles: List[WatchProfile] = []
+    # alerts for good bikes found within this many seconds of each other are merged into a single digest message
+    alert_digest_window_seconds: float = 0.0
+    alert_max_retries: int = 3
+    # URLs we've already alerted on, so a retried run doesn't alert twice. Only kept once set, to a persistent disk -
+    # the cloud function's /tmp doesn't survive cold starts
+    alert_sent_path: Optional[Path] = None
+
+    # per-run metrics: timings of every stage, LLM tokens and bytes downloaded. A JSON summary is logged at the end of
+    # every run, and also written to these paths when set - the Prometheus one in the text format, e.g. for
+    # node_exporter's textfile collector
+    metrics_enabled: bool = True
+    metrics_json_path: Optional[Path] = None
+    metrics_prometheus_path: Optional[Path] = None
+
+    @field_validator("search_profiles")
+    @classmethod
+    def _search_names_are_unique(
+        cls, profiles: List[SearchProfile]
+    ) -> List[SearchProfile]:
+        names = [profile.name for profile in profiles]
+        if len(set(names)) != len(names):
+            raise ValueError(f"search profile names must be unique, got {names}")
+        return profiles
+
+    @field_validator("watch_profiles")
+    @classmethod
+    def _watch_names_are_unique(
+        cls, watches: List[WatchProfile]
+    ) -> List[WatchProfile]:
+        names = [watch.name for watch in watches]
+        if len(set(names)) != len(names):
+            raise ValueError(f"watch profile names must be unique, got {names}")
+        return watches
+
+    def get_search_profiles(self) -> List[SearchProfile]:
+        """
+        :return: The searches to watch - `search_profiles` if set, otherwise the single search given by the `search_*`
+            settings
+        """
+        if self.search_profiles:
+            return self.search_profiles
+        return [
+            SearchProfile(
+                name="default",
+                search_path=self.search_path,
+                lat=self.search_lat,
+                lon=self.search_lon,
+                distance_miles=self.search_distance_miles,
+                url_base=self.search_url_base,
+            )
+        ]
 
     model_config = SettingsConfigDict(
         env_file=Path(__file__).parent.parent / ".env", env_file_encoding="utf-8"
     )
+
+
+@lru_cache(maxsize=None)
+def get_config() -> Config:
+    """
+    Get the process-wide config, loaded from the environment on first use. A warm cloud function instance reuses it
+    across invocations, so changed settings are picked up by the next cold start.
+
+    :return: Shared Config instance
+    """
+    return Config()
@@ -0,0 +1,322 @@
+"""
+Clients shared across runs. A warm cloud function instance handles invocation after invocation in the same process,
+so the config, CDC state stores, LLM classifier, listing fetcher and Twilio client are built once, on first use, and
+reused. The heavy SDKs (langchain, anthropic, twilio) are only imported when a client that needs them is first built,
+so a run that finds no new listings never pays for them.
+"""
+
+import logging
+import threading
+import time
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Union
+
+from cdc_state import CachedStateStore, StateStore, get_state_store
+from config import Config, get_config
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from twilio.rest import Client
+
+    from archive import ListingArchive
+    from listing_index import ListingIndex
+    from llm_classifier import BikeClassifier
+    from notifier import AlertDispatcher
+    from pricing import MarketValueScorer
+    from scraper import ListingFetcher
+    from watches import WatchNotifier, WatchSet
+
+log = logging.getLogger(__name__)
+
+
+def build_classifier(
+    config: Config, chat_model: Optional["BaseChatModel"] = None
+) -> "BikeClassifier":
+    """
+    Build the LLM classifier, with the classification cache and pre-filter if they're enabled.
+
+    :param config: Application config
+    :param chat_model: Chat model to classify with instead of Claude, e.g. a stub in benchmarks
+    :return: BikeClassifier instance
+    """
+    from classification_cache import ClassificationCache
+    from llm_classifier import BikeClassifier
+    from prefilter import PreFilter
+    from prompt_builder import PromptBuilder
+
+    cache = None
+    if config.classification_cache_enabled:
+        cache = ClassificationCache(
+            config.classification_cache_path,
+            ttl_seconds=config.classification_cache_ttl_days * 24 * 3600,
+            max_entries=config.classification_cache_max_entries,
+            min_similarity=config.classification_cache_min_similarity,
+        )
+    prefilter = None
+    if config.prefilter_enabled:
+        prefilter = (
+            PreFilter.from_file(config.prefilter_rules_path)
+            if config.prefilter_rules_path
+            else PreFilter()
+        )
+    return BikeClassifier(
+        api_key=config.anthropic_api_key,
+        cache=cache,
+        prefilter=prefilter,
+        batch_size=config.llm_batch_size,
+        max_concurrency=config.llm_max_concurrency,
+        max_retries=config.llm_max_retries,
+        chat_model=chat_model,
+        prompt_builder=PromptBuilder(
+            max_description_tokens=config.llm_description_max_tokens
+        ),
+    )
+
+
+def build_fetcher(config: Config) -> "ListingFetcher":
+    """
+    :param config: Application config
+    :return: ListingFetcher with the configured rate limits and retries
+    """
+    from scraper import ListingFetcher
+
+    return ListingFetcher(
+        max_workers=config.fetch_max_workers,
+        max_concurrency_per_host=config.fetch_max_concurrency_per_host,
+        requests_per_second=config.fetch_requests_per_second,
+        burst=config.fetch_burst,
+        max_retries=config.fetch_max_retries,
+    )
+
+
+def build_dispatcher(
+    config: Config,
+    client: Optional["Client"] = None,
+    to_number: Optional[str] = None,
+    sent_alerts_path: Optional[Path] = None,
+) -> "AlertDispatcher":
+    """
+    :param config: Application config
+    :param client: Twilio client to send with, built from the config if not given
+    :param to_number: Phone number to send alerts to, defaults to the configured one
+    :param sent_alerts_path: Database of listings alerted on, defaults to the configured one
+    :return: AlertDispatcher sending alerts to the number
+    """
+    from notifier import AlertDispatcher
+
+    return AlertDispatcher(
+        account_sid=config.twilio_account_sid,
+        auth_token=config.twilio_auth_token,
+        to_number=to_number or config.twilio_to_number,
+        sent_alerts_path=sent_alerts_path or config.alert_sent_path,
+        digest_window_seconds=config.alert_digest_window_seconds,
+        max_retries=config.alert_max_retries,
+        api_base_url=config.twilio_api_base_url,
+        client=client,
+    )
+
+
+def build_watch_set(config: Config) -> Optional["WatchSet"]:
+    """
+    :param config: Application config
+    :return: WatchSet of the configured watch profiles, or None if there are none
+    """
+    if not config.watch_profiles:
+        return None
+    from watches import WatchSet
+
+    return WatchSet(config.watch_profiles)
+
+
+def build_notifier(
+    config: Config,
+    watches: Optional["WatchSet"] = None,
+    client: Optional["Client"] = None,
+) -> Union["AlertDispatcher", "WatchNotifier"]:
+    """
+    :param config: Application config
+    :param watches: Watches to send alerts for, if any
+    :param client: Twilio client to send with, built from the config if not given
+    :return: WatchNotifier sending each watch's alerts to its recipients, or with no watches, an AlertDispatcher sending
+        to the configured number
+    """
+    if watches is None:
+        return build_dispatcher(config, client=client)
+    from watches import WatchNotifier, sent_alerts_path_for
+
+    return WatchNotifier(
+        watches,
+        dispatcher_for=lambda to_number: build_dispatcher(
+            config,
+            client=client,
+            to_number=to_number,
+            sent_alerts_path=sent_alerts_path_for(config.alert_sent_path, to_number),
+        ),
+    )
+
+
+def build_archive(config: Config) -> Optional["ListingArchive"]:
+    """
+    :param config: Application config
+    :return: ListingArchive at the configured path, or None if archiving is disabled or no path is set
+    """
+    if not config.archive_enabled or config.archive_path is None:
+        return None
+    from archive import ListingArchive
+
+    return ListingArchive(
+        config.archive_path,
+        compact_min_segments=config.archive_compact_min_segments,
+        target_segment_rows=config.archive_target_segment_rows,
+    )
+
+
+def build_listing_index(config: Config) -> Optional["ListingIndex"]:
+    """
+    :param config: Application config
+    :return: ListingIndex at the configured path, or None if indexing is disabled or no path is set
+    """
+    if not config.listing_index_enabled or config.listing_index_path is None:
+        return None
+    from listing_index import ListingIndex
+
+    return ListingIndex(config.listing_index_path)
+
+
+def build_market_scorer(
+    config: Config, archive: Optional["ListingArchive"]
+) -> Optional["MarketValueScorer"]:
+    """
+    :param config: Application config
+    :param archive: Archive to read earlier prices from
+    :return: MarketValueScorer over the configured lookback, or None if scoring or the archive is disabled
+    """
+    if not config.market_scoring_enabled or archive is None:
+        return None
+    from pricing import MarketValueScorer
+
+    return MarketValueScorer.from_archive(
+        archive,
+        since=time.time() - config.market_lookback_days * 24 * 3600,
+        min_samples=config.market_min_samples,
+    )
+
+
+def log_classifier_stats(classifier: "BikeClassifier") -> None:
+    """Log LLM usage, and pre-filter and cache stats if they're enabled"""
+    classifier.log_usage()
+    if classifier.prefilter:
+        classifier.prefilter.log_stats()
+    if classifier.cache:
+        classifier.cache.log_stats()
+
+
+class AppContainer:
+    """
+    Builds each long-lived client the first time it's needed and hands out the same one from then on. The alert
+    dispatcher is the exception: its sender thread is stopped at the end of every run, so each run gets a new one
+    sending through the shared Twilio client.
+    """
+
+    def __init__(self, config: Config, cache_state: bool = False):
+        """
+        :param config: Application config to build clients from
+        :param cache_state: Keep each search's CDC snapshot in memory between runs instead of reading it back from
+            its store every run. Only for a process that's the sole writer of the state, like `worker.py`
+        """
+        self.config = config
+        self.cache_state = cache_state
+        self._state_stores: Dict[str, StateStore] = {}
+        self._lock = threading.Lock()
+        self._market_scorer: Optional["MarketValueScorer"] = None
+        self._market_scorer_built_at: Optional[float] = None
+
+    def state_store(self, key: str = "default") -> StateStore:
+        """
+        :param key: Name of the search whose snapshot the store holds
+        :return: The search's CDC state store
+        """
+        with self._lock:
+            if key not in self._state_stores:
+                store = get_state_store(self.config, key=key)
+                if self.cache_state:
+                    store = CachedStateStore(store)
+                self._state_stores[key] = store
+            return self._state_stores[key]
+
+    @cached_property
+    def classifier(self) -> "BikeClassifier":
+        return build_classifier(self.config)
+
+    @cached_property
+    def fetcher(self) -> "ListingFetcher":
+        return build_fetcher(self.config)
+
+    @cached_property
+    def watch_set(self) -> Optional["WatchSet"]:
+        return build_watch_set(self.config)
+
+    @cached_property
+    def archive(self) -> Optional["ListingArchive"]:
+        return build_archive(self.config)
+
+    @cached_property
+    def listing_index(self) -> Optional["ListingIndex"]:
+        return build_listing_index(self.config)
+
+    def market_scorer(self) -> Optional["MarketValueScorer"]:
+        """
+        :return: Scorer of listings against archived prices, re-read from the archive once it's older than
+            `market_refresh_minutes`. None if scoring or the archive is disabled
+        """
+        with self._lock:
+            if (
+                self._market_scorer_built_at is None
+                or time.monotonic() - self._market_scorer_built_at
+                >= self.config.market_refresh_minutes * 60
+            ):
+                self._market_scorer = build_market_scorer(self.config, self.archive)
+                self._market_scorer_built_at = time.monotonic()
+            return self._market_scorer
+
+    @cached_property
+    def twilio_client(self) -> "Client":
+        from notifier import build_twilio_client
+
+        return build_twilio_client(
+            self.config.twilio_account_sid,
+            self.config.twilio_auth_token,
+            api_base_url=self.config.twilio_api_base_url,
+        )
+
+    def dispatcher(self) -> Union["AlertDispatcher", "WatchNotifier"]:
+        """
+        :return: A new AlertDispatcher for this run - or with watch profiles configured, a WatchNotifier - sending
+            through the shared Twilio client
+        """
+        return build_notifier(self.config, self.watch_set, client=self.twilio_client)
+
+    def start_run(self) -> None:
+        """Reset the stats of clients built by earlier runs, so each run logs only its own"""
+        from http_client import get_http_client
+
+        get_http_client().reset_stats()
+        if "classifier" in self.__dict__:
+            self.classifier.reset_stats()
+        if self.__dict__.get("archive"):
+            self.archive.reset_stats()
+        if self.__dict__.get("listing_index"):
+            self.listing_index.reset_stats()
+        if self.__dict__.get("watch_set"):
+            self.watch_set.reset_stats()
+
+
+@lru_cache(maxsize=None)
+def get_container() -> AppContainer:
+    """
+    Get the process-wide container, built from the process-wide config on first use.
+
+    :return: Shared AppContainer instance
+    """
+    return AppContainer(get_config())
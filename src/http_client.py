@@ -0,0 +1,300 @@
+"""Shared HTTP client for all Craigslist I/O"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.request import ACCEPT_ENCODING
+
+from metrics import get_metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"
+
+# timings of the request currently being sent on this thread, filled in by our connection classes when the request
+# needs a new connection
+_current_timings = threading.local()
+
+
+@dataclass
+class RequestTimings:
+    """
+    Timing breakdown of a single request, in seconds. `connect` (DNS lookup and TCP connect) and `tls` are zero when
+    the request reused a pooled connection. `body` is zero for streamed responses, whose body is read by the caller.
+    """
+
+    connect: float = 0.0
+    tls: float = 0.0
+    ttfb: float = 0.0
+    body: float = 0.0
+    total: float = 0.0
+    new_connection: bool = False
+    bytes_received: int = 0
+    not_modified: bool = False
+
+
+@dataclass
+class HostStats:
+    """Aggregate request stats for a single host"""
+
+    requests: int = 0
+    new_connections: int = 0
+    not_modified: int = 0
+    bytes_received: int = 0
+    connect_seconds: float = 0.0
+    tls_seconds: float = 0.0
+    ttfb_seconds: float = 0.0
+    body_seconds: float = 0.0
+    status_counts: Dict[int, int] = field(default_factory=dict)
+
+
+class _TimedConnectionMixin:
+    """
+    Records connect (DNS lookup and TCP connect, which urllib3 does in one call) and TLS handshake times of new
+    connections into the current request's timings
+    """
+
+    def _new_conn(self):
+        timings: Optional[RequestTimings] = getattr(_current_timings, "value", None)
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        if timings is not None:
+            timings.new_connection = True
+            timings.connect = time.perf_counter() - start
+        return sock
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        timings: Optional[RequestTimings] = getattr(_current_timings, "value", None)
+        if timings is not None and timings.new_connection:
+            timings.tls = max(0.0, time.perf_counter() - start - timings.connect)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+@dataclass
+class CachedPayload:
+    """What's kept of a response for conditional requests: its validators, and what the caller parsed out of it"""
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    payload: Any
+
+
+class HttpClient:
+    """
+    HTTP client shared by CDC and the scraper. Keeps a pool of keep-alive connections per host (e.g. sapi vs sfbay),
+    negotiates compressed responses, optionally revalidates earlier responses with ETag/If-Modified-Since, and records
+    per-request timing stats.
+
+    Conditional requests only keep each response's validators and the payload its caller parsed out of it (see
+    `store`), rather than the whole response, so a 304 hands back that payload.
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 10,
+        max_cached_payloads: int = 128,
+        user_agent: str = DEFAULT_USER_AGENT,
+    ):
+        """
+        Initialize the HTTP client.
+
+        :param pool_maxsize: Max number of pooled connections kept open per host. Should be at least the number of
+            concurrent requests we send to a single host
+        :param max_cached_payloads: Max number of parsed payloads kept around for conditional requests
+        :param user_agent: Default User-Agent header
+        """
+        self.session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "User-Agent": user_agent,
+                # everything urllib3 can decode here: gzip/deflate, plus brotli/zstd when their packages are installed
+                "Accept-Encoding": ACCEPT_ENCODING,
+            }
+        )
+
+        self.max_cached_payloads = max_cached_payloads
+        self.stats: Dict[str, HostStats] = {}
+
+        # LRU of the validators (ETag/Last-Modified) and parsed payload of the last response per URL, for conditional
+        # requests
+        self._cached_payloads: OrderedDict[str, CachedPayload] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        timeout: float = 10,
+        stream: bool = False,
+        conditional: bool = False,
+    ) -> requests.Response:
+        """
+        Send a GET request.
+
+        :param url: URL to fetch
+        :param params: Query string parameters
+        :param headers: Headers to send on top of the client's defaults
+        :param timeout: Request timeout in seconds
+        :param stream: Don't read the response body up front, see `requests`
+        :param conditional: Revalidate the payload `store`d for this URL, if any, with If-None-Match/If-Modified-Since.
+            Ignored for streamed requests
+        :return: The response, with a `timings` attribute holding its RequestTimings and a `payload` attribute holding
+            the stored payload on a 304, None otherwise
+        """
+        conditional = conditional and not stream
+        request = self.session.prepare_request(
+            requests.Request("GET", url, params=params, headers=headers)
+        )
+
+        cached = None
+        if conditional:
+            with self._lock:
+                cached = self._cached_payloads.get(request.url)
+                if cached is not None:
+                    self._cached_payloads.move_to_end(request.url)
+            if cached is not None:
+                if cached.etag:
+                    request.headers["If-None-Match"] = cached.etag
+                if cached.last_modified:
+                    request.headers["If-Modified-Since"] = cached.last_modified
+
+        timings = RequestTimings()
+        _current_timings.value = timings
+        start = time.perf_counter()
+        try:
+            response = self.session.send(request, timeout=timeout, stream=stream)
+        finally:
+            _current_timings.value = None
+
+        timings.total = time.perf_counter() - start
+        timings.ttfb = max(
+            0.0,
+            response.elapsed.total_seconds() - timings.connect - timings.tls,
+        )
+        if not stream:
+            timings.body = max(0.0, timings.total - response.elapsed.total_seconds())
+            # compressed size on the wire, rather than the decoded body size
+            timings.bytes_received = response.raw.tell() or len(response.content)
+
+        response.payload = None
+        if response.status_code == 304 and cached is not None:
+            timings.not_modified = True
+            response.payload = cached.payload
+
+        self._record(urlsplit(url).netloc, response.status_code, timings)
+        response.timings = timings
+        return response
+
+    def store(self, response: requests.Response, payload: Any) -> None:
+        """
+        Keep what a caller parsed out of a response, for a later conditional request for the same URL to get back on a
+        304. Responses without an ETag or Last-Modified header can't be revalidated, so aren't kept.
+
+        :param response: 200 response returned by `get`
+        :param payload: What the caller parsed out of the response, e.g. a BikeListingData
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+        url = response.request.url
+        with self._lock:
+            self._cached_payloads[url] = CachedPayload(etag, last_modified, payload)
+            self._cached_payloads.move_to_end(url)
+            while len(self._cached_payloads) > self.max_cached_payloads:
+                self._cached_payloads.popitem(last=False)
+
+    def _record(self, host: str, status_code: int, timings: RequestTimings) -> None:
+        with self._lock:
+            stats = self.stats.setdefault(host, HostStats())
+            stats.requests += 1
+            stats.new_connections += timings.new_connection
+            stats.not_modified += timings.not_modified
+            stats.bytes_received += timings.bytes_received
+            stats.connect_seconds += timings.connect
+            stats.tls_seconds += timings.tls
+            stats.ttfb_seconds += timings.ttfb
+            stats.body_seconds += timings.body
+            stats.status_counts[status_code] = (
+                stats.status_counts.get(status_code, 0) + 1
+            )
+        metrics = get_metrics()
+        metrics.inc("http_requests_total", host=host, status=status_code)
+        if timings.bytes_received:
+            metrics.inc("http_response_bytes_total", timings.bytes_received, host=host)
+
+    def reset_stats(self) -> None:
+        """Start counting from zero, e.g. at the start of each run of a client reused across runs"""
+        with self._lock:
+            self.stats = {}
+
+    def log_stats(self) -> None:
+        """Log a summary of the requests sent to each host"""
+        with self._lock:
+            for host, stats in self.stats.items():
+                log.info(
+                    f"{host}: {stats.requests} requests over {stats.new_connections} connections, "
+                    f"{stats.bytes_received / 1024:.0f}KB received, {stats.not_modified} not modified, "
+                    f"avg connect={_avg_ms(stats.connect_seconds, stats):.1f}ms "
+                    f"tls={_avg_ms(stats.tls_seconds, stats):.1f}ms ttfb={_avg_ms(stats.ttfb_seconds, stats):.1f}ms "
+                    f"body={_avg_ms(stats.body_seconds, stats):.1f}ms"
+                )
+
+
+def _avg_ms(seconds: float, stats: HostStats) -> float:
+    """
+    :param seconds: Total time spent on a phase of the requests to a host
+    :param stats: Stats of that host
+    :return: Average time per request in ms
+    """
+    return seconds / stats.requests * 1000
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> HttpClient:
+    """
+    Get the process-wide HTTP client, so connections are reused across every request we make to Craigslist.
+
+    :return: Shared HttpClient instance
+    """
+    return HttpClient()
@@ -0,0 +1,399 @@
+"""
+Persistent inverted index over every listing we parse, so history can be queried by attribute, price, frame size and
+words in the listing without rescanning raw data - e.g. Cannondale, 54-56cm, carbon, under $1500, last 30 days.
+
+Listings are stored once in SQLite with their parsed price and frame size, which have B-tree indexes for range
+queries. The words of each text attribute (manufacturer, model, frame material, bicycle type, condition) and of the
+title + body are normalized into terms, e.g. `manufacturer:cannondale` or `text:ultegra`, each with a posting list of
+the listings containing it: rows of a table clustered on (term, listing), so a posting list is read as one range.
+Queries start from the posting list of their rarest term and probe the others for each of its listings. Listing ids
+are the millisecond they were indexed at, so posting lists are in time order: the newest listings are at the end of
+one, and a time range is a range of it.
+
+Run `python listing_index.py --help` to query the index from the command line.
+"""
+
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from models import BikeListingData, ListingQuery
+from pricing import parse_frame_size_cm, parse_price
+
+log = logging.getLogger(__name__)
+
+# listing attributes indexed word by word, under a term prefixed with the attribute's name
+ATTRIBUTES = ("manufacturer", "model", "frame_material", "bicycle_type", "condition")
+# prefix of the terms indexing the words of a listing's title and body
+TEXT = "text"
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _listing_id(indexed_at: float) -> int:
+    # a listing's id is the millisecond it was indexed at, moved up past any listing indexed in the same millisecond.
+    # So posting lists, clustered by (term, listing id), are in time order, and a time range is a range of ids
+    return int(indexed_at * 1000)
+
+
+def _words(text: Optional[str]) -> Set[str]:
+    return set(_WORD.findall((text or "").lower()))
+
+
+def listing_terms(listing: BikeListingData) -> Set[str]:
+    """
+    :param listing: Parsed listing
+    :return: Every term the listing is indexed under
+    """
+    terms = {
+        f"{attribute}:{word}"
+        for attribute in ATTRIBUTES
+        for word in _words(getattr(listing, attribute))
+    }
+    terms.update(f"{TEXT}:{word}" for word in _words(f"{listing.title} {listing.body}"))
+    return terms
+
+
+def query_terms(query: ListingQuery) -> Set[str]:
+    """
+    :param query: Query over the index
+    :return: Terms a listing must be indexed under to match the query
+    """
+    terms = {
+        f"{attribute}:{word}"
+        for attribute in ATTRIBUTES
+        for word in _words(getattr(query, attribute))
+    }
+    terms.update(f"{TEXT}:{word}" for word in _words(query.text))
+    return terms
+
+
+@dataclass
+class IndexStats:
+    listings_added: int = 0
+    # listings already in the index, e.g. listings found again by a backfill
+    duplicates_skipped: int = 0
+    queries: int = 0
+    query_seconds: float = 0.0
+
+
+class ListingIndex:
+    """
+    SQLite-backed inverted index of listings. Listings added during a run are buffered in memory and written in one
+    transaction by `flush`. Safe to add to from several threads, and to query from other processes while it's written.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Path to the SQLite database file, created if it doesn't exist
+        """
+        self.path = Path(path)
+        self.stats = IndexStats()
+        self._pending: List[Tuple[BikeListingData, float]] = []
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            # readers don't block the writer, e.g. a query from the command line during a run
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL UNIQUE,
+                    indexed_at REAL NOT NULL,
+                    price REAL,
+                    frame_size_cm REAL,
+                    listing TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS listings_by_price ON listings (price);
+                CREATE INDEX IF NOT EXISTS listings_by_frame_size ON listings (frame_size_cm);
+                CREATE TABLE IF NOT EXISTS terms (
+                    id INTEGER PRIMARY KEY,
+                    term TEXT NOT NULL UNIQUE,
+                    listings INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    term_id INTEGER NOT NULL,
+                    listing_id INTEGER NOT NULL,
+                    PRIMARY KEY (term_id, listing_id)
+                ) WITHOUT ROWID;
+                """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, listing: BikeListingData, indexed_at: Optional[float] = None) -> None:
+        """
+        Buffer a parsed listing, to be written by the next `flush`.
+
+        :param listing: Parsed listing
+        :param indexed_at: Unix epoch timestamp to index it at, defaults to now
+        """
+        with self._lock:
+            self._pending.append((listing, indexed_at or time.time()))
+
+    def flush(self) -> int:
+        """
+        Write the buffered listings and their postings in one transaction. Listings whose URL is already indexed are
+        skipped.
+
+        :return: Number of listings added
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+
+        added = 0
+        with self._connect() as conn:
+            postings: Dict[str, List[int]] = {}
+            last_id = 0
+            for listing, indexed_at in sorted(pending, key=lambda item: item[1]):
+                if conn.execute(
+                    "SELECT 1 FROM listings WHERE url = ?", (listing.url,)
+                ).fetchone():
+                    continue
+                listing_id = max(_listing_id(indexed_at), last_id + 1)
+                while True:
+                    try:
+                        conn.execute(
+                            "INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?)",
+                            (
+                                listing_id,
+                                listing.url,
+                                indexed_at,
+                                parse_price(listing.price),
+                                parse_frame_size_cm(listing.frame_size),
+                                listing.model_dump_json(),
+                            ),
+                        )
+                        break
+                    except sqlite3.IntegrityError:
+                        # another listing indexed in the same millisecond
+                        listing_id += 1
+                last_id = listing_id
+                added += 1
+                for term in listing_terms(listing):
+                    postings.setdefault(term, []).append(listing_id)
+
+            conn.executemany(
+                "INSERT INTO terms (term, listings) VALUES (?, ?) "
+                "ON CONFLICT (term) DO UPDATE SET listings = listings + excluded.listings",
+                [(term, len(listing_ids)) for term, listing_ids in postings.items()],
+            )
+            term_ids = self._term_ids(conn, postings)
+            conn.executemany(
+                "INSERT INTO postings VALUES (?, ?)",
+                [
+                    (term_ids[term], listing_id)
+                    for term, listing_ids in postings.items()
+                    for listing_id in listing_ids
+                ],
+            )
+
+        with self._lock:
+            self.stats.listings_added += added
+            self.stats.duplicates_skipped += len(pending) - added
+        log.info(f"Indexed {added} listings ({len(pending) - added} already indexed)")
+        return added
+
+    @staticmethod
+    def _term_ids(conn: sqlite3.Connection, terms) -> Dict[str, int]:
+        """Ids of the terms, in chunks of fewer than SQLite's max number of query parameters"""
+        terms = list(terms)
+        term_ids = {}
+        for start in range(0, len(terms), 500):
+            chunk = terms[start : start + 500]
+            term_ids.update(
+                conn.execute(
+                    f"SELECT term, id FROM terms WHERE term IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            )
+        return term_ids
+
+    def query(self, query: ListingQuery) -> List[BikeListingData]:
+        """
+        :param query: Criteria for the listings to find
+        :return: Matching listings, most recently indexed first
+        """
+        start = time.perf_counter()
+        with self._connect() as conn:
+            listings = self._query(conn, query)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats.queries += 1
+            self.stats.query_seconds += elapsed
+        log.debug(f"Query {query} matched {len(listings)} listings in {elapsed:.4f}s")
+        return listings
+
+    def _query(
+        self, conn: sqlite3.Connection, query: ListingQuery
+    ) -> List[BikeListingData]:
+        conditions, params = [], []
+
+        def in_range(column: str, low: Optional[float], high: Optional[float]):
+            bounds = []
+            if low is not None:
+                bounds.append(f"l.{column} >= ?")
+                params.append(low)
+            if high is not None:
+                bounds.append(f"l.{column} <= ?")
+                params.append(high)
+            if not bounds:
+                return
+            condition = " AND ".join(bounds)
+            if query.include_missing:
+                condition = f"(l.{column} IS NULL OR ({condition}))"
+            conditions.append(condition)
+
+        in_range("price", query.min_price, query.max_price)
+        in_range("frame_size_cm", query.min_frame_size_cm, query.max_frame_size_cm)
+        if query.since is not None:
+            conditions.append("l.indexed_at >= ?")
+            params.append(query.since)
+        if query.until is not None:
+            conditions.append("l.indexed_at < ?")
+            params.append(query.until)
+
+        terms = query_terms(query)
+        if terms:
+            found = conn.execute(
+                f"SELECT id, listings FROM terms WHERE term IN ({', '.join('?' * len(terms))})",
+                list(terms),
+            ).fetchall()
+            if len(found) < len(terms):
+                # a term no listing has, so nothing matches
+                return []
+            # walk the rarest term's posting list, newest first, probing the others' for each of its listings before
+            # reading the listing itself
+            (rarest, _), *others = sorted(found, key=lambda row: row[1])
+            driver = "p.listing_id"
+            sql = (
+                "SELECT l.listing FROM postings p CROSS JOIN listings l ON l.id = p.listing_id "
+                "WHERE p.term_id = ?"
+            )
+            driver_params = [rarest]
+            for term_id, _ in others:
+                conditions.insert(
+                    0,
+                    "EXISTS (SELECT 1 FROM postings WHERE term_id = ? AND listing_id = p.listing_id)",
+                )
+                params.insert(0, term_id)
+        else:
+            driver = "l.id"
+            sql = "SELECT l.listing FROM listings l WHERE 1"
+            driver_params = []
+        if query.since is not None:
+            # listing ids are their index time, so a time range is a range of the posting list or table we walk
+            sql += f" AND {driver} >= ?"
+            driver_params.append(_listing_id(query.since))
+
+        sql += "".join(f" AND {condition}" for condition in conditions)
+        params = driver_params + params
+        sql += f" ORDER BY {driver} DESC"
+        if query.limit is not None:
+            sql += " LIMIT ?"
+            params.append(query.limit)
+        return [
+            BikeListingData.model_validate_json(row[0])
+            for row in conn.execute(sql, params)
+        ]
+
+    def count(self) -> int:
+        """
+        :return: Number of listings in the index
+        """
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def reset_stats(self) -> None:
+        """Start counting from zero, e.g. at the start of each run of a long-lived index"""
+        with self._lock:
+            self.stats = IndexStats()
+
+    def log_stats(self) -> None:
+        """Log how many listings were indexed, and the time spent on queries"""
+        stats = self.stats
+        log.info(
+            f"Listing index: {stats.listings_added} listings added, {stats.duplicates_skipped} already indexed, "
+            f"{stats.queries} queries in {stats.query_seconds:.3f}s"
+        )
+
+
+def _parse_range(value: str) -> Tuple[Optional[float], Optional[float]]:
+    """(low, high) from `54-56`, `54-` or `-56`"""
+    low, _, high = value.partition("-")
+    return (float(low) if low else None, float(high) if high else None)
+
+
+def main():
+    from config import get_config
+
+    parser = argparse.ArgumentParser(
+        description="Query the index of listings parsed by earlier runs"
+    )
+    for attribute in ATTRIBUTES:
+        parser.add_argument(f"--{attribute.replace('_', '-')}")
+    parser.add_argument("--text", help="Words that must appear in the title or body")
+    parser.add_argument("--price", help="Price range, e.g. `500-1500` or `-1500`")
+    parser.add_argument("--frame-size", help="Frame size range in cm, e.g. `54-56`")
+    parser.add_argument("--days", type=float, help="Only listings from the last N days")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument(
+        "--watch",
+        help="Instead, list the listings passing the pre-checks of this configured watch profile",
+    )
+    args = parser.parse_args()
+
+    config = get_config()
+    if config.listing_index_path is None:
+        parser.error("set LISTING_INDEX_PATH to the index written by earlier runs")
+    index = ListingIndex(config.listing_index_path)
+    since = time.time() - args.days * 86400 if args.days else None
+
+    min_price, max_price = _parse_range(args.price) if args.price else (None, None)
+    min_frame, max_frame = (
+        _parse_range(args.frame_size) if args.frame_size else (None, None)
+    )
+    query = ListingQuery(
+        **{attribute: getattr(args, attribute) for attribute in ATTRIBUTES},
+        text=args.text,
+        min_price=min_price,
+        max_price=max_price,
+        min_frame_size_cm=min_frame,
+        max_frame_size_cm=max_frame,
+        since=since,
+        limit=args.limit,
+    )
+    start = time.perf_counter()
+    if args.watch:
+        from watches import past_candidates
+
+        watches = {watch.name: watch for watch in config.watch_profiles}
+        if args.watch not in watches:
+            parser.error(f"no watch profile named {args.watch}")
+        listings = past_candidates(index, watches[args.watch], since)
+    else:
+        listings = index.query(query)
+    elapsed = time.perf_counter() - start
+    for listing in listings:
+        print(
+            json.dumps(
+                listing.model_dump(
+                    include={"title", "price", "frame_size", "frame_material", "url"}
+                )
+            )
+        )
+    print(f"{len(listings)} listings in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,99 @@
+import asyncio
+import itertools
 import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import anthropic
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, HumanMessage
+
+from metrics import get_metrics
+from models import (
+    BatchClassification,
+    BikeClassification,
+    BikeListingData,
+    WatchBatchClassification,
+    WatchProfile,
+)
+from prompt_builder import PromptBuilder
+from rate_limit import AIMDLimiter, full_jitter_backoff
+
+if TYPE_CHECKING:
+    from classification_cache import ClassificationCache
+    from prefilter import PreFilter
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage
-from pydantic import BaseModel, Field
+log = logging.getLogger(__name__)
 
-from models import BikeListingData
+# reason given in the placeholder classification of a listing we failed to classify
+CLASSIFICATION_FAILED_REASON = "Classification failed"
+
+WATCH_SYSTEM_PROMPT = """You are a bike expert helping several people find bikes on Craigslist. Each of them has a watch \
+describing what they're looking for.
+
+YOUR TASK:
+For each bike, decide for every watch listed with it whether the bike is a good find for that watch. Return one \
+classification per bike per listed watch, with the bike's URL and the watch's name copied exactly as given, and \
+is_good, a one-sentence reason, and confidence ("high", "medium", or "low"). Judge each watch on its own criteria only.
+
+FOR EVERY WATCH, REJECT:
+- Listings too vague to judge against the watch's criteria, e.g. no component details when the watch asks for a groupset
+- Prices well above what the bike is worth
+- Bikes that aren't ride-ready, unless the watch asks for project bikes
+
+WATCHES:
+
+{watches}
+
+Now classify the following bikes:"""
+
+# 529 is Anthropic's "overloaded" status, which we back off from the same way as a 429
+RATE_LIMIT_STATUS_CODES = frozenset({429, 529})
+
+
+def is_failed_classification(classification: BikeClassification) -> bool:
+    """Whether a classification is the placeholder for a listing we failed to classify, rather than a real verdict"""
+    return classification.reason.startswith(f"{CLASSIFICATION_FAILED_REASON}:")
 
-log = logging.getLogger(__name__)
 
+def _is_rate_limited(error: Exception) -> bool:
+    return (
+        isinstance(error, anthropic.APIStatusError)
+        and error.status_code in RATE_LIMIT_STATUS_CODES
+    )
 
-class BikeClassification(BaseModel):
-    """Structured output for bike classification."""
 
-    is_good: bool = Field(description="Whether this is a good bike deal")
-    reason: str = Field(description="One-sentence explanation for the classification")
-    confidence: str = Field(description="Confidence level: 'high', 'medium', or 'low'")
+def _request_outcome(error: Optional[Exception]) -> str:
+    """Label for an LLM request's outcome in our metrics"""
+    if error is None:
+        return "ok"
+    if _is_rate_limited(error):
+        return "rate_limited"
+    return "error"
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether an LLM request error is transient: rate limits, server errors, and connection errors or timeouts"""
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and (
+        error.status_code in RATE_LIMIT_STATUS_CODES or error.status_code >= 500
+    )
+
+
+@dataclass
+class LLMUsage:
+    """Token usage summed over every LLM request made by a classifier"""
+
+    requests: int = 0
+    listings: int = 0
+    # total input tokens, including the ones read from or written to the prompt cache
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
 
 
 class BikeClassifier:
@@ -23,20 +102,68 @@ class BikeClassifier:
     Uses few-shot prompting with diverse examples and structured output.
     """
 
-    def __init__(self, api_key: str, model: str = "claude-sonnet-4-5"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "claude-sonnet-4-5",
+        cache: Optional["ClassificationCache"] = None,
+        prefilter: Optional["PreFilter"] = None,
+        batch_size: int = 5,
+        max_concurrency: int = 4,
+        max_retries: int = 4,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 30.0,
+        chat_model: Optional[BaseChatModel] = None,
+        prompt_builder: Optional[PromptBuilder] = None,
+    ):
         """
         Initialize the bike classifier.
 
         :param api_key: Anthropic API key
         :param model: Claude model to use
+        :param cache: Optional cache of earlier classifications, consulted before calling the LLM
+        :param prefilter: Optional rule-based pre-filter, rejecting obviously bad listings without calling the LLM
+        :param batch_size: Max number of listings `classify_batch` packs into a single LLM request
+        :param max_concurrency: Max number of LLM requests in flight at once from `aclassify_many`
+        :param max_retries: Max number of retries of an LLM request on rate limits and transient errors
+        :param backoff_base_seconds: Base delay for exponential backoff between retries
+        :param backoff_max_seconds: Upper bound on the delay between retries
+        :param chat_model: Chat model to use instead of Claude, e.g. a stub for offline benchmarks
+        :param prompt_builder: Formats listings for the prompts, defaults to one with the default description budget
         """
-        self.llm = ChatAnthropic(
-            api_key=api_key,
-            model=model,
-            temperature=0.0,  # Deterministic for consistent classifications
-        ).with_structured_output(
-            BikeClassification
-        )  # attach our structured output for pydantic validation on the LLM response
+        self.cache = cache
+        self.prefilter = prefilter
+        self.batch_size = batch_size
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.limiter = AIMDLimiter(max_limit=max_concurrency)
+        self.usage = LLMUsage()
+        self._usage_lock = threading.Lock()
+
+        if chat_model is None:
+            # langchain_anthropic takes a good part of a second to import, so only pay for it when we're calling Claude
+            from langchain_anthropic import ChatAnthropic
+
+            chat_model = ChatAnthropic(
+                api_key=api_key,
+                model=model,
+                temperature=0.0,  # Deterministic for consistent classifications
+                # we retry ourselves, so rate limits are visible to our limiter
+                max_retries=0,
+            )
+        # attach our structured output for pydantic validation on the LLM response. `include_raw` keeps the raw
+        # message around as well, so we can read its token usage
+        self.llm = chat_model.with_structured_output(
+            BikeClassification, include_raw=True
+        )
+        self.batch_llm = chat_model.with_structured_output(
+            BatchClassification, include_raw=True
+        )
+        self.watch_llm = chat_model.with_structured_output(
+            WatchBatchClassification, include_raw=True
+        )
 
         self.system_prompt = """You are a bike expert who identifies quality MODERN road bikes on Craigslist.
 
@@ -114,6 +241,240 @@ Classification:
 
 Now classify the following bike:"""
 
+    def _system_message(self) -> SystemMessage:
+        # the few-shot system prompt is the same for every request, so mark it as a prompt cache breakpoint: requests
+        # within the cache's TTL read it back at a fraction of the normal input token price
+        return SystemMessage(
+            content=[
+                {
+                    "type": "text",
+                    "text": self.system_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        )
+
+    def _single_messages(self, listing: BikeListingData) -> List[BaseMessage]:
+        return [
+            self._system_message(),
+            HumanMessage(
+                content=f"{self.prompt_builder.format_listing(listing)}\n\nClassification:"
+            ),
+        ]
+
+    def _batch_messages(self, listings: List[BikeListingData]) -> List[BaseMessage]:
+        bikes = "\n\n".join(
+            f"Bike {i}:\nURL: {listing.url}\n{self.prompt_builder.format_listing(listing)}"
+            for i, listing in enumerate(listings, 1)
+        )
+        return [
+            self._system_message(),
+            HumanMessage(
+                content=f"Classify each of the following {len(listings)} bikes independently. Return exactly one "
+                f"classification per bike, with the bike's URL copied exactly as given.\n\n{bikes}\n\nClassifications:"
+            ),
+        ]
+
+    @staticmethod
+    def _watch_system_message(watches: List[WatchProfile]) -> SystemMessage:
+        # every watch goes in, not just the ones a request's bikes are checked against, so the system prompt is the same
+        # for every request and read back from the prompt cache
+        criteria = "\n\n".join(
+            f'Watch "{watch.name}":\n{watch.criteria}' for watch in watches
+        )
+        return SystemMessage(
+            content=[
+                {
+                    "type": "text",
+                    "text": WATCH_SYSTEM_PROMPT.format(watches=criteria),
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        )
+
+    def _watch_messages(
+        self,
+        listings: List[BikeListingData],
+        candidates: List[List[WatchProfile]],
+        watches: List[WatchProfile],
+    ) -> List[BaseMessage]:
+        bikes = "\n\n".join(
+            f"Bike {i}:\nURL: {listing.url}\nWatches: {', '.join(watch.name for watch in listing_watches)}\n"
+            f"{self.prompt_builder.format_listing(listing)}"
+            for i, (listing, listing_watches) in enumerate(zip(listings, candidates), 1)
+        )
+        n_verdicts = sum(len(listing_watches) for listing_watches in candidates)
+        return [
+            self._watch_system_message(watches),
+            HumanMessage(
+                content=f"Classify each of the following {len(listings)} bikes against each of the watches listed with "
+                f"it. Return exactly {n_verdicts} classifications, one per bike per listed watch.\n\n{bikes}\n\n"
+                f"Classifications:"
+            ),
+        ]
+
+    def _retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """Seconds to wait before retrying a failed LLM request, or None if the request shouldn't be retried"""
+        if attempt >= self.max_retries or not _is_retryable(error):
+            return None
+        retry_after = None
+        if isinstance(error, anthropic.APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+        return full_jitter_backoff(
+            attempt, self.backoff_base_seconds, self.backoff_max_seconds, retry_after
+        )
+
+    def _invoke(self, llm, messages: List[BaseMessage], n_listings: int):
+        """
+        Call the LLM with structured output, retrying rate limits and transient errors. Raises if the response can't
+        be parsed.
+        """
+        metrics = get_metrics()
+        kind = "batch" if n_listings > 1 else "single"
+        for attempt in itertools.count():
+            try:
+                with metrics.timer("llm_request_seconds", kind=kind):
+                    response = llm.invoke(messages)
+                # parsed first, so a response we can't parse counts as an error rather than ok
+                result = self._parse_response(response, n_listings)
+                metrics.inc("llm_requests_total", outcome="ok")
+                return result
+            except Exception as e:
+                metrics.inc("llm_requests_total", outcome=_request_outcome(e))
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                log.warning(f"LLM request failed, retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+    async def _ainvoke(
+        self,
+        llm,
+        messages: List[BaseMessage],
+        n_listings: int,
+        deadline: Optional[float] = None,
+    ):
+        """
+        Async version of `_invoke`, sending requests through our AIMD limiter and giving up once `deadline` (in
+        `time.monotonic()` terms) has passed or would pass before the next retry.
+        """
+        metrics = get_metrics()
+        kind = "batch" if n_listings > 1 else "single"
+        for attempt in itertools.count():
+            started_at = await self.limiter.acquire()
+            try:
+                # we may have queued on the limiter for a while, so check the time left once we're let through
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Ran out of time before the function deadline")
+                with metrics.timer("llm_request_seconds", kind=kind):
+                    response = await asyncio.wait_for(llm.ainvoke(messages), remaining)
+                self.limiter.record_success()
+                result = self._parse_response(response, n_listings)
+                metrics.inc("llm_requests_total", outcome="ok")
+                return result
+            except Exception as e:
+                if not isinstance(e, TimeoutError):
+                    metrics.inc("llm_requests_total", outcome=_request_outcome(e))
+                if _is_rate_limited(e):
+                    self.limiter.record_rate_limited(started_at)
+                delay = self._retry_delay(attempt, e)
+                if delay is None or (deadline and time.monotonic() + delay >= deadline):
+                    raise
+                log.warning(f"LLM request failed, retrying in {delay:.1f}s: {e}")
+            finally:
+                await self.limiter.release()
+            await asyncio.sleep(delay)
+
+    def _parse_response(self, response: dict, n_listings: int):
+        self._record_usage(response["raw"], n_listings)
+        if response["parsing_error"] is not None:
+            raise response["parsing_error"]
+        if response["parsed"] is None:
+            raise ValueError("LLM response did not contain a structured output")
+        return response["parsed"]
+
+    def _record_usage(self, message: AIMessage, n_listings: int) -> None:
+        usage = getattr(message, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        metrics = get_metrics()
+        for token_type, count in [
+            ("input", usage.get("input_tokens", 0)),
+            ("output", usage.get("output_tokens", 0)),
+            ("cache_read", details.get("cache_read") or 0),
+            ("cache_write", details.get("cache_creation") or 0),
+        ]:
+            metrics.inc("llm_tokens_total", count, type=token_type)
+        with self._usage_lock:
+            self.usage.requests += 1
+            self.usage.listings += n_listings
+            self.usage.input_tokens += usage.get("input_tokens", 0)
+            self.usage.output_tokens += usage.get("output_tokens", 0)
+            self.usage.cache_read_tokens += details.get("cache_read") or 0
+            self.usage.cache_creation_tokens += details.get("cache_creation") or 0
+
+    def lookup(self, listing: BikeListingData) -> Optional[BikeClassification]:
+        """
+        Classify a listing without the LLM, if the pre-filter or the cache already knows its verdict.
+
+        :param listing: Parsed BikeListingData object
+        :return: The pre-filter's rejection or the cached verdict, or None if the listing needs the LLM
+        """
+        # obvious rejects (hybrids, e-bikes, Sora groupsets...) don't need an LLM to tell us they're bad
+        if self.prefilter:
+            rejection = self.prefilter.check(listing)
+            if rejection:
+                get_metrics().inc("classifications_total", source="prefilter")
+                return rejection
+
+        # reposts of a listing we've already classified reuse the earlier verdict
+        if self.cache:
+            cached = self.cache.get(listing)
+            if cached:
+                get_metrics().inc("classifications_total", source="cache")
+            return cached
+        return None
+
+    def _store(
+        self, listing: BikeListingData, classification: BikeClassification
+    ) -> BikeClassification:
+        log.info(
+            f"Classification result for {listing.title}: is_good={classification.is_good}, "
+            f"confidence={classification.confidence}, reason={classification.reason}"
+        )
+        get_metrics().inc("classifications_total", source="llm")
+        if self.cache:
+            self.cache.put(listing, classification)
+        return classification
+
+    def _match_batch(
+        self, listings: List[BikeListingData], batch: BatchClassification
+    ) -> List[Optional[BikeClassification]]:
+        """Match the classifications in a batch response back up with their listings by URL"""
+        by_url: Dict[str, BikeClassification] = {
+            result.url.strip(): BikeClassification(
+                is_good=result.is_good,
+                reason=result.reason,
+                confidence=result.confidence,
+            )
+            for result in batch.classifications
+        }
+        return [
+            self._store(listing, by_url[listing.url]) if listing.url in by_url else None
+            for listing in listings
+        ]
+
+    @staticmethod
+    def _failed(listing: BikeListingData, error: Exception) -> BikeClassification:
+        log.error(f"Failed to classify {listing.url}: {error}")
+        get_metrics().inc("classifications_total", source="failed")
+        # Create a failed classification object
+        return BikeClassification(
+            is_good=False,
+            reason=f"{CLASSIFICATION_FAILED_REASON}: {str(error)}",
+            confidence="low",
+        )
+
     def classify(self, listing: BikeListingData) -> BikeClassification:
         """
         Classify a bike listing as good or bad based on quality criteria.
@@ -121,59 +482,270 @@ Now classify the following bike:"""
         :param listing: Parsed BikeListingData object
         :return: BikeClassification object with is_good, reason, and confidence
         """
-        # Build a structured prompt matching the example format
-        user_message = f"""Title: "{listing.title}"
-Price: {listing.price or "Not listed"}
-Bicycle Type: {listing.bicycle_type or "Unknown"}
-Frame Size: {listing.frame_size or "Not specified"}
-Frame Material: {listing.frame_material or "Unknown"}
-Wheel Size: {listing.wheel_size or "Unknown"}
-Manufacturer: {listing.manufacturer or "Unknown"}
-Model: {listing.model or "Unknown"}
-Condition: {listing.condition or "Not specified"}
-Description: {listing.body[:500]}{"..." if len(listing.body) > 500 else ""}
-
-Classification:"""
-
-        messages = [
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content=user_message),
-        ]
+        with get_metrics().timer("classify_seconds"):
+            return self.lookup(listing) or self._classify_with_llm(listing)
 
+    def _classify_with_llm(self, listing: BikeListingData) -> BikeClassification:
         # Call the LLM with structured output
         log.info(f"Classifying: {listing.title}")
-        classification: BikeClassification = self.llm.invoke(messages)
+        classification = self._invoke(self.llm, self._single_messages(listing), 1)
+        return self._store(listing, classification)
 
-        log.info(
-            f"Classification result: is_good={classification.is_good}, "
-            f"confidence={classification.confidence}, reason={classification.reason}"
-        )
+    def classify_batch(
+        self, listings: list[BikeListingData], batch_size: Optional[int] = None
+    ) -> list[tuple[BikeListingData, BikeClassification]]:
+        """
+        Classify multiple listings efficiently, packing up to `batch_size` listings into each LLM request so the
+        system prompt is sent once per batch rather than once per listing. Listings missing from a batch response,
+        or from a batch whose response is malformed, are classified one by one instead.
 
-        return classification
+        :param listings: List of BikeListingData objects
+        :param batch_size: Max number of listings per LLM request, defaults to the classifier's `batch_size`
+        :return: List of tuples (listing, classification), in the same order as `listings`
+        """
+        batch_size = batch_size or self.batch_size
+        classifications: List[Optional[BikeClassification]] = [
+            self.lookup(listing) for listing in listings
+        ]
+        pending = [i for i, known in enumerate(classifications) if known is None]
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start : start + batch_size]
+            if len(chunk) > 1:
+                chunk_listings = [listings[i] for i in chunk]
+                log.info(f"Classifying a batch of {len(chunk)} listings")
+                try:
+                    batch = self._invoke(
+                        self.batch_llm,
+                        self._batch_messages(chunk_listings),
+                        len(chunk),
+                    )
+                    results = self._match_batch(chunk_listings, batch)
+                except Exception as e:
+                    log.warning(
+                        f"Batch classification failed, falling back to classifying one by one: {e}"
+                    )
+                    results = [None] * len(chunk)
+                for i, classification in zip(chunk, results):
+                    classifications[i] = classification
+
+            for i in chunk:
+                if classifications[i] is not None:
+                    continue
+                try:
+                    classifications[i] = self._classify_with_llm(listings[i])
+                except Exception as e:
+                    classifications[i] = self._failed(listings[i], e)
+
+        return list(zip(listings, classifications))
+
+    async def aclassify(
+        self, listing: BikeListingData, deadline: Optional[float] = None
+    ) -> BikeClassification:
+        """
+        Async version of `classify`, for classifying many listings concurrently.
 
-    def classify_batch(
-            self, listings: list[BikeListingData]
+        :param listing: Parsed BikeListingData object
+        :param deadline: `time.monotonic()` time after which to stop retrying and raise
+        :return: BikeClassification object with is_good, reason, and confidence
+        """
+        known = self.lookup(listing)
+        if known:
+            return known
+
+        log.info(f"Classifying: {listing.title}")
+        classification = await self._ainvoke(
+            self.llm, self._single_messages(listing), 1, deadline
+        )
+        return self._store(listing, classification)
+
+    async def aclassify_many(
+        self,
+        listings: list[BikeListingData],
+        batch_size: Optional[int] = None,
+        deadline: Optional[float] = None,
+        lookup: bool = True,
     ) -> list[tuple[BikeListingData, BikeClassification]]:
         """
-        Classify multiple listings efficiently.
+        Async version of `classify_batch`, sending the batches concurrently. The number of LLM requests in flight is
+        capped by our AIMD limiter, which backs off when the API rate limits us.
 
         :param listings: List of BikeListingData objects
-        :return: List of tuples (listing, classification)
+        :param batch_size: Max number of listings per LLM request, defaults to the classifier's `batch_size`
+        :param deadline: `time.monotonic()` time after which to stop retrying; listings not classified by then get a
+            failed classification
+        :param lookup: Check the pre-filter and cache before the LLM. Pass False for listings already checked with
+            `lookup`, which all go to the LLM
+        :return: List of tuples (listing, classification), in the same order as `listings`
         """
-        results = []
+        batch_size = batch_size or self.batch_size
+        classifications: List[Optional[BikeClassification]] = [
+            self.lookup(listing) if lookup else None for listing in listings
+        ]
+        pending = [i for i, known in enumerate(classifications) if known is None]
 
-        for listing in listings:
+        async def classify_one(i: int) -> None:
             try:
-                classification = self.classify(listing)
-                results.append((listing, classification))
+                classifications[i] = self._store(
+                    listings[i],
+                    await self._ainvoke(
+                        self.llm, self._single_messages(listings[i]), 1, deadline
+                    ),
+                )
             except Exception as e:
-                log.error(f"Failed to classify {listing.url}: {e}")
-                # Create a failed classification object
-                failed_classification = BikeClassification(
-                    is_good=False,
-                    reason=f"Classification failed: {str(e)}",
-                    confidence="low",
+                classifications[i] = self._failed(listings[i], e)
+
+        async def classify_chunk(chunk: List[int]) -> None:
+            if len(chunk) > 1:
+                chunk_listings = [listings[i] for i in chunk]
+                log.info(f"Classifying a batch of {len(chunk)} listings")
+                try:
+                    batch = await self._ainvoke(
+                        self.batch_llm,
+                        self._batch_messages(chunk_listings),
+                        len(chunk),
+                        deadline,
+                    )
+                    for i, classification in zip(
+                        chunk, self._match_batch(chunk_listings, batch)
+                    ):
+                        classifications[i] = classification
+                except Exception as e:
+                    log.warning(
+                        f"Batch classification failed, falling back to classifying one by one: {e}"
+                    )
+
+            await asyncio.gather(
+                *(classify_one(i) for i in chunk if classifications[i] is None)
+            )
+
+        await asyncio.gather(
+            *(
+                classify_chunk(pending[start : start + batch_size])
+                for start in range(0, len(pending), batch_size)
+            )
+        )
+        return list(zip(listings, classifications))
+
+    async def aclassify_watches(
+        self,
+        listings: List[BikeListingData],
+        candidates: List[List[WatchProfile]],
+        watches: List[WatchProfile],
+        batch_size: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> List[Dict[str, BikeClassification]]:
+        """
+        Classify listings against several watches at once: each request carries up to `batch_size` listings, each
+        with the watches it's still a candidate for, and returns a verdict per listing per watch. Every listing is sent
+        once however many watches it's checked against, and the criteria of every watch sit in the cached system
+        prompt, so adding a watch costs its verdicts' output tokens rather than another request. Verdicts missing from
+        a batch response, or from a batch that failed, are asked for again one listing at a time.
+
+        The pre-filter and cache aren't used: their verdicts are for the single set of criteria in `system_prompt`.
+
+        :param listings: List of BikeListingData objects
+        :param candidates: Watches to check each listing against, e.g. those whose pre-checks it passed. Listings with
+            none aren't sent
+        :param watches: Every watch, whose criteria make up the system prompt
+        :param batch_size: Max number of listings per LLM request, defaults to the classifier's `batch_size`
+        :param deadline: `time.monotonic()` time after which to stop retrying; verdicts not in by then are failed
+            classifications
+        :return: {watch name: classification} per listing, in the same order as `listings`
+        """
+        batch_size = batch_size or self.batch_size
+        verdicts: List[Dict[str, BikeClassification]] = [{} for _ in listings]
+        pending = [i for i, listing_watches in enumerate(candidates) if listing_watches]
+
+        def missing(i: int) -> bool:
+            return any(watch.name not in verdicts[i] for watch in candidates[i])
+
+        async def classify_chunk(chunk: List[int]) -> None:
+            log.info(
+                f"Classifying {len(chunk)} listings against "
+                f"{sum(len(candidates[i]) for i in chunk)} watches"
+            )
+            try:
+                batch = await self._ainvoke(
+                    self.watch_llm,
+                    self._watch_messages(
+                        [listings[i] for i in chunk],
+                        [candidates[i] for i in chunk],
+                        watches,
+                    ),
+                    len(chunk),
+                    deadline,
+                )
+            except Exception as e:
+                if len(chunk) > 1:
+                    log.warning(
+                        f"Watch batch classification failed, falling back to classifying one by one: {e}"
+                    )
+                    await asyncio.gather(*(classify_chunk([i]) for i in chunk))
+                else:
+                    failed = self._failed(listings[chunk[0]], e)
+                    for watch in candidates[chunk[0]]:
+                        verdicts[chunk[0]].setdefault(watch.name, failed)
+                return
+
+            by_key = {
+                (result.url.strip(), result.watch.strip()): BikeClassification(
+                    is_good=result.is_good,
+                    reason=result.reason,
+                    confidence=result.confidence,
+                )
+                for result in batch.classifications
+            }
+            for i in chunk:
+                for watch in candidates[i]:
+                    classification = by_key.get((listings[i].url, watch.name))
+                    if classification is not None:
+                        verdicts[i][watch.name] = classification
+                        log.info(
+                            f"Classification result for {listings[i].title} ({watch.name}): "
+                            f"is_good={classification.is_good}, confidence={classification.confidence}, "
+                            f"reason={classification.reason}"
+                        )
+                if not missing(i):
+                    get_metrics().inc("classifications_total", source="llm")
+
+            incomplete = [i for i in chunk if missing(i)]
+            if len(chunk) == 1 and incomplete:
+                failed = self._failed(
+                    listings[chunk[0]], ValueError("No verdict for some watches")
                 )
-                results.append((listing, failed_classification))
+                for watch in candidates[chunk[0]]:
+                    verdicts[chunk[0]].setdefault(watch.name, failed)
+            elif incomplete:
+                await asyncio.gather(*(classify_chunk([i]) for i in incomplete))
+
+        await asyncio.gather(
+            *(
+                classify_chunk(pending[start : start + batch_size])
+                for start in range(0, len(pending), batch_size)
+            )
+        )
+        return verdicts
 
-        return results
+    def reset_stats(self) -> None:
+        """
+        Start counting token usage from zero, along with the pre-filter and cache stats, e.g. at the start of each run
+        of a classifier reused across runs
+        """
+        with self._usage_lock:
+            self.usage = LLMUsage()
+        if self.prefilter:
+            self.prefilter.reset_stats()
+        if self.cache:
+            self.cache.reset_stats()
+
+    def log_usage(self) -> None:
+        """Log the token usage of every LLM request made so far"""
+        usage = self.usage
+        if not usage.requests:
+            return
+        log.info(
+            f"LLM usage: {usage.requests} requests for {usage.listings} listings, "
+            f"{usage.input_tokens} input tokens ({usage.cache_read_tokens} cache reads, "
+            f"{usage.cache_creation_tokens} cache writes), {usage.output_tokens} output tokens"
+        )
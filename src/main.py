@@ -2,12 +2,12 @@
 
 import logging
 import time
+from typing import Optional
 
-from change_data_capture import get_new_listing_urls
-from config import Config
-from llm_classifier import BikeClassifier, BikeClassification
-from notifier import send_whatsapp_alert
-from scraper import fetch_and_parse_listing
+from change_data_capture import get_new_listing_urls_for_searches, snapshot_without_urls
+from container import AppContainer, get_container, log_classifier_stats
+from http_client import get_http_client
+from metrics import get_metrics
 import functions_framework
 
 logging.basicConfig(
@@ -15,6 +15,9 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+# time left at the end of the function's time budget to save our CDC state and log a summary
+DEADLINE_MARGIN_SECONDS = 30
+
 
 @functions_framework.http
 def check_new_bikes(request):
@@ -28,82 +31,134 @@ def check_new_bikes(request):
         return f"Error: {str(e)}", 500
 
 
-def run_pipeline():
-    """Run the full bike alert pipeline"""
-    log.info("Starting bike alert check...")
+def run_pipeline(container: Optional[AppContainer] = None) -> int:
+    """
+    Run the full bike alert pipeline.
 
-    # load our config
-    config: Config = Config()
+    :param container: Config and clients to run with, defaults to the process-wide container
+    :return: Number of new listings found
+    :raises RuntimeError: If every search failed, leaving the CDC state as is
+    """
+    log.info("Starting bike alert check...")
 
-    # 1. Get new the URLS for any new listings since we last ran this program
+    run_start = time.monotonic()
+    # our config and clients are loaded once per instance - a warm cloud function instance runs us again in the same
+    # process, and reuses them. Start every run's metrics and stats from scratch though
+    container = container or get_container()
+    config = container.config
+    container.start_run()
+    metrics = get_metrics()
+    metrics.enabled = config.metrics_enabled
+    metrics.reset()
     try:
-        new_urls = get_new_listing_urls(n_minutes=config.check_interval_minutes)
-    except Exception as e:
-        log.error(f"Failed to fetch new listings: {e}", exc_info=True)
-        return
+        return _run_pipeline(container, run_start)
+    finally:
+        metrics.observe("run_seconds", time.monotonic() - run_start)
+        metrics.export(config.metrics_json_path, config.metrics_prometheus_path)
+
+
+def _run_pipeline(container: AppContainer, run_start: float) -> int:
+    config = container.config
+    # stop taking on new work in time to wrap up before the cloud function times out
+    deadline = run_start + config.function_timeout_seconds - DEADLINE_MARGIN_SECONDS
+
+    # 1. Get new the URLS for any new listings since we last ran this program, across all of our searches
+    searches = [
+        (profile, container.state_store(profile.name))
+        for profile in config.get_search_profiles()
+    ]
+    new_urls, search_results = get_new_listing_urls_for_searches(
+        searches,
+        n_minutes=config.check_interval_minutes,
+        max_workers=config.search_max_concurrency,
+        streaming_decode=config.sapi_streaming_decode,
+    )
+    # searches that failed keep their old CDC state, so their new listings are picked up next run
+    completed_searches = [
+        (result, state_store)
+        for result, (_, state_store) in zip(search_results, searches)
+        if result.snapshot is not None
+    ]
+    if not completed_searches:
+        # raise rather than report 0 new listings, so callers (e.g. the worker's poll interval estimate) can tell an
+        # outage apart from a quiet spell
+        raise RuntimeError(
+            f"Failed to fetch new listings for every search: {search_results[0].error}"
+        )
 
     if not new_urls:
-        log.info(
-            f"No new listings found in the past {config.check_interval_minutes} minutes"
-        )
-        return
+        log.info("No new listings found since the last run")
+        for result, state_store in completed_searches:
+            state_store.save(result.snapshot)
+        return 0
 
+    seen_at = time.monotonic()
     log.info(f"Found {len(new_urls)} new listings to check")
 
-    # 2. Initialize classifier
-    classifier = BikeClassifier(api_key=config.anthropic_api_key)
-
-    good_bikes_found = 0
-    high_confidence_matches = 0
-
-    # 3. Process each listing
-    for i, url in enumerate(new_urls, 1):
-        log.info(f"\n[{i}/{len(new_urls)}] Processing: {url}")
-
-        # Parse listing
-        listing = fetch_and_parse_listing(url)
-        if not listing:
-            log.warning(f"Failed to parse listing: {url}")
-            continue
-
-        log.info(f"  Title: {listing.title}")
-        log.info(f"  Price: {listing.price}")
-        log.info(f"  Type: {listing.bicycle_type}")
-
-        # classify the listing using our LLM
-        try:
-            classification: BikeClassification = classifier.classify(listing)
-
-            if classification.is_good:
-                log.info(f"GOOD BIKE FOUND!")
-                log.info(f"\tReason: {classification.reason}")
-                log.info(f"\tConfidence: {classification.confidence}")
-                log.info(f"\tURL: {url}")
-
-                good_bikes_found += 1
-
-                if classification.confidence == "high":
-                    high_confidence_matches += 1
-                    # send whatsapp alerts for high-confidence matches
-                    send_whatsapp_alert(listing, classification.reason)
-            else:
-                log.info(
-                    f"Rejected ({classification.confidence}): {classification.reason}"
-                )
-
-        except Exception as e:
-            log.error(f"Failed to classify: {e}", exc_info=True)
-
-        # simple rate limiting - TODO refactor to use tenacity library for rate limmiting + retries
-        time.sleep(2)
+    # 2. Get the classifier, our listing fetch engine and the alert dispatcher. Only now that there's work for them
+    # do we import the pipeline and LLM SDKs, keeping them out of the cold start of runs with nothing new
+    from pipeline import ListingPipeline
+
+    classifier = container.classifier
+    fetcher = container.fetcher
+    # with watch profiles configured, a WatchNotifier sending each watch's alerts to its own recipients
+    dispatcher = container.dispatcher()
+    archive = container.archive
+    index = container.listing_index
+    scorer = container.market_scorer()
+
+    # 3. Stream new listings through the fetch -> parse -> classify -> notify stages
+    pipeline = ListingPipeline(
+        fetcher,
+        classifier,
+        notify=dispatcher.submit,
+        fetch_workers=config.fetch_max_workers,
+        parse_workers=config.pipeline_parse_workers,
+        classify_concurrency=config.llm_max_concurrency,
+        batch_size=config.llm_batch_size,
+        queue_size=config.pipeline_queue_size,
+        deadline=deadline,
+        on_parsed=index.add if index else None,
+        on_classified=archive.append if archive else None,
+        score=scorer.score if scorer else None,
+        max_classifications=config.llm_max_listings_per_run,
+        watches=container.watch_set,
+    )
+    stats = pipeline.run(new_urls, seen_at=seen_at)
+    if index:
+        index.flush()
+    if archive:
+        # write this run's listings as one segment, and merge small segments while we wrap up
+        archive.flush()
+        archive.start_compaction()
+    # alerts are sent in the background, so wait for the last ones to go out
+    dispatcher.close(
+        timeout=max(0.0, deadline - time.monotonic()) + DEADLINE_MARGIN_SECONDS / 2
+    )
+
+    # only advance our CDC state past listings we've fully processed, so anything cut off by the deadline or whose
+    # alert failed to send (or a failed run) is retried next time
+    unfinished_urls = stats.unfinished_urls + dispatcher.pending_urls()
+    for result, state_store in completed_searches:
+        state_store.save(snapshot_without_urls(result.snapshot, unfinished_urls))
 
     # Summary
     log.info(f"\n{'=' * 60}")
-    log.info(f"Check complete!")
-    log.info(f"\tTotal new listings: {len(new_urls)}")
-    log.info(f"\tGood bikes found: {good_bikes_found}")
-    log.info(f" \tHigh-confidence matches: {high_confidence_matches}")
+    log.info("Check complete!")
+    log.info(f"\tTotal new listings: {len(new_urls)} in {stats.elapsed_seconds:.2f}s")
+    log.info(f"\tGood bikes found: {stats.good_bikes}")
+    log.info(f" \tHigh-confidence matches: {stats.high_confidence_matches}")
+    pipeline.log_stats()
     log.info(f"{'=' * 60}")
+    get_http_client().log_stats()
+    dispatcher.log_stats()
+    log_classifier_stats(classifier)
+    if index:
+        index.log_stats()
+    if archive:
+        archive.wait_for_compaction(timeout=max(0.0, deadline - time.monotonic()))
+        archive.log_stats()
+    return len(new_urls)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,363 @@
+"""
+Lightweight in-process metrics: counters and histograms with labels, exported as a structured JSON summary or in the
+Prometheus text exposition format. Cheap enough to leave on in production - recording a value is a dict lookup and a
+bisect under a lock.
+"""
+
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in seconds - from a parse of a single page to a slow LLM batch
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# every metric we record, as name -> (type, help). Declared up front so the Prometheus output always has help text,
+# and a typo'd metric name fails loudly instead of silently recording a new metric
+METRICS = {
+    "run_seconds": ("histogram", "Duration of a whole run"),
+    "cdc_search_seconds": (
+        "histogram",
+        "Time to find a search's new listings, including its SAPI requests",
+    ),
+    "sapi_request_seconds": (
+        "histogram",
+        "Time to fetch and decode one SAPI snapshot",
+    ),
+    "new_listings_total": ("counter", "New listings found by CDC, per search"),
+    "listing_fetch_seconds": (
+        "histogram",
+        "Time of a single request for a listing page, without retries",
+    ),
+    "listing_fetch_total_seconds": (
+        "histogram",
+        "Time to fetch a listing page with ListingFetcher, including retries and rate limit waits",
+    ),
+    "listing_parse_seconds": ("histogram", "Time to parse a listing page"),
+    "pipeline_stage_seconds": (
+        "histogram",
+        "Time a pipeline stage spent on one listing (one batch for the classify stage)",
+    ),
+    "classify_seconds": (
+        "histogram",
+        "Time to classify one listing with BikeClassifier.classify",
+    ),
+    "pipeline_over_budget_total": (
+        "counter",
+        "Listings skipped to stay within the per-run LLM budget",
+    ),
+    "llm_request_seconds": ("histogram", "Duration of a single LLM request"),
+    "llm_requests_total": ("counter", "LLM requests, by outcome"),
+    "llm_tokens_total": ("counter", "LLM tokens, by type"),
+    "classifications_total": (
+        "counter",
+        "Listings classified, by where the verdict came from",
+    ),
+    "alert_send_seconds": (
+        "histogram",
+        "Time to send one WhatsApp message, including retries",
+    ),
+    "alerts_sent_total": ("counter", "Listings alerted on"),
+    "http_requests_total": ("counter", "HTTP requests sent, by host and status"),
+    "http_response_bytes_total": (
+        "counter",
+        "Response bytes received on the wire, by host",
+    ),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        name
+        + '="'
+        + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """A monotonically increasing count, per set of label values"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def summary(self) -> List[dict]:
+        with self._lock:
+            return [
+                {"labels": dict(key), "value": value}
+                for key, value in self.values.items()
+            ]
+
+    def prometheus_lines(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(key)} {value:g}"
+                for key, value in self.values.items()
+            ]
+
+
+class _HistogramSeries:
+    """Bucket counts and totals of a histogram for one set of label values"""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self, n_buckets: int):
+        # the last count is for values above every bucket bound
+        self.counts = [0] * (n_buckets + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram:
+    """
+    Distribution of observed values, per set of label values, in fixed buckets. Percentiles are estimated by
+    interpolating within the bucket they fall in, like Prometheus' `histogram_quantile`.
+    """
+
+    def __init__(
+        self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[LabelKey, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _HistogramSeries(len(self.buckets))
+            series.counts[i] += 1
+            series.count += 1
+            series.sum += value
+            if value > series.max:
+                series.max = value
+
+    def _percentile(self, series: _HistogramSeries, q: float) -> float:
+        rank = q / 100 * series.count
+        seen = 0
+        for i, count in enumerate(series.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                # values above the last bucket are only known to be <= the max we've seen
+                upper = self.buckets[i] if i < len(self.buckets) else series.max
+                return min(lower + (upper - lower) * (rank - seen) / count, series.max)
+            seen += count
+        return series.max
+
+    def summary(self) -> List[dict]:
+        with self._lock:
+            return [
+                {
+                    "labels": dict(key),
+                    "count": series.count,
+                    "sum": round(series.sum, 6),
+                    "mean": round(series.sum / series.count, 6),
+                    "p50": round(self._percentile(series, 50), 6),
+                    "p95": round(self._percentile(series, 95), 6),
+                    "max": round(series.max, 6),
+                }
+                for key, series in self.series.items()
+                if series.count
+            ]
+
+    def prometheus_lines(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, series in self.series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, series.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{self.name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {cumulative}"
+                    )
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series.count}"
+                )
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series.sum:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics declared in `METRICS`, created as they're first recorded. When disabled, recording is a no-op,
+    so instrumented code doesn't need to check.
+    """
+
+    def __init__(self, enabled: bool = True, namespace: str = "craigslist"):
+        """
+        :param enabled: Whether to record anything
+        :param namespace: Prefix for metric names in the Prometheus output
+        """
+        self.enabled = enabled
+        self.namespace = namespace
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str):
+        metric = self._metrics.get(name)
+        if metric is None:
+            kind, help = METRICS[name]
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric_class = Histogram if kind == "histogram" else Counter
+                    metric = self._metrics[name] = metric_class(name, help)
+        return metric
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        """
+        Increment a counter.
+
+        :param name: Counter name, from `METRICS`
+        :param amount: Amount to increment by
+        :param labels: Label values
+        """
+        if self.enabled:
+            self._get(name).inc(amount, **labels)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Record a value in a histogram.
+
+        :param name: Histogram name, from `METRICS`
+        :param value: Value to record, e.g. a duration in seconds
+        :param labels: Label values
+        """
+        if self.enabled:
+            self._get(name).observe(value, **labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Time a block of code, recording its duration in seconds in a histogram - even if it raises.
+
+        :param name: Histogram name, from `METRICS`
+        :param labels: Label values
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._get(name).observe(time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """
+        Decorator recording each call's duration in a histogram.
+
+        :param name: Histogram name, from `METRICS`
+        :param labels: Label values
+        """
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def reset(self) -> None:
+        """Drop everything recorded so far, e.g. between runs in a long-lived process"""
+        with self._lock:
+            self._metrics = {}
+
+    def summary(self) -> dict:
+        """
+        :return: Everything recorded so far, as {metric name: [{labels, value or count/sum/mean/p50/p95/max}]}
+        """
+        return {
+            name: metric.summary() for name, metric in sorted(self._metrics.items())
+        }
+
+    def to_json(self) -> str:
+        """
+        :return: One-line JSON summary of everything recorded so far
+        """
+        return json.dumps({"metrics": self.summary()}, separators=(",", ":"))
+
+    def to_prometheus(self) -> str:
+        """
+        :return: Everything recorded so far in the Prometheus text exposition format
+        """
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            full_name = f"{self.namespace}_{name}" if self.namespace else name
+            kind = "histogram" if isinstance(metric, Histogram) else "counter"
+            lines.append(f"# HELP {full_name} {metric.help}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            lines.extend(
+                f"{full_name}{line[len(name):]}" for line in metric.prometheus_lines()
+            )
+        return "\n".join(lines) + "\n"
+
+    def export(
+        self, json_path: Optional[Path] = None, prometheus_path: Optional[Path] = None
+    ) -> None:
+        """
+        Log the JSON summary, and write it and the Prometheus text output to files if paths are given. The Prometheus
+        file is written atomically, so it can be picked up by node_exporter's textfile collector.
+
+        :param json_path: File to write the JSON summary to
+        :param prometheus_path: File to write the Prometheus text output to
+        """
+        if not self.enabled:
+            return
+        summary = self.to_json()
+        log.info(f"Run metrics: {summary}")
+        for path, content in [
+            (json_path, summary + "\n"),
+            (prometheus_path, self.to_prometheus()),
+        ]:
+            if path:
+                path = Path(path)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f".{path.name}.tmp")
+                tmp.write_text(content, encoding="utf-8")
+                tmp.replace(path)
+
+
+@lru_cache(maxsize=None)
+def get_metrics() -> MetricsRegistry:
+    """
+    Get the process-wide metrics registry, so every module records into the same place.
+
+    :return: Shared MetricsRegistry instance
+    """
+    return MetricsRegistry()
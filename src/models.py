@@ -1,6 +1,9 @@
-from typing import Optional
+import base64
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_serializer, field_validator
+
+from posting_ids import PostingIdSet
 
 
 class BikeListingData(BaseModel):
@@ -44,3 +47,186 @@ class BikeListingData(BaseModel):
     # TODO: Consider omitting any listing data not relevant to the LLM decision in order to avoid polluting context
     # namely: price, condition, url. This information might be useful later to include in the text message, but may be
     # irrelevant for the LLM verdict
+
+
+class BikeClassification(BaseModel):
+    """Structured output for bike classification."""
+
+    is_good: bool = Field(description="Whether this is a good bike deal")
+    reason: str = Field(description="One-sentence explanation for the classification")
+    confidence: str = Field(description="Confidence level: 'high', 'medium', or 'low'")
+
+
+class ListingClassification(BikeClassification):
+    """Classification of one listing in a batch, tagged with the listing's URL so it can be matched back up"""
+
+    url: str = Field(description="URL of the classified bike listing, exactly as given")
+
+
+class BatchClassification(BaseModel):
+    """Structured output for classifying several bike listings in one request."""
+
+    classifications: List[ListingClassification] = Field(
+        description="One classification per bike listing"
+    )
+
+
+class WatchProfile(BaseModel):
+    """
+    Someone's watch for listings: what they're after, in their own words for the LLM, and cheap checks that rule a
+    listing out for the watch without asking the LLM
+    """
+
+    name: str = Field(description="Unique name of the watch, ex. `gravel`")
+    criteria: str = Field(
+        description="What makes a listing a good find for this watch, given to the LLM. Ex. `Gravel bike with 1x "
+        "or 2x GRX, 105 or Rival, fits 40mm+ tires, in good condition`"
+    )
+    to_numbers: List[str] = Field(
+        description="Phone numbers to send this watch's WhatsApp alerts to"
+    )
+    min_confidence: Literal["high", "medium", "low"] = Field(
+        description="Lowest confidence of a good verdict to alert on", default="high"
+    )
+    bicycle_types: List[str] = Field(
+        description="Case-insensitive regexes, one of which the listing's bicycle type must match. Listings without "
+        "a bicycle type are kept. Any type if empty",
+        default_factory=list,
+    )
+    min_price: Optional[float] = Field(
+        description="Listings priced below this are ruled out. Listings without a price are kept",
+        default=None,
+    )
+    max_price: Optional[float] = Field(
+        description="Listings priced above this are ruled out. Listings without a price are kept",
+        default=None,
+    )
+    min_frame_size_cm: Optional[float] = Field(
+        description="Listings with a frame size (in inches or cm) below this are ruled out. Listings without one are "
+        "kept",
+        default=None,
+    )
+    max_frame_size_cm: Optional[float] = Field(
+        description="Listings with a frame size (in inches or cm) above this are ruled out. Listings without one are "
+        "kept",
+        default=None,
+    )
+    exclude: List[str] = Field(
+        description="Case-insensitive regexes ruling out listings whose title or body matches any of them",
+        default_factory=list,
+    )
+
+
+class ListingQuery(BaseModel):
+    """
+    A query over indexed listings, e.g. Cannondale, 54-56cm, carbon, under $1500, indexed in the last 30 days. Every
+    criterion given must match; text criteria match listings containing all of their words, in any order
+    """
+
+    manufacturer: Optional[str] = None
+    model: Optional[str] = None
+    frame_material: Optional[str] = None
+    bicycle_type: Optional[str] = None
+    condition: Optional[str] = None
+    text: Optional[str] = Field(
+        description="Words that must all appear in the listing's title or body",
+        default=None,
+    )
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_frame_size_cm: Optional[float] = None
+    max_frame_size_cm: Optional[float] = None
+    since: Optional[float] = Field(
+        description="Unix epoch timestamp of the earliest listings to match, by when they were indexed",
+        default=None,
+    )
+    until: Optional[float] = None
+    include_missing: bool = Field(
+        description="Whether listings without a price or frame size match price and frame size ranges, like the "
+        "pre-checks of a watch profile",
+        default=False,
+    )
+    limit: Optional[int] = Field(
+        description="Max number of listings to return, most recently indexed first. All of them if None",
+        default=100,
+    )
+
+
+class WatchClassification(BikeClassification):
+    """Verdict on one listing for one watch, in a multi-watch batch"""
+
+    url: str = Field(description="URL of the classified bike listing, exactly as given")
+    watch: str = Field(description="Name of the watch, exactly as given")
+
+
+class WatchBatchClassification(BaseModel):
+    """Structured output for classifying several bike listings against several watches in one request."""
+
+    classifications: List[WatchClassification] = Field(
+        description="One classification per bike per watch listed for it"
+    )
+
+
+class WatchVerdicts(BikeClassification):
+    """
+    A listing's verdicts for every watch it was checked against, summed up as a single classification: good if it's
+    good for any watch
+    """
+
+    verdicts: Dict[str, BikeClassification] = Field(
+        description="Verdict per watch name, for the watches that passed their pre-checks",
+        default_factory=dict,
+    )
+    alert_watches: List[str] = Field(
+        description="Watches whose verdict is good with at least their min confidence",
+        default_factory=list,
+    )
+
+
+class SearchProfile(BaseModel):
+    """A Craigslist search to watch for new listings: a category of items within a radius of a point"""
+
+    name: str = Field(
+        description="Unique name of the search, used as the key its CDC state is stored under"
+    )
+    search_path: str = Field(
+        description="Craigslist area + category to search, ex. `san-francisco-ca/bia`"
+    )
+    lat: float = Field(description="Latitude of the center of the search")
+    lon: float = Field(description="Longitude of the center of the search")
+    distance_miles: int = Field(description="Radius of the search in miles")
+    url_base: str = Field(
+        description="Base URL of the search's listing pages, ex. `https://sfbay.craigslist.org/bik/`"
+    )
+
+
+class ListingSnapshot(BaseModel):
+    """The set of active Craigslist listings as of a point in time, as returned by the SAPI search endpoint"""
+
+    fetched_at: int = Field(
+        description="Unix epoch timestamp the snapshot was taken at"
+    )
+    min_posting_id: int = Field(
+        description="Decode base from the SAPI response. Item IDs in the response are offsets from this value"
+    )
+    posting_ids: PostingIdSet = Field(
+        description="Absolute posting IDs of the active listings, i.e. `min_posting_id` + the item's offset"
+    )
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @field_validator("posting_ids", mode="before")
+    @classmethod
+    def _load_posting_ids(cls, value):
+        # accept the compact serialized form (raw or base64 from JSON) as well as plain lists of IDs
+        if isinstance(value, str):
+            value = base64.b64decode(value)
+        if isinstance(value, bytes):
+            return PostingIdSet.from_bytes(value)
+        if isinstance(value, PostingIdSet):
+            return value
+        return PostingIdSet(value)
+
+    @field_serializer("posting_ids", when_used="json")
+    def _dump_posting_ids(self, posting_ids: PostingIdSet) -> str:
+        return base64.b64encode(posting_ids.to_bytes()).decode()
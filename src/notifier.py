@@ -1,38 +1,68 @@
 """SMS/WhatsApp notifications via Twilio"""
 
 import logging
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
 
+import requests
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 
-from config import Config
+from config import get_config
+from metrics import get_metrics
 from models import BikeListingData
+from rate_limit import full_jitter_backoff
 
 # shared phone number to use as the "from" phone number for any messages sent by twilio over whatsapp
 TWILIO_WHATSAPP_SANDBOX_NUMBER: str = "whatsapp:+14155238886"
 
 log = logging.getLogger(__name__)
 
-# load our config
-config = Config()
+# status codes worth retrying a send on - twilio throttles with 429s and occasionally returns transient 5xxs
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
 
+# max length of a WhatsApp message body, in UTF-16 code units. Twilio rejects longer ones with a 400, which isn't
+# worth retrying, so longer digests are split into several messages
+MAX_MESSAGE_CHARS = 1600
 
-def send_whatsapp_alert(listing: BikeListingData, reason: str) -> bool:
+
+def build_twilio_client(
+    account_sid: str,
+    auth_token: str,
+    timeout: float = 10,
+    api_base_url: Optional[str] = None,
+) -> Client:
     """
-    Send WhatsApp alert for a good bike listing.
+    :param account_sid: Twilio account SID
+    :param auth_token: Twilio auth token
+    :param timeout: Request timeout in seconds
+    :param api_base_url: Base URL of the Twilio REST API, e.g. to point at a local fake in benchmarks
+    :return: Twilio client, keeping its connections open between messages
+    """
+    client = Client(
+        account_sid, auth_token, http_client=TwilioHttpClient(timeout=timeout)
+    )
+    if api_base_url:
+        client.api.base_url = api_base_url.rstrip("/")
+    return client
+
+
+def format_alert(listing: BikeListingData, reason: str) -> str:
+    """
+    Build the alert message for a single good bike listing.
 
     :param listing: BikeListingData object
     :param reason: Classification reason from LLM
-    :return: True if sent successfully
+    :return: Message body
     """
-    if not config.twilio_account_sid or not config.twilio_auth_token:
-        log.warning("Twilio not configured - skipping WhatsApp")
-        return False
-
-    try:
-        client = Client(config.twilio_account_sid, config.twilio_auth_token)
-
-        # Build message, ensuring to include the URL to the relevant listing post
-        message_body = f"""🚴 *Good Bike Found!*
+    # Build message, ensuring to include the URL to the relevant listing post
+    return f"""🚴 *Good Bike Found!*
 
 *{listing.title}*
 {listing.price or "Price not listed"}
@@ -41,13 +71,356 @@ def send_whatsapp_alert(listing: BikeListingData, reason: str) -> bool:
 
 {listing.url}"""
 
-        # Send WhatsApp using sandbox
-        message = client.messages.create(
-            body=message_body,
-            from_=TWILIO_WHATSAPP_SANDBOX_NUMBER,  # Twilio WhatsApp sandbox
-            to=f"whatsapp:{config.twilio_to_number}",
+
+def format_digest(alerts: List[Tuple[BikeListingData, str]]) -> str:
+    """
+    Build a single digest message for several good bike listings.
+
+    :param alerts: (listing, classification reason) pairs
+    :return: Message body
+    """
+    if len(alerts) == 1:
+        return format_alert(*alerts[0])
+
+    entries = "\n\n".join(
+        f"*{listing.title}*\n{listing.price or 'Price not listed'}\n{reason[:100]}\n{listing.url}"
+        for listing, reason in alerts
+    )
+    return f"🚴 *{len(alerts)} Good Bikes Found!*\n\n{entries}"
+
+
+def message_length(body: str) -> int:
+    """
+    :param body: Message body
+    :return: Its length as Twilio counts it, in UTF-16 code units - emoji count twice
+    """
+    return len(body.encode("utf-16-le")) // 2
+
+
+def split_digest(
+    alerts: List[Tuple[BikeListingData, str]], max_chars: int = MAX_MESSAGE_CHARS
+) -> List[List[Tuple[BikeListingData, str]]]:
+    """
+    Split alerts into as few digests as fit in a message each, keeping their order.
+
+    :param alerts: (listing, classification reason) pairs
+    :param max_chars: Max length of a message body
+    :return: Alerts of each digest. A single alert too long for a message still gets a digest of its own
+    """
+    digests: List[List[Tuple[BikeListingData, str]]] = []
+    for alert in alerts:
+        if (
+            digests
+            and message_length(format_digest(digests[-1] + [alert])) <= max_chars
+        ):
+            digests[-1].append(alert)
+        else:
+            digests.append([alert])
+    return digests
+
+
+@dataclass
+class _PendingAlert:
+    listing: BikeListingData
+    reason: str
+    on_sent: Optional[Callable[[], None]] = None
+
+
+@dataclass
+class DispatcherStats:
+    """Counts of what an AlertDispatcher has done"""
+
+    submitted: int = 0
+    duplicates_skipped: int = 0
+    alerts_sent: int = 0
+    messages_sent: int = 0
+    retries: int = 0
+    failed: int = 0
+
+
+class AlertDispatcher:
+    """
+    Sends WhatsApp alerts from a background thread, so a slow Twilio response never holds up classification. Reuses
+    a single Twilio client (and its pooled connections), retries failed sends with jittered exponential backoff, and
+    records every alerted URL in a SQLite database so a retried run never alerts on the same listing twice. Without a
+    database, duplicates are only skipped within a run.
+
+    With a digest window set, alerts submitted within that window of each other are merged into as few messages as
+    fit within WhatsApp's message length limit.
+
+    Alerts that fail to send stay pending, see `pending_urls`, so the run can leave their listings to be retried.
+    """
+
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        to_number: str,
+        sent_alerts_path: Optional[Path] = None,
+        from_number: str = TWILIO_WHATSAPP_SANDBOX_NUMBER,
+        digest_window_seconds: float = 0.0,
+        max_retries: int = 3,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 30.0,
+        timeout: float = 10,
+        api_base_url: Optional[str] = None,
+        client: Optional[Client] = None,
+    ):
+        """
+        Initialize the dispatcher and start its sender thread.
+
+        :param account_sid: Twilio account SID
+        :param auth_token: Twilio auth token
+        :param to_number: Phone number to send alerts to
+        :param sent_alerts_path: Path to the SQLite database of URLs we've already alerted on, if any
+        :param from_number: Twilio WhatsApp number to send alerts from
+        :param digest_window_seconds: How long to wait for more alerts to merge into one digest message. 0 sends
+            every alert as its own message
+        :param max_retries: Max number of retries of a failed send
+        :param backoff_base_seconds: Base delay for exponential backoff between retries
+        :param backoff_max_seconds: Upper bound on the delay between retries
+        :param timeout: Twilio request timeout in seconds
+        :param api_base_url: Base URL of the Twilio REST API, e.g. to point at a local fake in benchmarks
+        :param client: Twilio client to send with, e.g. one shared across runs. Built from the credentials, `timeout`
+            and `api_base_url` if not given
+        """
+        self.to_number = to_number
+        self.from_number = from_number
+        self.digest_window_seconds = digest_window_seconds
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.stats = DispatcherStats()
+
+        self.client = client or build_twilio_client(
+            account_sid, auth_token, timeout=timeout, api_base_url=api_base_url
+        )
+
+        self.sent_alerts_path = (
+            Path(sent_alerts_path) if sent_alerts_path is not None else None
         )
+        if self.sent_alerts_path is not None:
+            self.sent_alerts_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS sent_alerts (
+                        url TEXT PRIMARY KEY,
+                        message_sid TEXT,
+                        sent_at REAL NOT NULL
+                    )
+                    """)
+
+        self._lock = threading.Lock()
+        # URLs submitted but not sent yet, or that failed to send, so duplicate submissions within a run are skipped too
+        self._pending_urls = set()
+        # alerts queued but not yet through a send attempt, for `flush` to wait on
+        self._unsent = 0
+        self._all_sent = threading.Condition(self._lock)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="alert-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.sent_alerts_path, timeout=30)
+
+    def already_sent(self, url: str) -> bool:
+        """
+        :param url: Listing URL
+        :return: Whether we've already sent an alert for this listing. Always False without a sent alerts database
+        """
+        if self.sent_alerts_path is None:
+            return False
+        with self._connect() as conn:
+            return (
+                conn.execute(
+                    "SELECT 1 FROM sent_alerts WHERE url = ?", (url,)
+                ).fetchone()
+                is not None
+            )
+
+    def submit(
+        self,
+        listing: BikeListingData,
+        reason: str,
+        on_sent: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """
+        Queue an alert for a good bike listing, without waiting for it to be sent.
+
+        :param listing: BikeListingData object
+        :param reason: Classification reason from LLM
+        :param on_sent: Called from the sender thread once the alert has been sent
+        :return: True if the alert was queued, False if we've already alerted on this listing
+        """
+        with self._lock:
+            self.stats.submitted += 1
+            duplicate = listing.url in self._pending_urls
+            if not duplicate:
+                self._pending_urls.add(listing.url)
+        if duplicate or self.already_sent(listing.url):
+            log.info(f"Already alerted on {listing.url}, skipping")
+            with self._lock:
+                self.stats.duplicates_skipped += 1
+                if not duplicate:
+                    self._pending_urls.discard(listing.url)
+            return False
+
+        with self._lock:
+            self._unsent += 1
+        self._queue.put(_PendingAlert(listing, reason, on_sent))
+        return True
+
+    def _take_digest(self) -> Optional[List[_PendingAlert]]:
+        """Block until an alert is queued, then collect any more that come in within the digest window"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        alerts = [first]
+        if self.digest_window_seconds <= 0:
+            return alerts
+        window_ends = time.monotonic() + self.digest_window_seconds
+        while True:
+            try:
+                alert = self._queue.get(
+                    timeout=max(0.0, window_ends - time.monotonic())
+                )
+            except queue.Empty:
+                break
+            if alert is None:
+                # shutting down: send what we have, then stop
+                self._queue.put(None)
+                break
+            alerts.append(alert)
+        return alerts
+
+    def _run(self) -> None:
+        while (alerts := self._take_digest()) is not None:
+            start = 0
+            for digest in split_digest([(a.listing, a.reason) for a in alerts]):
+                digest_alerts = alerts[start : start + len(digest)]
+                start += len(digest)
+                try:
+                    self._send(digest_alerts)
+                except Exception as e:
+                    # leave the alerts pending, for the run to retry their listings
+                    log.error(f"Failed to send WhatsApp alert: {e}", exc_info=True)
+                    with self._lock:
+                        self.stats.failed += len(digest_alerts)
+            with self._lock:
+                self._unsent -= len(alerts)
+                self._all_sent.notify_all()
+
+    def _create_message(self, body: str):
+        """Send a WhatsApp message, retrying throttling and transient errors"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.client.messages.create(
+                    body=body,
+                    from_=self.from_number,
+                    to=f"whatsapp:{self.to_number}",
+                )
+            except (TwilioRestException, requests.RequestException) as e:
+                retryable = (
+                    not isinstance(e, TwilioRestException)
+                    or e.status in RETRYABLE_STATUS_CODES
+                )
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = full_jitter_backoff(
+                    attempt, self.backoff_base_seconds, self.backoff_max_seconds
+                )
+                log.warning(f"WhatsApp send failed, retrying in {delay:.1f}s: {e}")
+                with self._lock:
+                    self.stats.retries += 1
+                time.sleep(delay)
+
+    def _send(self, alerts: List[_PendingAlert]) -> None:
+        body = format_digest([(alert.listing, alert.reason) for alert in alerts])
+        with get_metrics().timer("alert_send_seconds"):
+            message = self._create_message(body)
+
+        if self.sent_alerts_path is not None:
+            now = time.time()
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sent_alerts VALUES (?, ?, ?)",
+                    [(alert.listing.url, message.sid, now) for alert in alerts],
+                )
+        with self._lock:
+            self.stats.messages_sent += 1
+            self.stats.alerts_sent += len(alerts)
+            self._pending_urls.difference_update(alert.listing.url for alert in alerts)
+        get_metrics().inc("alerts_sent_total", len(alerts))
+        log.info(f"WhatsApp sent successfully: {message.sid} ({len(alerts)} listings)")
+
+        for alert in alerts:
+            if alert.on_sent:
+                alert.on_sent()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for every alert queued so far to be sent or to fail, keeping the sender thread running.
+
+        :param timeout: Max number of seconds to wait
+        :return: Whether every queued alert got through a send attempt within the timeout
+        """
+        with self._all_sent:
+            return self._all_sent.wait_for(lambda: self._unsent == 0, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Send every queued alert, then stop the sender thread.
+
+        :param timeout: Max number of seconds to wait for queued alerts to be sent
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def pending_urls(self) -> List[str]:
+        """
+        :return: URLs of the listings whose alerts were submitted but haven't been sent, because their send failed or
+            they were still queued when the dispatcher was closed
+        """
+        with self._lock:
+            return list(self._pending_urls)
+
+    def log_stats(self) -> None:
+        """Log what the dispatcher has sent"""
+        stats = self.stats
+        log.info(
+            f"Alerts: {stats.alerts_sent} sent in {stats.messages_sent} messages, {stats.duplicates_skipped} "
+            f"duplicates skipped, {stats.retries} retries, {stats.failed} failed"
+        )
+
+
+def send_whatsapp_alert(listing: BikeListingData, reason: str) -> bool:
+    """
+    Send WhatsApp alert for a good bike listing.
+
+    :param listing: BikeListingData object
+    :param reason: Classification reason from LLM
+    :return: True if sent successfully
+    """
+    config = get_config()
+    if not config.twilio_account_sid or not config.twilio_auth_token:
+        log.warning("Twilio not configured - skipping WhatsApp")
+        return False
+
+    try:
+        with get_metrics().timer("alert_send_seconds"):
+            client = Client(config.twilio_account_sid, config.twilio_auth_token)
+
+            # Send WhatsApp using sandbox
+            message = client.messages.create(
+                body=format_alert(listing, reason),
+                from_=TWILIO_WHATSAPP_SANDBOX_NUMBER,  # Twilio WhatsApp sandbox
+                to=f"whatsapp:{config.twilio_to_number}",
+            )
 
+        get_metrics().inc("alerts_sent_total")
         log.info(f"WhatsApp sent successfully: {message.sid}")
         return True
 
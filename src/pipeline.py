@@ -0,0 +1,639 @@
+"""
+Staged streaming pipeline for new listings: fetch -> parse -> classify -> notify. Stages run concurrently, connected
+by bounded queues, so the first alert can go out while later pages are still being fetched. Listings waiting to be
+classified are taken best score first, so the likeliest deals reach the LLM - and get alerted on - first.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional
+
+from metrics import get_metrics
+from llm_classifier import BikeClassifier, is_failed_classification
+from models import BikeClassification, BikeListingData, WatchProfile, WatchVerdicts
+from scraper import ListingFetcher, parse_craigslist_bike_listing
+
+if TYPE_CHECKING:
+    from watches import WatchSet
+
+log = logging.getLogger(__name__)
+
+# end-of-stream marker passed down the queues once a stage's upstream has finished
+_DONE = object()
+
+# statuses of listing pages that are gone for good, so not worth fetching again on the next run
+GONE_STATUS_CODES = (404, 410)
+
+
+@dataclass
+class PipelineItem:
+    """A listing making its way through the pipeline"""
+
+    url: str
+    seen_at: float  # time.monotonic() when CDC found the listing
+    html: Optional[str] = None
+    listing: Optional[BikeListingData] = None
+    classification: Optional[BikeClassification] = None
+    # lower is classified first, e.g. a `MarketValueScorer` score
+    score: float = 0.0
+    # watches the listing passed the pre-checks of, when classifying against several watches
+    watches: List[WatchProfile] = field(default_factory=list)
+
+
+@dataclass
+class StageStats:
+    """Work done by one pipeline stage, and how deep its input queue got"""
+
+    workers: int
+    processed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    max_queue_depth: int = 0
+    queue_depth_total: int = 0
+    queue_depth_samples: int = 0
+
+    @property
+    def mean_queue_depth(self) -> float:
+        return (
+            self.queue_depth_total / self.queue_depth_samples
+            if self.queue_depth_samples
+            else 0.0
+        )
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    :param values: Values to take the percentile of
+    :param q: Percentile, between 0 and 100
+    :return: The `q`th percentile of `values`, or 0 if there are none
+    """
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[
+        min(98, max(0, round(q) - 1))
+    ]
+
+
+@dataclass
+class PipelineStats:
+    """Outcome of a pipeline run"""
+
+    stages: Dict[str, StageStats]
+    listings: int = 0
+    good_bikes: int = 0
+    high_confidence_matches: int = 0
+    alerts_sent: int = 0
+    elapsed_seconds: float = 0.0
+    # seconds from CDC finding a listing until its alert was sent / its classification came back
+    alert_latencies: List[float] = field(default_factory=list)
+    classify_latencies: List[float] = field(default_factory=list)
+    # listings we failed to fetch or parse, or didn't get to before the deadline, which should be retried on the next
+    # run
+    unfinished_urls: List[str] = field(default_factory=list)
+    # listings skipped to stay within the LLM budget. Unlike unfinished ones, these aren't retried
+    over_budget_urls: List[str] = field(default_factory=list)
+
+
+class _ScoredQueue(queue.Queue):
+    """Queue handing out items lowest score first, and in the order they were put for equal scores"""
+
+    def _init(self, maxsize: int) -> None:
+        self.queue = []
+        self._counter = itertools.count()
+
+    def _qsize(self) -> int:
+        return len(self.queue)
+
+    def _put(self, item) -> None:
+        # the end-of-stream marker goes after everything else
+        score = float("inf") if item is _DONE else item.score
+        heapq.heappush(self.queue, (score, next(self._counter), item))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
+
+class ListingPipeline:
+    """
+    Runs new listings through four stages, each with its own workers: fetching pages (I/O, rate limited per host),
+    parsing them (CPU), classifying them in batches with concurrent LLM requests, and sending alerts. Stages are
+    connected by bounded queues, so a slow stage applies backpressure instead of letting work pile up in memory.
+
+    Once the deadline passes, the fetch, parse and classify stages drop whatever is left in their queues, recording
+    those listings in `PipelineStats.unfinished_urls`. Listings whose page failed to fetch or parse, or that failed to
+    classify, are recorded there too, unless the page is gone for good (404/410). Alerts already queued still go out. Alert stats are updated as
+    alerts are sent, which may be after `run` returns when `notify` sends them in the background.
+
+    With a `score` function, parsed listings are classified lowest score first. With `max_classifications` too, once
+    the listings still to come outnumber what's left of the budget, only the best scoring ones are classified: a
+    listing is classified if its score is at most the fraction of the remaining listings the budget still covers.
+    Listings the classifier's pre-filter or cache know the verdict of are classified without counting against it.
+    Scores spread evenly over [0, 1], like `MarketValueScorer` percentiles, then use up about the whole budget.
+
+    With `watches`, each listing is checked against every watch in the set instead of the classifier's single set of
+    criteria. Its classification is then a `WatchVerdicts`, and `notify` is called once per watch to alert, with the
+    watch's name as `watch`.
+    """
+
+    def __init__(
+        self,
+        fetcher: ListingFetcher,
+        classifier: BikeClassifier,
+        notify: Callable[..., bool],
+        fetch_workers: int = 8,
+        parse_workers: int = 2,
+        classify_concurrency: int = 4,
+        notify_workers: int = 1,
+        batch_size: int = 5,
+        batch_linger_seconds: float = 0.2,
+        queue_size: int = 32,
+        deadline: Optional[float] = None,
+        queue_sample_interval_seconds: float = 0.1,
+        queue_report_interval_seconds: float = 10.0,
+        parse_executor: Optional[Executor] = None,
+        on_parsed: Optional[Callable[[BikeListingData], None]] = None,
+        on_classified: Optional[
+            Callable[[BikeListingData, BikeClassification], None]
+        ] = None,
+        score: Optional[Callable[[BikeListingData], float]] = None,
+        max_classifications: Optional[int] = None,
+        watches: Optional["WatchSet"] = None,
+    ):
+        """
+        Initialize the pipeline.
+
+        :param fetcher: Fetcher whose per-host rate limits and retries are used to fetch listing pages
+        :param classifier: Classifier for parsed listings
+        :param notify: Function sending or queueing an alert for a good listing, e.g. `AlertDispatcher.submit`. Called
+            with the listing, the classification's reason and an `on_sent` callback to call once the alert is sent.
+            Returns False if the alert won't be sent
+        :param fetch_workers: Number of threads fetching pages
+        :param parse_workers: Number of threads parsing pages
+        :param classify_concurrency: Max number of classification batches in flight at once
+        :param notify_workers: Number of threads sending alerts
+        :param batch_size: Max number of listings per classification batch
+        :param batch_linger_seconds: How long to wait for a classification batch to fill up before sending it anyway
+        :param queue_size: Max number of items waiting between two stages
+        :param deadline: `time.monotonic()` time by which to stop taking on new work
+        :param queue_sample_interval_seconds: How often to sample queue depths
+        :param queue_report_interval_seconds: How often to log queue depths
+        :param parse_executor: Executor to parse pages in, e.g. a ProcessPoolExecutor to parse on several cores at
+            once. Parse workers then just hand pages off to it, so use as many as it has workers. Defaults to parsing
+            in the parse worker threads
+        :param on_parsed: Function called with every listing once it's parsed, e.g. `ListingIndex.add`
+        :param on_classified: Function called with every listing and its verdict once it's classified, e.g.
+            `ListingArchive.append`. Not called for listings we failed to classify
+        :param score: Function scoring a parsed listing, lower to be classified sooner, e.g. `MarketValueScorer.score`
+        :param max_classifications: Max number of listings to send to the LLM per run, unlimited if None
+        :param watches: Watches to check every listing against, e.g. with a `WatchNotifier.submit` as `notify`
+        """
+        self.fetcher = fetcher
+        self.classifier = classifier
+        self.notify = notify
+        self.classify_concurrency = classify_concurrency
+        self.batch_size = batch_size
+        self.batch_linger_seconds = batch_linger_seconds
+        self.deadline = deadline
+        self.queue_sample_interval_seconds = queue_sample_interval_seconds
+        self.queue_report_interval_seconds = queue_report_interval_seconds
+        self.parse_executor = parse_executor
+        self.on_parsed = on_parsed
+        self.on_classified = on_classified
+        self.score = score
+        self.max_classifications = max_classifications
+        self.watches = watches
+
+        self.workers = {
+            "fetch": fetch_workers,
+            "parse": parse_workers,
+            # a single thread running an event loop, with `classify_concurrency` batches in flight
+            "classify": 1,
+            "notify": notify_workers,
+        }
+        # each stage's input queue. URLs are all known up front, so the first one doesn't need a bound
+        self.queues: Dict[str, queue.Queue] = {
+            "fetch": queue.Queue(),
+            "parse": queue.Queue(maxsize=queue_size),
+            "classify": _ScoredQueue(maxsize=queue_size),
+            "notify": queue.Queue(maxsize=queue_size),
+        }
+        self.stats = PipelineStats(stages={})
+        self._lock = threading.Lock()
+        self._active_workers: Dict[str, int] = {}
+        self._classifications_started = 0
+        self._classifications_known = 0
+
+    def _past_deadline(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _next_stage(self, stage: str) -> Optional[str]:
+        stages = list(self.queues)
+        i = stages.index(stage)
+        return stages[i + 1] if i + 1 < len(stages) else None
+
+    def _worker_finished(self, stage: str) -> None:
+        """Once every worker of a stage has finished, tell each worker of the next stage there's nothing more coming"""
+        with self._lock:
+            self._active_workers[stage] -= 1
+            last = self._active_workers[stage] == 0
+        next_stage = self._next_stage(stage)
+        if last and next_stage:
+            for _ in range(self.workers[next_stage]):
+                self.queues[next_stage].put(_DONE)
+
+    def _unfinished(self, item: PipelineItem) -> None:
+        with self._lock:
+            self.stats.unfinished_urls.append(item.url)
+
+    def _run_stage(
+        self, stage: str, handle: Callable[[PipelineItem], Optional[PipelineItem]]
+    ) -> None:
+        """Worker loop of a thread-based stage, passing each item `handle` returns on to the next stage"""
+        stats = self.stats.stages[stage]
+        next_stage = self._next_stage(stage)
+        metrics = get_metrics()
+        try:
+            while True:
+                item = self.queues[stage].get()
+                if item is _DONE:
+                    break
+                # alerts for listings we've already classified still go out after the deadline
+                if stage != "notify" and self._past_deadline():
+                    self._unfinished(item)
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    result = handle(item)
+                except Exception as e:
+                    log.error(f"{stage} failed for {item.url}: {e}", exc_info=True)
+                    result = None
+                    if stage != "notify":
+                        self._unfinished(item)
+                busy_seconds = time.perf_counter() - start
+                metrics.observe("pipeline_stage_seconds", busy_seconds, stage=stage)
+                with self._lock:
+                    stats.busy_seconds += busy_seconds
+                    stats.processed += 1
+                    stats.failed += result is None
+
+                if result is not None and next_stage:
+                    self.queues[next_stage].put(result)
+        finally:
+            self._worker_finished(stage)
+
+    def _fetch(self, item: PipelineItem) -> Optional[PipelineItem]:
+        result = self.fetcher.fetch_page(item.url)
+        if result.html is None:
+            log.warning(f"Failed to fetch {item.url}: {result.error}")
+            # a transient error or timeout is worth another try next run, a deleted listing isn't
+            if result.status_code not in GONE_STATUS_CODES:
+                self._unfinished(item)
+            return None
+        item.html = result.html
+        return item
+
+    def _parse(self, item: PipelineItem) -> Optional[PipelineItem]:
+        if self.parse_executor:
+            # timed here, since anything recorded in the executor's worker processes doesn't make it back to us
+            with get_metrics().timer("listing_parse_seconds"):
+                item.listing = self.parse_executor.submit(
+                    parse_craigslist_bike_listing, item.html, item.url
+                ).result()
+        else:
+            item.listing = parse_craigslist_bike_listing(item.html, item.url)
+        item.html = None  # don't hold on to the page any longer than we need to
+        if self.on_parsed:
+            try:
+                self.on_parsed(item.listing)
+            except Exception as e:
+                log.error(f"on_parsed failed for {item.url}: {e}", exc_info=True)
+        if self.score:
+            item.score = self.score(item.listing)
+        if self.watches:
+            item.watches = self.watches.candidates(item.listing)
+        log.info(
+            f"Parsed {item.url}: {item.listing.title} | {item.listing.price} | {item.listing.bicycle_type} | "
+            f"score {item.score:.2f}"
+        )
+        return item
+
+    def _notify(self, item: PipelineItem) -> Optional[PipelineItem]:
+        classification = item.classification
+        if isinstance(classification, WatchVerdicts):
+            queued = [
+                self.notify(
+                    item.listing,
+                    classification.verdicts[watch].reason,
+                    on_sent=lambda: self._alert_sent(item),
+                    watch=watch,
+                )
+                for watch in classification.alert_watches
+            ]
+            return item if any(queued) else None
+        queued = self.notify(
+            item.listing,
+            item.classification.reason,
+            on_sent=lambda: self._alert_sent(item),
+        )
+        return item if queued else None
+
+    def _alert_sent(self, item: PipelineItem) -> None:
+        with self._lock:
+            self.stats.alerts_sent += 1
+            self.stats.alert_latencies.append(time.monotonic() - item.seen_at)
+
+    def _take_batch(self) -> List:
+        """Block until a listing is ready to classify, then wait briefly for more to fill up a batch"""
+        inbox = self.queues["classify"]
+        batch = [inbox.get()]
+        linger_until = time.monotonic() + self.batch_linger_seconds
+        while len(batch) < self.batch_size and batch[-1] is not _DONE:
+            try:
+                batch.append(
+                    inbox.get(timeout=max(0.0, linger_until - time.monotonic()))
+                )
+            except queue.Empty:
+                break
+        return batch
+
+    def _within_budget(self, item: PipelineItem) -> bool:
+        """Decide whether to classify a listing, counting it against the budget if it needs the LLM"""
+        if item.classification is not None:
+            # already classified by the pre-filter or the cache, which cost nothing
+            with self._lock:
+                self._classifications_known += 1
+            return True
+        if self.max_classifications is None or (self.watches and not item.watches):
+            # listings ruled out for every watch by the pre-checks don't go to the LLM
+            return True
+        with self._lock:
+            budget_left = self.max_classifications - self._classifications_started
+            # listings that haven't been classified or skipped yet, this one included. Those that failed to fetch or
+            # parse never will be
+            listings_left = (
+                self.stats.listings
+                - self._classifications_started
+                - self._classifications_known
+                - len(self.stats.over_budget_urls)
+                - self.stats.stages["fetch"].failed
+                - self.stats.stages["parse"].failed
+            )
+            if budget_left > 0 and item.score <= budget_left / max(1, listings_left):
+                self._classifications_started += 1
+                return True
+            self.stats.over_budget_urls.append(item.url)
+        get_metrics().inc("pipeline_over_budget_total")
+        log.info(
+            f"Skipping {item.url} (score {item.score:.2f}) to stay within the LLM budget"
+        )
+        return False
+
+    async def _classify_batch(self, batch: List[PipelineItem]) -> None:
+        stats = self.stats.stages["classify"]
+        start = time.perf_counter()
+        listings = [item.listing for item in batch]
+        if self.watches:
+            verdicts = await self.classifier.aclassify_watches(
+                listings,
+                [item.watches for item in batch],
+                self.watches.watches,
+                deadline=self.deadline,
+            )
+            results = [
+                (listing, self.watches.combine(listing_verdicts))
+                for listing, listing_verdicts in zip(listings, verdicts)
+            ]
+        else:
+            # listings the pre-filter or the cache knew the verdict of were classified by `_classify_loop` already
+            pending = [item for item in batch if item.classification is None]
+            if pending:
+                classified = await self.classifier.aclassify_many(
+                    [item.listing for item in pending],
+                    deadline=self.deadline,
+                    lookup=False,
+                )
+                for item, (_, classification) in zip(pending, classified):
+                    item.classification = classification
+            results = [(item.listing, item.classification) for item in batch]
+
+        alerts = []
+        classified = []
+        busy_seconds = time.perf_counter() - start
+        get_metrics().observe("pipeline_stage_seconds", busy_seconds, stage="classify")
+        with self._lock:
+            stats.busy_seconds += busy_seconds
+            for item, (_, classification) in zip(batch, results):
+                stats.processed += 1
+                item.classification = classification
+                if is_failed_classification(classification):
+                    stats.failed += 1
+                    self.stats.unfinished_urls.append(item.url)
+                    continue
+
+                self.stats.classify_latencies.append(time.monotonic() - item.seen_at)
+                classified.append(item)
+                if not classification.is_good:
+                    log.info(
+                        f"Rejected ({classification.confidence}): {classification.reason}"
+                    )
+                    continue
+
+                log.info("GOOD BIKE FOUND!")
+                log.info(f"\tReason: {classification.reason}")
+                log.info(f"\tConfidence: {classification.confidence}")
+                log.info(f"\tURL: {item.url}")
+                self.stats.good_bikes += 1
+                # send alerts for high-confidence matches, or for watches, good verdicts as confident as they ask for
+                if (
+                    classification.alert_watches
+                    if isinstance(classification, WatchVerdicts)
+                    else classification.confidence == "high"
+                ):
+                    self.stats.high_confidence_matches += 1
+                    alerts.append(item)
+
+        if self.on_classified:
+            for item in classified:
+                try:
+                    self.on_classified(item.listing, item.classification)
+                except Exception as e:
+                    log.error(
+                        f"on_classified failed for {item.url}: {e}", exc_info=True
+                    )
+
+        for item in alerts:
+            await asyncio.to_thread(self.queues["notify"].put, item)
+
+    def _batches_finished(
+        self,
+        finished: Iterable[asyncio.Task],
+        in_flight: Dict[asyncio.Task, List[PipelineItem]],
+    ) -> None:
+        """Take finished `_classify_batch` tasks out of `in_flight`, retrying the listings of any that raised next run"""
+        for task in finished:
+            batch = in_flight.pop(task)
+            try:
+                task.result()
+            except Exception as e:
+                log.error(
+                    f"classify failed for a batch of {len(batch)} listings: {e}",
+                    exc_info=True,
+                )
+                for item in batch:
+                    self._unfinished(item)
+
+    async def _classify_loop(self) -> None:
+        # batch being classified by each task, so a task that raises can have its listings retried
+        in_flight: Dict[asyncio.Task, List[PipelineItem]] = {}
+        done = False
+        while not done:
+            batch = await asyncio.to_thread(self._take_batch)
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+            if batch and self._past_deadline():
+                for item in batch:
+                    self._unfinished(item)
+                continue
+            if not self.watches:
+                # check the pre-filter and cache first, so only listings going to the LLM count against the budget
+                for item in batch:
+                    item.classification = self.classifier.lookup(item.listing)
+            batch = [item for item in batch if self._within_budget(item)]
+            if not batch:
+                continue
+
+            # backpressure: don't take more listings off the queue than we can classify at once
+            while len(in_flight) >= self.classify_concurrency:
+                finished, _ = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                self._batches_finished(finished, in_flight)
+            in_flight[asyncio.create_task(self._classify_batch(batch))] = batch
+
+        if in_flight:
+            finished, _ = await asyncio.wait(in_flight)
+            self._batches_finished(finished, in_flight)
+
+    def _run_classify_stage(self) -> None:
+        try:
+            asyncio.run(self._classify_loop())
+        except Exception as e:
+            log.error(f"classify stage failed: {e}", exc_info=True)
+            # keep draining, so upstream stages blocked on a full queue can finish
+            while (item := self.queues["classify"].get()) is not _DONE:
+                self._unfinished(item)
+        finally:
+            self._worker_finished("classify")
+
+    def _monitor_queues(self, stop: threading.Event) -> None:
+        next_report = time.monotonic() + self.queue_report_interval_seconds
+        while not stop.wait(self.queue_sample_interval_seconds):
+            depths = {stage: q.qsize() for stage, q in self.queues.items()}
+            with self._lock:
+                for stage, depth in depths.items():
+                    stats = self.stats.stages[stage]
+                    stats.max_queue_depth = max(stats.max_queue_depth, depth)
+                    stats.queue_depth_total += depth
+                    stats.queue_depth_samples += 1
+            if time.monotonic() >= next_report:
+                log.info(f"Pipeline queue depths: {depths}")
+                next_report += self.queue_report_interval_seconds
+
+    def run(self, urls: List[str], seen_at: Optional[float] = None) -> PipelineStats:
+        """
+        Run new listings through the pipeline, blocking until every stage has finished.
+
+        :param urls: URLs of the new listings, as found by CDC
+        :param seen_at: `time.monotonic()` time CDC found the listings at, defaults to now
+        :return: PipelineStats for the run
+        """
+        start = time.monotonic()
+        seen_at = seen_at if seen_at is not None else start
+        self.stats = PipelineStats(
+            stages={
+                stage: StageStats(workers=workers)
+                for stage, workers in self.workers.items()
+            },
+            listings=len(urls),
+        )
+        self._active_workers = dict(self.workers)
+        self._classifications_started = 0
+        self._classifications_known = 0
+
+        for url in urls:
+            self.queues["fetch"].put(PipelineItem(url=url, seen_at=seen_at))
+        for _ in range(self.workers["fetch"]):
+            self.queues["fetch"].put(_DONE)
+
+        handlers = {"fetch": self._fetch, "parse": self._parse, "notify": self._notify}
+        threads = [
+            threading.Thread(
+                target=self._run_stage,
+                args=(stage, handle),
+                name=f"pipeline-{stage}-{i}",
+                daemon=True,
+            )
+            for stage, handle in handlers.items()
+            for i in range(self.workers[stage])
+        ]
+        threads.append(
+            threading.Thread(
+                target=self._run_classify_stage, name="pipeline-classify", daemon=True
+            )
+        )
+
+        stop_monitor = threading.Event()
+        monitor = threading.Thread(
+            target=self._monitor_queues,
+            args=(stop_monitor,),
+            name="pipeline-monitor",
+            daemon=True,
+        )
+        monitor.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop_monitor.set()
+        monitor.join()
+
+        self.stats.elapsed_seconds = time.monotonic() - start
+        return self.stats
+
+    def log_stats(self) -> None:
+        """Log per-stage stats and latency percentiles of the last run"""
+        stats = self.stats
+        for stage, stage_stats in stats.stages.items():
+            log.info(
+                f"\t{stage}: {stage_stats.processed} processed ({stage_stats.failed} failed) by "
+                f"{stage_stats.workers} workers, {stage_stats.busy_seconds:.2f}s busy, queue depth "
+                f"mean={stage_stats.mean_queue_depth:.1f} max={stage_stats.max_queue_depth}"
+            )
+        log.info(
+            f"\tSeen -> alert latency: p50={percentile(stats.alert_latencies, 50):.2f}s "
+            f"p95={percentile(stats.alert_latencies, 95):.2f}s ({stats.alerts_sent} alerts)"
+        )
+        log.info(
+            f"\tSeen -> classified latency: p50={percentile(stats.classify_latencies, 50):.2f}s "
+            f"p95={percentile(stats.classify_latencies, 95):.2f}s"
+        )
+        if stats.over_budget_urls:
+            log.info(
+                f"\t{len(stats.over_budget_urls)} listings skipped to stay within the LLM budget"
+            )
+        if stats.unfinished_urls:
+            log.warning(
+                f"\t{len(stats.unfinished_urls)} listings failed or unfinished at the deadline, will retry next run"
+            )
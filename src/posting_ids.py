@@ -0,0 +1,192 @@
+"""Compact sorted set of Craigslist posting IDs, used to diff and persist SAPI snapshots"""
+
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from itertools import accumulate, islice
+from operator import lt, sub
+from typing import Iterable, Iterator
+
+# serialized layout: magic, delta typecode, count, first posting ID, then the zlib-compressed delta byte planes
+_HEADER = struct.Struct("<4scIq")
+_MAGIC = b"PID1"
+
+
+@dataclass
+class PostingIdDiff:
+    """Result of diffing two posting ID sets"""
+
+    added: array
+    removed: array
+    unchanged: int
+
+
+class PostingIdSet:
+    """
+    Immutable sorted set of posting IDs backed by a flat `array('q')`, 8 bytes per ID instead of the ~60 bytes per
+    entry of a python `set` of ints.
+
+    Diffs walk both sorted arrays together, skipping over runs of unchanged IDs with C-level slice comparisons and over
+    runs of added/removed IDs with binary search. Between two runs most listings are unchanged and new listings all
+    have the highest IDs, so a diff costs close to one `memcmp` over the arrays.
+    """
+
+    __slots__ = ("_ids",)
+
+    def __init__(self, posting_ids: Iterable[int] = ()):
+        """
+        :param posting_ids: Absolute posting IDs, in any order and possibly with duplicates
+        """
+        self._ids = array("q", sorted(set(posting_ids)))
+
+    @classmethod
+    def _from_sorted_array(cls, ids: array) -> "PostingIdSet":
+        instance = cls.__new__(cls)
+        instance._ids = ids
+        return instance
+
+    @classmethod
+    def from_offsets(
+        cls, min_posting_id: int, offsets: Iterable[int]
+    ) -> "PostingIdSet":
+        """
+        Build a set from SAPI item offsets.
+
+        :param min_posting_id: `decode.minPostingId` from the SAPI response
+        :param offsets: Item offsets from the SAPI response, i.e. `item[0]` for each item
+        :return: PostingIdSet of absolute posting IDs
+        """
+        ids = array("q", map(min_posting_id.__add__, offsets))
+        # SAPI items normally come back sorted by ID, in which case we can skip the sort + dedupe
+        if all(map(lt, ids, islice(ids, 1, None))):
+            return cls._from_sorted_array(ids)
+        return cls(ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __contains__(self, posting_id: int) -> bool:
+        i = bisect_left(self._ids, posting_id)
+        return i < len(self._ids) and self._ids[i] == posting_id
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PostingIdSet) and self._ids == other._ids
+
+    def __repr__(self) -> str:
+        return f"PostingIdSet(len={len(self)})"
+
+    def without(self, posting_ids: Iterable[int]) -> "PostingIdSet":
+        """
+        Copy of this set with the given posting IDs removed.
+
+        :param posting_ids: Posting IDs to remove
+        :return: New PostingIdSet, or this one if none of the IDs were in it
+        """
+        excluded = {posting_id for posting_id in posting_ids if posting_id in self}
+        if not excluded:
+            return self
+        return self._from_sorted_array(
+            array("q", (i for i in self._ids if i not in excluded))
+        )
+
+    def diff(self, previous: "PostingIdSet") -> PostingIdDiff:
+        """
+        Diff this set against a previous one.
+
+        :param previous: Posting ID set from an earlier snapshot
+        :return: PostingIdDiff with the sorted IDs added and removed since `previous`, and the unchanged count
+        """
+        prev, curr = previous._ids, self._ids
+        n_prev, n_curr = len(prev), len(curr)
+        added, removed = array("q"), array("q")
+        unchanged = 0
+        i = j = 0
+
+        while i < n_prev and j < n_curr:
+            if prev[i] == curr[j]:
+                # gallop over the run of unchanged IDs, then binary search for where it ends
+                run = 1
+                while (
+                    i + run <= n_prev
+                    and j + run <= n_curr
+                    and prev[i : i + run] == curr[j : j + run]
+                ):
+                    run *= 2
+                lo, hi = run // 2, min(run, n_prev - i, n_curr - j)
+                while lo < hi:
+                    mid = (lo + hi + 1) // 2
+                    if prev[i : i + mid] == curr[j : j + mid]:
+                        lo = mid
+                    else:
+                        hi = mid - 1
+                unchanged += lo
+                i += lo
+                j += lo
+            elif prev[i] < curr[j]:
+                end = bisect_left(prev, curr[j], i)
+                removed.extend(prev[i:end])
+                i = end
+            else:
+                end = bisect_left(curr, prev[i], j)
+                added.extend(curr[j:end])
+                j = end
+
+        removed.extend(prev[i:])
+        added.extend(curr[j:])
+        return PostingIdDiff(added=added, removed=removed, unchanged=unchanged)
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the set: IDs are delta-encoded, the deltas are split into byte planes (all low bytes, then all second
+        bytes, ...) and the planes are zlib-compressed. Deltas between consecutive posting IDs are small, so the high
+        planes are almost all zeros and compress away.
+
+        :return: Serialized bytes, readable with `from_bytes`
+        """
+        if not self._ids:
+            return _HEADER.pack(_MAGIC, b"I", 0, 0)
+
+        deltas = array("q", map(sub, self._ids[1:], self._ids[:-1]))
+        typecode = "I" if not deltas or max(deltas) < 2**32 else "Q"
+        deltas = array(typecode, deltas)
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        raw = deltas.tobytes()
+        width = array(typecode).itemsize
+        planes = b"".join(raw[k::width] for k in range(width))
+
+        header = _HEADER.pack(_MAGIC, typecode.encode(), len(self._ids), self._ids[0])
+        return header + zlib.compress(planes, 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PostingIdSet":
+        """
+        Deserialize a set written by `to_bytes`.
+
+        :param data: Serialized bytes
+        :return: PostingIdSet
+        """
+        magic, typecode, count, first = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a serialized PostingIdSet")
+        if count == 0:
+            return cls()
+
+        typecode = typecode.decode()
+        width = array(typecode).itemsize
+        planes = zlib.decompress(data[_HEADER.size :])
+        n_deltas = count - 1
+        raw = bytearray(n_deltas * width)
+        for k in range(width):
+            raw[k::width] = planes[k * n_deltas : (k + 1) * n_deltas]
+
+        deltas = array(typecode, bytes(raw))
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        return cls._from_sorted_array(array("q", accumulate(deltas, initial=first)))
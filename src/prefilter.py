@@ -0,0 +1,196 @@
+"""Cheap deterministic pre-filter that rejects obviously bad listings before they reach the LLM"""
+
+import json
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from models import BikeClassification, BikeListingData
+
+log = logging.getLogger(__name__)
+
+
+class PrefilterRule(BaseModel):
+    """A rule rejecting listings whose fields match any of its patterns"""
+
+    name: str
+    reason: str = Field(
+        description="Reason used for the synthetic classification. `{match}` is replaced with the matched text"
+    )
+    fields: List[str] = Field(
+        description="BikeListingData fields the patterns are matched against"
+    )
+    patterns: List[str] = Field(
+        description="Case-insensitive regexes, any of which triggers the rule"
+    )
+    unless: List[str] = Field(
+        default_factory=list,
+        description="Case-insensitive regexes that, if any matches the title or body, cancel the rule",
+    )
+
+
+# Mirrors the auto-reject criteria in the classifier's system prompt. Kept conservative: a wrongly rejected good bike
+# never gets an alert, while a bad bike that slips through just costs an LLM call
+DEFAULT_PREFILTER_RULES = [
+    PrefilterRule(
+        name="wrong_type",
+        reason="Listed as a {match} bike, not a road bike",
+        fields=["bicycle_type"],
+        patterns=[
+            r"hybrid|comfort|mountain|cruiser|electric|bmx|kids|folding|tandem|recumbent|tricycle|unicycle"
+        ],
+    ),
+    PrefilterRule(
+        name="wrong_type_title",
+        reason="Title says {match}, not a road bike",
+        fields=["title"],
+        patterns=[
+            r"\be-?bikes?\b|\belectric (?:bike|bicycle|assist)\b|\bpedal[- ]assist\b",
+            r"\bbmx\b|\bhybrid\b|\bcruiser\b|\bfat ?bike\b|\bmountain bike\b|\bmtb\b",
+            r"\bkids?'?\b|\bchildren'?s\b|\bbalance bike\b|\btrike\b",
+        ],
+    ),
+    PrefilterRule(
+        name="low_end_groupset",
+        reason="Low-end {match} components",
+        fields=["title", "body"],
+        patterns=[r"\b(?:sora|claris|tourney|tiagra)\b"],
+        unless=[
+            r"\b105\b|\bultegra\b|\bdura[- ]?ace\b|\brival\b|\bforce\b|\bsram red\b|\bred (?:etap|axs)\b"
+        ],
+    ),
+    PrefilterRule(
+        name="vintage",
+        reason="Vintage bike ({match}), not a modern road bike",
+        fields=["title"],
+        patterns=[
+            r"\bvintage\b|\bretro\b|(?<![$\d,.])\b19[789]\d\b|\b(?:19)?[789]0'?s\b"
+        ],
+    ),
+    PrefilterRule(
+        name="vintage_components",
+        reason="Vintage {match}, not a modern groupset",
+        fields=["body"],
+        patterns=[r"\bdown ?tube shift(?:ers|ing)\b|\bfriction shift(?:ers|ing)\b"],
+    ),
+    PrefilterRule(
+        name="department_store_brand",
+        reason="Department store brand ({match})",
+        fields=["manufacturer", "title"],
+        patterns=[r"\b(?:huffy|roadmaster|kent|magna|murray|thruster|ozone ?500)\b"],
+    ),
+]
+
+
+@dataclass
+class PrefilterStats:
+    """Counts of listings checked and rejected by the pre-filter"""
+
+    checked: int = 0
+    rejected: int = 0
+    rejected_by_rule: Dict[str, int] = field(default_factory=dict)
+
+
+class PreFilter:
+    """
+    Runs the rules over a listing in order, rejecting it on the first rule that matches and isn't cancelled by its
+    `unless` patterns. Each rule's patterns are compiled into a single regex, so a field is scanned once per rule.
+    """
+
+    def __init__(self, rules: Optional[List[PrefilterRule]] = None):
+        """
+        :param rules: Rules to apply, defaults to `DEFAULT_PREFILTER_RULES`
+        """
+        self.rules = rules if rules is not None else DEFAULT_PREFILTER_RULES
+        self.stats = PrefilterStats()
+        self._stats_lock = threading.Lock()
+
+        # one regex per rule, any of whose patterns triggers it. Each rule is matched on its own: in a single regex
+        # alternating between rules, only the first rule can match at a given position, so a rule cancelled by its
+        # `unless` would hide a later rule matching the same text
+        self._rule_patterns: List[re.Pattern] = [
+            re.compile("|".join(f"(?:{p})" for p in rule.patterns), re.IGNORECASE)
+            for rule in self.rules
+        ]
+        self._unless_patterns: Dict[int, re.Pattern] = {
+            i: re.compile("|".join(f"(?:{p})" for p in rule.unless), re.IGNORECASE)
+            for i, rule in enumerate(self.rules)
+            if rule.unless
+        }
+
+    @classmethod
+    def from_file(cls, path: Path) -> "PreFilter":
+        """
+        Load rules from a JSON file holding a list of rule objects.
+
+        :param path: Path to the JSON rules file
+        :return: PreFilter applying those rules
+        """
+        rules = json.loads(Path(path).read_text())
+        return cls([PrefilterRule.model_validate(rule) for rule in rules])
+
+    def check(self, listing: BikeListingData) -> Optional[BikeClassification]:
+        """
+        Check a listing against the rules.
+
+        :param listing: Parsed BikeListingData
+        :return: A synthetic rejecting BikeClassification if a rule matched, else None
+        """
+        rejection = None
+        for rule_index, rule in enumerate(self.rules):
+            match = self._match(rule_index, listing)
+            if match is None:
+                continue
+            unless = self._unless_patterns.get(rule_index)
+            if unless and (unless.search(listing.title) or unless.search(listing.body)):
+                continue
+            rejection = BikeClassification(
+                is_good=False,
+                reason=f"Pre-filter: {rule.reason.format(match=match)}",
+                confidence="high",
+            )
+            break
+
+        with self._stats_lock:
+            self.stats.checked += 1
+            if rejection:
+                self.stats.rejected += 1
+                self.stats.rejected_by_rule[rule.name] = (
+                    self.stats.rejected_by_rule.get(rule.name, 0) + 1
+                )
+
+        if rejection:
+            log.info(f"Pre-filter rejected ({rule.name}): {listing.title}")
+        return rejection
+
+    def _match(self, rule_index: int, listing: BikeListingData) -> Optional[str]:
+        """
+        :param rule_index: Index of the rule in `self.rules`
+        :param listing: Parsed BikeListingData
+        :return: The first text of the rule's fields matching one of its patterns, in field order, or None
+        """
+        pattern = self._rule_patterns[rule_index]
+        for field_name in self.rules[rule_index].fields:
+            text = getattr(listing, field_name, None)
+            if not text:
+                continue
+            match = pattern.search(text)
+            if match:
+                return match.group()
+        return None
+
+    def reset_stats(self) -> None:
+        """Start counting rejections from zero, e.g. at the start of each run of a long-lived pre-filter"""
+        with self._stats_lock:
+            self.stats = PrefilterStats()
+
+    def log_stats(self) -> None:
+        """Log how many listings the pre-filter rejected, i.e. how many LLM calls it saved"""
+        log.info(
+            f"Pre-filter: rejected {self.stats.rejected}/{self.stats.checked} listings {self.stats.rejected_by_rule}"
+        )
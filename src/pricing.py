@@ -0,0 +1,235 @@
+"""
+Numeric normalization of the free-form listing attributes we compare on - price, frame size and wheel size - and
+market-value scoring of listings against the prices of earlier listings of the same bike in the archive.
+
+The scorer reads the archive's price, manufacturer and model columns in one pass and keeps a sorted price list per
+model (and per manufacturer, for models we haven't seen enough of). A listing's score is the percentile its price
+falls at among those prices: 0 is the cheapest we've seen, 1 the priciest.
+"""
+
+import bisect
+import logging
+import re
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from models import BikeListingData
+
+if TYPE_CHECKING:
+    from archive import ListingArchive
+
+log = logging.getLogger(__name__)
+
+_PRICE_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+CM_PER_INCH = 2.54
+# bare frame sizes up to this are taken as inches (mountain/hybrid sizing), anything bigger as cm (road sizing)
+_MAX_INCH_FRAME_SIZE = 30
+
+# ISO bead seat diameter in mm, by how wheel sizes are written in listings
+_WHEEL_SIZES_MM = {
+    "700": 622,
+    "29": 622,
+    "28": 622,
+    "27.5": 584,
+    "650b": 584,
+    "650c": 571,
+    "27": 630,
+    "26": 559,
+    "24": 507,
+    "20": 406,
+    "18": 355,
+    "16": 305,
+    "14": 254,
+    "12": 203,
+}
+
+# prices below this are placeholders ("$1", "$0 - make an offer") rather than asking prices
+MIN_PRICE = 10.0
+
+# score of a listing without a price, or without any earlier listings to compare it to
+NEUTRAL_SCORE = 0.5
+
+
+def parse_price(price: Optional[str]) -> Optional[float]:
+    """
+    :param price: Listing price text, e.g. `$1,250`
+    :return: The price as a number, or None if there isn't one
+    """
+    if not price:
+        return None
+    match = _PRICE_PATTERN.search(price)
+    return float(match.group().replace(",", "")) if match else None
+
+
+def parse_frame_size_cm(frame_size: Optional[str]) -> Optional[float]:
+    """
+    :param frame_size: Listing frame size text, e.g. `56cm`, `54 cm`, `19"` or `21 in`
+    :return: The frame size in cm, or None if it isn't a number (e.g. `M`)
+    """
+    if not frame_size:
+        return None
+    match = _NUMBER_PATTERN.search(frame_size)
+    if not match:
+        return None
+    size = float(match.group())
+    text = frame_size.lower()
+    if "cm" in text:
+        return size
+    if '"' in text or "in" in text or size <= _MAX_INCH_FRAME_SIZE:
+        return round(size * CM_PER_INCH, 1)
+    return size
+
+
+def parse_wheel_size_mm(wheel_size: Optional[str]) -> Optional[float]:
+    """
+    :param wheel_size: Listing wheel size text, e.g. `700C`, `29 in` or `27.5"`
+    :return: The wheel's ISO bead seat diameter in mm, which puts sizes written differently (700c and 29") on the same
+        scale, or None if the size isn't recognized
+    """
+    if not wheel_size:
+        return None
+    text = wheel_size.lower().replace(" ", "")
+    for name in ("650b", "650c"):
+        if name in text:
+            return float(_WHEEL_SIZES_MM[name])
+    match = _NUMBER_PATTERN.search(text)
+    if not match:
+        return None
+    size = _WHEEL_SIZES_MM.get(match.group().removesuffix(".0"))
+    return float(size) if size is not None else None
+
+
+def market_key(
+    manufacturer: Optional[str], model: Optional[str]
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    :param manufacturer: Listing manufacturer
+    :param model: Listing model name
+    :return: (manufacturer, model), lowercased with whitespace collapsed so spellings of the same bike group together
+    """
+
+    def normalize(value: Optional[str]) -> Optional[str]:
+        return (" ".join(value.lower().split()) or None) if value else None
+
+    return normalize(manufacturer), normalize(model)
+
+
+class MarketValueScorer:
+    """
+    Scores listings by how their price compares to earlier listings of the same model, falling back to the same
+    manufacturer and then to every listing when there are fewer than `min_samples` to compare against.
+    """
+
+    def __init__(
+        self,
+        prices: Dict[Tuple[Optional[str], Optional[str]], List[float]],
+        min_samples: int = 5,
+    ):
+        """
+        :param prices: Earlier prices by `market_key`. Manufacturer-wide and overall distributions are built from them
+        :param min_samples: Min number of earlier prices of a model or manufacturer to score against it
+        """
+        self.min_samples = min_samples
+        by_model: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        by_manufacturer: Dict[str, List[float]] = defaultdict(list)
+        overall: List[float] = []
+        for (manufacturer, model), values in prices.items():
+            if manufacturer and model:
+                by_model[(manufacturer, model)].extend(values)
+            if manufacturer:
+                by_manufacturer[manufacturer].extend(values)
+            overall.extend(values)
+        self._by_model = {
+            key: sorted(values)
+            for key, values in by_model.items()
+            if len(values) >= min_samples
+        }
+        self._by_manufacturer = {
+            key: sorted(values)
+            for key, values in by_manufacturer.items()
+            if len(values) >= min_samples
+        }
+        self._overall = sorted(overall) if len(overall) >= min_samples else []
+        self.samples = len(overall)
+
+    @classmethod
+    def from_archive(
+        cls,
+        archive: "ListingArchive",
+        since: Optional[float] = None,
+        min_samples: int = 5,
+    ) -> "MarketValueScorer":
+        """
+        Build a scorer from the prices of archived listings, reading only the columns it needs.
+
+        :param archive: Archive of classified listings
+        :param since: Unix epoch timestamp of the earliest listings to include, e.g. to leave out stale prices
+        :param min_samples: Min number of earlier prices of a model or manufacturer to score against it
+        :return: MarketValueScorer instance
+        """
+        start = time.perf_counter()
+        prices: Dict[Tuple[Optional[str], Optional[str]], List[float]] = defaultdict(
+            list
+        )
+        for chunk in archive.scan(["price", "manufacturer", "model"], start=since):
+            for price, manufacturer, model in zip(
+                chunk["price"], chunk["manufacturer"], chunk["model"]
+            ):
+                # listings without a price are NaN, which compares False
+                if price >= MIN_PRICE:
+                    prices[market_key(manufacturer, model)].append(price)
+        scorer = cls(prices, min_samples=min_samples)
+        log.info(
+            f"Built market prices from {scorer.samples} archived listings ({len(scorer._by_model)} models, "
+            f"{len(scorer._by_manufacturer)} manufacturers) in {time.perf_counter() - start:.2f}s"
+        )
+        return scorer
+
+    def distribution(self, listing: BikeListingData) -> List[float]:
+        """
+        :param listing: Parsed listing
+        :return: Sorted earlier prices the listing is compared to, empty if there aren't enough of any
+        """
+        manufacturer, model = market_key(listing.manufacturer, listing.model)
+        return (
+            self._by_model.get((manufacturer, model))
+            or self._by_manufacturer.get(manufacturer)
+            or self._overall
+        )
+
+    def percentiles(
+        self, listing: BikeListingData, qs: Iterable[float] = (10, 50, 90)
+    ) -> Optional[List[float]]:
+        """
+        :param listing: Parsed listing
+        :param qs: Percentiles to compute, between 0 and 100
+        :return: Percentiles of the earlier prices the listing is compared to, or None if there aren't enough
+        """
+        prices = self.distribution(listing)
+        if not prices:
+            return None
+        return [prices[min(len(prices) - 1, int(q / 100 * len(prices)))] for q in qs]
+
+    def score(self, listing: BikeListingData) -> float:
+        """
+        :param listing: Parsed listing
+        :return: Percentile of the listing's price among earlier prices of the same bike, between 0 (cheapest) and 1
+            (priciest). `NEUTRAL_SCORE` if it has no price or there's nothing to compare it to
+        """
+        price = parse_price(listing.price)
+        prices = self.distribution(listing)
+        if price is None or price < MIN_PRICE or not prices:
+            return NEUTRAL_SCORE
+        # mid-rank, so a price equal to every earlier one scores in the middle rather than at either end
+        rank = bisect.bisect_left(prices, price) + bisect.bisect_right(prices, price)
+        return rank / (2 * len(prices))
+
+    def score_many(self, listings: Iterable[BikeListingData]) -> List[float]:
+        """
+        :param listings: Parsed listings
+        :return: Score of each listing, see `score`
+        """
+        return [self.score(listing) for listing in listings]
@@ -0,0 +1,155 @@
+"""
+Builds the listing part of classification prompts. Instead of the first N characters of a listing's description, its
+sentences are scored for the mentions that decide a verdict - components, brands, years, sizes and bike types - and
+the best ones are packed into a token budget, in their original order. Fields the parser didn't find are left out
+rather than sent as `Unknown`.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from models import BikeListingData
+
+# rough chars per token for English text, good enough to budget a prompt without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# marks where sentences were left out of a description
+GAP = "..."
+
+# sentence boundaries: end punctuation followed by whitespace, or line breaks
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\s*\n+\s*")
+
+# kind of mention -> (weight, pattern). A sentence scores the sum of the weights of the kinds it mentions
+SIGNALS = {
+    "component": (
+        3,
+        re.compile(
+            # SRAM's and Campagnolo's group names that are also everyday words (red, force, record...) only count
+            # next to the maker's name or SRAM's shifting
+            r"\b(?:105|ultegra|dura[- ]?ace|tiagra|sora|claris|tourney|grx|etap|axs|di2|"
+            r"sram (?:red|force|rival|apex)|(?:red|force|rival|apex) (?:etap|axs|22|1x|2x)|"
+            r"campagnolo|campy|chorus|centaur|veloce|groupset|gruppo|drivetrain|derailleurs?|shifters?|"
+            r"crankset|r\d{4}|\d{1,2}[- ]?speed|[12] ?x ?\d{1,2})\b",
+            re.I,
+        ),
+    ),
+    "year": (2, re.compile(r"\b(?:19[5-9]\d|20[0-4]\d)s?\b|\b[5-9]0'?s\b")),
+    "brand": (
+        2,
+        re.compile(
+            r"\b(?:cannondale|trek|specialized|giant|cervelo|cervélo|bianchi|scott|fuji|cube|canyon|orbea|"
+            r"pinarello|colnago|bmc|ridley|wilier|kona|salsa|surly|jamis|raleigh|schwinn|diamondback|"
+            r"motobecane|huffy|roadmaster|kent|magna|murray|shimano|sram)\b",
+            re.I,
+        ),
+    ),
+    "size": (
+        1,
+        re.compile(
+            r"\b\d{2}(?:\.\d)? ?(?:cm|in(?:ch(?:es)?)?\b|\")|\b(?:700 ?c?|650 ?b|29er|27\.5)\b|"
+            r"\b(?:x-?small|small|medium|x-?large|large)\b",
+            re.I,
+        ),
+    ),
+    "type": (
+        1,
+        re.compile(
+            r"\b(?:road|hybrid|mountain|cruiser|e-?bike|electric|gravel|commuter|vintage|carbon|aluminum|aluminium|"
+            r"alloy|steel|titanium|disc|rim brakes?)\b",
+            re.I,
+        ),
+    ),
+}
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    :param text: Listing description
+    :return: Its non-empty sentences and lines
+    """
+    return [
+        sentence.strip()
+        for sentence in _SENTENCE_BOUNDARY.split(text)
+        if sentence.strip()
+    ]
+
+
+def score_sentence(sentence: str) -> int:
+    """
+    :param sentence: Sentence of a listing description
+    :return: How much it says about what decides a verdict, 0 for nothing
+    """
+    return sum(
+        weight for weight, pattern in SIGNALS.values() if pattern.search(sentence)
+    )
+
+
+class PromptBuilder:
+    """Formats listings for the classifier's prompts, with each description cut down to a token budget"""
+
+    def __init__(self, max_description_tokens: int = 100):
+        """
+        :param max_description_tokens: Max number of tokens of a listing's description to send
+        """
+        self.max_description_tokens = max_description_tokens
+
+    def description(self, body: str) -> str:
+        """
+        Cut a description down to the budget: whole if it fits, otherwise its highest scoring sentences, in their
+        original order with gaps marked. Sentences mentioning nothing of interest are only sent if the whole
+        description fits.
+
+        :param body: Listing description
+        :return: Description to send
+        """
+        body = body.strip()
+        budget = self.max_description_tokens * CHARS_PER_TOKEN
+        if len(body) <= budget:
+            return body
+
+        sentences = split_sentences(body)
+        scores = [score_sentence(sentence) for sentence in sentences]
+        chosen = []
+        used = 0
+        # best first, earlier first among equals
+        for i in sorted(range(len(sentences)), key=lambda i: (-scores[i], i)):
+            if scores[i] == 0:
+                break
+            # room for the space and gap mark before it too
+            cost = len(sentences[i]) + len(GAP) + 2
+            if used + cost <= budget:
+                chosen.append(i)
+                used += cost
+        if not chosen:
+            # nothing worth picking out, or only sentences longer than the whole budget: fall back to the start
+            return f"{body[: budget - len(GAP)].rstrip()}{GAP}"
+
+        spans = []
+        previous = -1
+        for i in sorted(chosen):
+            if i != previous + 1:
+                spans.append(GAP)
+            spans.append(sentences[i])
+            previous = i
+        if previous != len(sentences) - 1:
+            spans.append(GAP)
+        return " ".join(spans)
+
+    def format_listing(self, listing: BikeListingData) -> str:
+        """
+        :param listing: Parsed listing
+        :return: The listing as it goes into a prompt, in the format of the few-shot examples
+        """
+        fields: List[Tuple[str, Optional[str]]] = [
+            ("Title", f'"{listing.title}"'),
+            ("Price", listing.price),
+            ("Bicycle Type", listing.bicycle_type),
+            ("Frame Size", listing.frame_size),
+            ("Frame Material", listing.frame_material),
+            ("Wheel Size", listing.wheel_size),
+            ("Manufacturer", listing.manufacturer),
+            ("Model", listing.model),
+            ("Condition", listing.condition),
+            ("Description", self.description(listing.body)),
+        ]
+        return "\n".join(f"{name}: {value}" for name, value in fields if value)
@@ -0,0 +1,192 @@
+"""Rate limiting primitives shared by our Craigslist and LLM clients"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate` per second up to `capacity`, and each request
+    consumes one token, so short bursts are allowed while the long-run request rate stays bounded.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Initialize the token bucket.
+
+        :param rate: Number of tokens added per second
+        :param capacity: Maximum number of tokens the bucket can hold (burst size). Defaults to `max(rate, 1)`
+        """
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Take `tokens` from the bucket without blocking.
+
+        :param tokens: Number of tokens to take
+        :return: True if the tokens were available and taken
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def seconds_until_available(self, tokens: float = 1.0) -> float:
+        """
+        :param tokens: Number of tokens wanted
+        :return: Number of seconds until `tokens` will be available, 0 if they already are
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Block until `tokens` are available, then take them.
+
+        :param tokens: Number of tokens to take
+        :return: Number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+
+def full_jitter_backoff(
+    attempt: int,
+    base_seconds: float,
+    max_seconds: float,
+    retry_after: Optional[str] = None,
+) -> float:
+    """
+    Delay before retrying a failed request: full-jitter exponential backoff, honoring the server's `Retry-After`
+    header when it sends one.
+
+    :param attempt: Zero-based number of the attempt that just failed
+    :param base_seconds: Base delay, doubled with every attempt
+    :param max_seconds: Upper bound on the delay
+    :param retry_after: Value of the response's `Retry-After` header, if any
+    :return: Number of seconds to wait
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), max_seconds)
+        except ValueError:
+            pass  # an HTTP date rather than a number of seconds
+    return random.uniform(0, min(max_seconds, base_seconds * 2**attempt))
+
+
+class AIMDLimiter:
+    """
+    Async concurrency limiter whose limit adapts to rate limiting, AIMD style like TCP congestion control: every
+    successful request raises the limit by `increase / limit` (so by about `increase` per round of requests), and a
+    rate-limited request cuts it by `decrease_factor`. Requests that were already in flight when the limit was cut
+    don't cut it again, so a single burst of 429s counts as one congestion event.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial_limit: Optional[float] = None,
+        min_limit: float = 1.0,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        Initialize the limiter.
+
+        :param max_limit: Max number of concurrent requests, no matter how well things are going
+        :param initial_limit: Starting concurrency limit. Defaults to half of `max_limit`
+        :param min_limit: Lower bound on the concurrency limit
+        :param increase: Additive increase of the limit per round of successful requests
+        :param decrease_factor: Multiplicative decrease of the limit on a rate-limited request
+        """
+        if max_limit < 1:
+            raise ValueError(
+                f"AIMD limiter max limit must be at least 1, got {max_limit}"
+            )
+
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = (
+            initial_limit if initial_limit is not None else max(1.0, max_limit / 2)
+        )
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.rate_limited_count = 0
+
+        self._last_decrease_at = float("-inf")
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio primitives belong to the event loop they're first used on, and callers may use a new loop per run
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+        return self._condition
+
+    async def acquire(self) -> float:
+        """
+        Wait until a request may be sent under the current limit.
+
+        :return: Time the request was let through, to pass back to `release` and `record_rate_limited`
+        """
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self) -> None:
+        """Mark a request let through by `acquire` as finished"""
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def record_success(self) -> None:
+        """Additively increase the limit after a successful request"""
+        self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def record_rate_limited(self, started_at: float) -> None:
+        """
+        Multiplicatively decrease the limit after a rate-limited request.
+
+        :param started_at: Time the request was let through, as returned by `acquire`
+        """
+        self.rate_limited_count += 1
+        if started_at < self._last_decrease_at:
+            return
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self._last_decrease_at = time.monotonic()
@@ -0,0 +1,152 @@
+"""
+Streaming decoder for Craigslist SAPI `search/full` responses.
+
+CDC only needs `data.decode.minPostingId` and the first column (the posting ID offset) of each row in `data.items`.
+Rather than materializing the whole payload with `json.loads`, this scans the response as it arrives and keeps only
+those values, so memory stays flat no matter how large the search is.
+"""
+
+import codecs
+import re
+from array import array
+from typing import Iterable, Optional, Tuple
+
+# JSON tokens we care about: object keys (with their colon), strings, brackets and integers. Everything else (commas,
+# whitespace, floats' fractional parts, literals) is skipped over by the regex search
+_TOKEN = re.compile(r'("(?:[^"\\]|\\.)*")(\s*:)?|([\[\]{}])|(-?\d+)')
+_TRAILING_WHITESPACE = re.compile(r"\s*\Z")
+
+# fast path for a whole row of `data.items` (with at most one level of nested arrays), capturing its posting ID offset.
+# Rows that don't match, e.g. because they're cut off at the end of the buffer, go through the token loop instead
+_STRING = r'"(?:[^"\\]|\\.)*+"'
+_ITEM_ROW = re.compile(
+    rf"\s*,?\s*\[\s*(\d+)(?:{_STRING}|[^\"\[\]]++|\[(?:{_STRING}|[^\"\[\]]++)*+\])*+\]"
+)
+
+# path of containers (by key) leading to the values we extract
+_DECODE_PATH = ("data", "decode")
+_ITEMS_PATH = ("data", "items")
+
+
+class SapiStreamDecoder:
+    """
+    Incremental decoder fed with raw response chunks via `feed`. Chunk boundaries can fall anywhere, including in the
+    middle of a string, number or multi-byte character.
+    """
+
+    def __init__(self):
+        self.min_posting_id: Optional[int] = None
+        self.offsets = array("q")
+
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        # stack of keys for the containers we're inside of (None for arrays and the root object)
+        self._path: list = []
+        self._pending_key: Optional[str] = None
+        # True while we're inside an item row and haven't read its posting ID offset yet
+        self._awaiting_offset = False
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        Feed the next chunk of the response body.
+
+        :param chunk: Raw bytes of the response body
+        """
+        self._buffer += self._utf8.decode(chunk)
+        self._scan(final=False)
+
+    def close(self) -> Tuple[int, array]:
+        """
+        Finish decoding once the whole response has been fed.
+
+        :return: Tuple of (`decode.minPostingId`, posting ID offsets of `data.items` in response order)
+        """
+        self._buffer += self._utf8.decode(b"", final=True)
+        self._scan(final=True)
+
+        if self.min_posting_id is None:
+            raise ValueError("SAPI response is missing data.decode.minPostingId")
+        return self.min_posting_id, self.offsets
+
+    def _scan(self, final: bool) -> None:
+        buffer = self._buffer
+        path = self._path
+        end = len(buffer)
+        pos = 0
+
+        while True:
+            if not self._awaiting_offset and tuple(path[1:]) == _ITEMS_PATH:
+                row = _ITEM_ROW.match(buffer, pos)
+                while row:
+                    self.offsets.append(int(row.group(1)))
+                    pos = row.end()
+                    row = _ITEM_ROW.match(buffer, pos)
+
+            match = _TOKEN.search(buffer, pos)
+            if match is None:
+                # nothing left but separators and partial tokens, keep them around until more data arrives
+                if final:
+                    pos = end
+                break
+
+            # an unmatched quote before the token means we're in the middle of a string that hasn't fully arrived yet
+            if not final and buffer.find('"', pos, match.start()) != -1:
+                pos = buffer.find('"', pos, match.start())
+                break
+
+            # a token touching the end of the buffer may be cut off (a number, or a key whose colon hasn't arrived)
+            if not final and (
+                match.end() == end
+                or (
+                    match.group(1)
+                    and not match.group(2)
+                    and _TRAILING_WHITESPACE.match(buffer, match.end())
+                )
+            ):
+                pos = match.start()
+                break
+
+            pos = match.end()
+            string, colon, bracket, number = match.groups()
+
+            if bracket in ("[", "{"):
+                path.append(self._pending_key)
+                self._pending_key = None
+                # each row of `data.items` is itself an array, whose first element is the posting ID offset
+                self._awaiting_offset = (
+                    bracket == "[" and tuple(path[1:-1]) == _ITEMS_PATH
+                )
+            elif bracket:
+                path.pop()
+                self._pending_key = None
+                self._awaiting_offset = False
+            elif colon:
+                self._pending_key = string[1:-1]
+            elif number is not None:
+                if self._awaiting_offset:
+                    self.offsets.append(int(number))
+                    self._awaiting_offset = False
+                elif (
+                    self._pending_key == "minPostingId"
+                    and tuple(path[1:]) == _DECODE_PATH
+                ):
+                    self.min_posting_id = int(number)
+                self._pending_key = None
+            else:
+                self._awaiting_offset = False
+                self._pending_key = None
+
+        self._buffer = buffer[pos:]
+
+
+def decode_snapshot_stream(chunks: Iterable[bytes]) -> Tuple[int, array]:
+    """
+    Decode the posting ID offsets and decode base out of a streamed SAPI `search/full` response.
+
+    :param chunks: Raw chunks of the response body, e.g. from `response.iter_content()`
+    :return: Tuple of (`decode.minPostingId`, posting ID offsets of `data.items` in response order)
+    """
+    decoder = SapiStreamDecoder()
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.close()
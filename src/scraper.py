@@ -1,19 +1,204 @@
-from typing import Optional
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, Optional
+from urllib.parse import urlsplit
 
 import requests
-from bs4 import BeautifulSoup
 
+from http_client import HttpClient, get_http_client
+from metrics import get_metrics
 from models import BikeListingData
+from rate_limit import TokenBucket, full_jitter_backoff
 
+log = logging.getLogger(__name__)
 
+# status codes worth retrying - craigslist throttles with 429s and occasionally returns transient 5xxs
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+# maps the class of each `div.attr` on a listing page to the BikeListingData field it holds
+LISTING_ATTR_FIELDS = {
+    "bicycle_type": "bicycle_type",
+    "bicycle_wheel_size": "wheel_size",
+    "bicycle_frame_size_freeform": "frame_size",
+    "bicycle_frame_material": "frame_material",
+    "sale_manufacturer": "manufacturer",
+    "sale_model": "model",
+    "condition": "condition",
+}
+
+# elements that never have an end tag, so they must not be pushed onto the parser's element stack
+_VOID_ELEMENTS = frozenset(
+    {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta"}
+    | {"param", "source", "track", "wbr"}
+)
+# elements whose text BeautifulSoup's `get_text` leaves out
+_NON_TEXT_ELEMENTS = frozenset({"script", "style", "template"})
+
+
+class _ListingPageParser(HTMLParser):
+    """
+    Single-pass, event-based extractor for the fields we read off a listing page. Mirrors the BeautifulSoup queries in
+    `parse_listing_with_soup` - the first `span#titletextonly`, `span.price` and `section#postingbody` (minus its QR
+    code container), and the first `span.valu` in the first `div.attr` of each class - while streaming through the
+    page once instead of building a tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title: Optional[list] = None
+        self.price: Optional[list] = None
+        self.body: Optional[list] = None
+        self.attrs: Dict[str, Optional[list]] = {}
+
+        self._stack: list[str] = []
+        # (stack depth the capture was opened at, capture name, list collecting its text)
+        self._captures: list[tuple[int, str, list]] = []
+        # (stack depth, names of the captures that text is hidden from, or None for all of them)
+        self._hidden: list[tuple[int, Optional[str]]] = []
+        # (stack depth, attr classes) of the `div.attr`s we're in whose `span.valu` we're still looking for
+        self._open_attrs: list[tuple[int, list[str]]] = []
+
+    def _capture(self, name: str) -> list:
+        parts: list = []
+        self._captures.append((len(self._stack), name, parts))
+        return parts
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_ELEMENTS:
+            return
+
+        self._stack.append(tag)
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        element_id = attrs.get("id")
+
+        if tag in _NON_TEXT_ELEMENTS:
+            self._hidden.append((len(self._stack), None))
+        elif tag == "span":
+            if element_id == "titletextonly" and self.title is None:
+                self.title = self._capture("title")
+            if "price" in classes and self.price is None:
+                self.price = self._capture("price")
+            if "valu" in classes and self._open_attrs:
+                parts = self._capture("attr")
+                for _, attr_classes in self._open_attrs:
+                    for attr_class in attr_classes:
+                        self.attrs[attr_class] = parts
+                self._open_attrs = []
+        elif tag == "section":
+            if element_id == "postingbody" and self.body is None:
+                self.body = self._capture("body")
+        elif tag == "div":
+            if "print-qrcode-container" in classes and self.body is not None:
+                self._hidden.append((len(self._stack), "body"))
+            if "attr" in classes:
+                new_classes = [c for c in classes if c not in self.attrs]
+                for attr_class in new_classes:
+                    # claim the class now, so later divs with the same class are ignored like with `select_one`
+                    self.attrs[attr_class] = None
+                if new_classes:
+                    self._open_attrs.append((len(self._stack), new_classes))
+
+    def handle_endtag(self, tag):
+        # like BeautifulSoup, ignore stray end tags, and treat an end tag that doesn't match the innermost element as
+        # closing everything up to the matching element
+        if tag not in self._stack:
+            return
+
+        while self._stack:
+            popped = self._stack.pop()
+            depth = len(self._stack)
+            while self._captures and self._captures[-1][0] > depth:
+                self._captures.pop()
+            while self._hidden and self._hidden[-1][0] > depth:
+                self._hidden.pop()
+            while self._open_attrs and self._open_attrs[-1][0] > depth:
+                self._open_attrs.pop()
+            if popped == tag:
+                break
+
+    def handle_data(self, data):
+        if not self._captures:
+            return
+
+        hidden = {name for _, name in self._hidden}
+        if None in hidden:
+            return
+
+        for _, name, parts in self._captures:
+            if name not in hidden:
+                parts.append(data)
+
+
+def _join_text(parts: Optional[list], separator: str = "") -> Optional[str]:
+    """Join captured text like BeautifulSoup's `get_text(separator, strip=True)`"""
+    if parts is None:
+        return None
+    return separator.join(s for s in (part.strip() for part in parts) if s)
+
+
+def parse_listing_single_pass(html: str, url: str) -> Optional[BikeListingData]:
+    """
+    Fast path for `parse_craigslist_bike_listing`: extract all fields in a single scan of the page.
+
+    :param html: Raw HTML content of the listing page
+    :param url: URL of the listing
+    :return: BikeListingData, or None if the page doesn't have the layout we expect
+    """
+    parser = _ListingPageParser()
+    parser.feed(html)
+    parser.close()
+
+    if parser.title is None or parser.body is None:
+        return None
+
+    attrs = {
+        field_name: _join_text(parser.attrs.get(attr_class))
+        for attr_class, field_name in LISTING_ATTR_FIELDS.items()
+    }
+
+    return BikeListingData(
+        title=_join_text(parser.title),
+        price=_join_text(parser.price),
+        body=" ".join(_join_text(parser.body, separator=" ").split()),
+        url=url,
+        **attrs,
+    )
+
+
+@get_metrics().timed("listing_parse_seconds")
 def parse_craigslist_bike_listing(html: str, url: str) -> BikeListingData:
     """
-    Parse a Craigslist bike listing HTML page and extract structured data.
+    Parse a Craigslist bike listing HTML page and extract structured data. Uses the single-pass extractor, falling back
+    to BeautifulSoup when the page layout doesn't match what it expects.
 
     :param html: Raw HTML content of the listing page
     :param url: URL of the listing
     :return: BikeListingData model with extracted fields
     """
+    listing = parse_listing_single_pass(html, url)
+    if listing is None:
+        log.debug(f"Unexpected page layout, falling back to BeautifulSoup: {url}")
+        listing = parse_listing_with_soup(html, url)
+    return listing
+
+
+def parse_listing_with_soup(html: str, url: str) -> BikeListingData:
+    """
+    Parse a Craigslist bike listing HTML page with BeautifulSoup and extract structured data.
+
+    :param html: Raw HTML content of the listing page
+    :param url: URL of the listing
+    :return: BikeListingData model with extracted fields
+    """
+    # only needed for the odd page the single-pass parser can't handle, so it's kept out of our cold start
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html, "html.parser")
 
     # Extract title
@@ -79,18 +264,225 @@ def fetch_and_parse_listing(url: str) -> Optional[BikeListingData]:
     :return: BikeListingData or None if fetch fails
     """
     try:
-        response = requests.get(
-            url,
-            headers={"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"},
-            timeout=10,
-        )
+        http_client = get_http_client()
+        with get_metrics().timer("listing_fetch_seconds"):
+            response = http_client.get(url, timeout=10, conditional=True)
 
+        if response.status_code == 304:
+            return response.payload
         if response.status_code == 200:
-            return parse_craigslist_bike_listing(response.text, url)
-        else:
-            print(f"Failed to fetch {url}: Status {response.status_code}")
-            return None
+            listing = parse_craigslist_bike_listing(response.text, url)
+            http_client.store(response, listing)
+            return listing
+        log.warning(f"Failed to fetch {url}: Status {response.status_code}")
+        return None
 
     except Exception as e:
-        print(f"Error fetching {url}: {e}")
+        log.error(f"Error fetching {url}: {e}")
         return None
+
+
+@dataclass
+class FetchResult:
+    """Outcome of fetching and parsing a single listing with the `ListingFetcher`"""
+
+    url: str
+    listing: Optional[BikeListingData]
+    status_code: Optional[int] = None
+    attempts: int = 0
+    elapsed_seconds: float = 0.0
+    error: Optional[str] = None
+    # raw page HTML, only kept when the page is fetched without being parsed
+    html: Optional[str] = None
+
+
+@dataclass
+class FetchStats:
+    """Aggregate stats for a single `ListingFetcher.fetch_all` run"""
+
+    requested: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    rate_limited_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+    status_counts: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def listings_per_second(self) -> float:
+        return self.succeeded / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+class ListingFetcher:
+    """
+    Concurrent fetch engine for Craigslist listing pages. Fetches run on a thread pool with a cap on in-flight requests
+    per host, a per-host token bucket in place of a fixed sleep between requests, and retries with jittered exponential
+    backoff on 429s, 5xxs and connection errors.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_concurrency_per_host: int = 4,
+        requests_per_second: float = 2.0,
+        burst: int = 4,
+        max_retries: int = 3,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 30.0,
+        timeout: float = 10,
+        http_client: Optional[HttpClient] = None,
+    ):
+        """
+        Initialize the fetch engine.
+
+        :param max_workers: Size of the thread pool used to fetch listings
+        :param max_concurrency_per_host: Max number of in-flight requests to a single host
+        :param requests_per_second: Sustained request rate allowed per host
+        :param burst: Number of requests that may be sent back to back before the rate limit applies
+        :param max_retries: Max number of retries per listing on retryable failures
+        :param backoff_base_seconds: Base delay for exponential backoff between retries
+        :param backoff_max_seconds: Upper bound on the delay between retries
+        :param timeout: Per-request timeout in seconds
+        :param http_client: HTTP client to fetch with, defaults to the shared client
+        """
+        self.max_workers = max_workers
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.timeout = timeout
+        self.http_client = http_client or get_http_client()
+
+        self.stats = FetchStats()
+
+        # per-host limits are created lazily, since we don't know up front which hosts we'll hit
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_buckets: Dict[str, TokenBucket] = {}
+        self._host_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _host_limits(self, url: str) -> tuple[threading.BoundedSemaphore, TokenBucket]:
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self.max_concurrency_per_host
+                )
+                self._host_buckets[host] = TokenBucket(
+                    rate=self.requests_per_second, capacity=self.burst
+                )
+            return self._host_semaphores[host], self._host_buckets[host]
+
+    def _backoff_seconds(self, attempt: int, retry_after: Optional[str]) -> float:
+        """Full-jitter exponential backoff, honoring the server's `Retry-After` header when it sends one"""
+        return full_jitter_backoff(
+            attempt, self.backoff_base_seconds, self.backoff_max_seconds, retry_after
+        )
+
+    def fetch_page(self, url: str) -> FetchResult:
+        """
+        Fetch a single listing page under the fetcher's rate limits and retries, without parsing it, for callers
+        that parse pages separately.
+
+        :param url: URL of the Craigslist listing to fetch
+        :return: FetchResult holding the page's HTML on success
+        """
+        return self._fetch_one(url, parse=False)
+
+    def _fetch_one(self, url: str, parse: bool = True) -> FetchResult:
+        semaphore, bucket = self._host_limits(url)
+        start = time.monotonic()
+        result = FetchResult(url=url, listing=None)
+
+        for attempt in range(self.max_retries + 1):
+            result.attempts = attempt + 1
+            retry_after = None
+
+            with semaphore:
+                waited = bucket.acquire()
+                with self._stats_lock:
+                    self.stats.rate_limited_seconds += waited
+                try:
+                    with get_metrics().timer("listing_fetch_seconds"):
+                        # only parsed listings are kept for revalidation, so raw-HTML fetches go unconditional
+                        response = self.http_client.get(
+                            url, timeout=self.timeout, conditional=parse
+                        )
+                    result.status_code = response.status_code
+                    result.error = None
+                    with self._stats_lock:
+                        self.stats.status_counts[response.status_code] = (
+                            self.stats.status_counts.get(response.status_code, 0) + 1
+                        )
+
+                    if response.status_code == 200 and not parse:
+                        result.html = response.text
+                        break
+                    if response.status_code == 304:
+                        result.listing = response.payload
+                        break
+                    if response.status_code == 200:
+                        try:
+                            result.listing = parse_craigslist_bike_listing(
+                                response.text, url
+                            )
+                            self.http_client.store(response, result.listing)
+                        except Exception as e:
+                            result.error = f"Failed to parse: {e}"
+                        break
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        result.error = f"Status {response.status_code}"
+                        break
+                    result.error = f"Status {response.status_code}"
+                    retry_after = response.headers.get("Retry-After")
+
+                except requests.RequestException as e:
+                    result.status_code = None
+                    result.error = str(e)
+
+            # back off outside the semaphore so other requests to this host can proceed while we wait
+            if attempt < self.max_retries:
+                with self._stats_lock:
+                    self.stats.retries += 1
+                time.sleep(self._backoff_seconds(attempt, retry_after))
+
+        result.elapsed_seconds = time.monotonic() - start
+        get_metrics().observe("listing_fetch_total_seconds", result.elapsed_seconds)
+        return result
+
+    def fetch_all(self, urls: Iterable[str]) -> Iterator[FetchResult]:
+        """
+        Fetch and parse listings concurrently, yielding results in the order they finish.
+
+        :param urls: URLs of the Craigslist listings to fetch
+        :return: Iterator of FetchResult objects, one per URL
+        """
+        urls = list(urls)
+        self.stats = FetchStats(requested=len(urls))
+        start = time.monotonic()
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="listing-fetch"
+        )
+        try:
+            futures = [executor.submit(self._fetch_one, url) for url in urls]
+            for future in as_completed(futures):
+                result = future.result()
+                if result.listing:
+                    self.stats.succeeded += 1
+                else:
+                    self.stats.failed += 1
+                    log.warning(f"Failed to fetch {result.url}: {result.error}")
+                self.stats.elapsed_seconds = time.monotonic() - start
+                yield result
+        finally:
+            # if the caller stops consuming early, don't leave queued fetches running in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        log.info(
+            f"Fetched {self.stats.succeeded}/{self.stats.requested} listings in {self.stats.elapsed_seconds:.2f}s "
+            f"({self.stats.listings_per_second:.2f} listings/s, {self.stats.retries} retries, "
+            f"{self.stats.rate_limited_seconds:.2f}s waiting on rate limits)"
+        )
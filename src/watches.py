@@ -0,0 +1,372 @@
+"""
+Several people's watches over the same stream of listings. Each listing is fetched and parsed once, then checked
+against every watch: cheap pre-checks on its type, price and frame size rule watches out first, and the watches left
+are classified together in the same LLM request (`BikeClassifier.aclassify_watches`). Each watch's alerts go to its own
+recipients.
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from llm_classifier import is_failed_classification
+from models import (
+    BikeClassification,
+    BikeListingData,
+    ListingQuery,
+    WatchProfile,
+    WatchVerdicts,
+)
+from pricing import parse_frame_size_cm, parse_price
+
+if TYPE_CHECKING:
+    from listing_index import ListingIndex
+    from notifier import AlertDispatcher
+
+log = logging.getLogger(__name__)
+
+CONFIDENCE_RANK = {"low": 0, "medium": 1, "high": 2}
+
+
+def _confidence_rank(confidence: str) -> int:
+    # the LLM's confidence is free text, anything unexpected counts as low
+    return CONFIDENCE_RANK.get(confidence.strip().lower(), 0)
+
+
+def sent_alerts_path_for(
+    sent_alerts_path: Optional[Path], to_number: str
+) -> Optional[Path]:
+    """
+    :param sent_alerts_path: Path to the database of listings alerted on, as configured, if any
+    :param to_number: Phone number alerts are sent to
+    :return: Path to the database of listings alerted on to that number, next to the configured one, or None if none
+        is configured
+    """
+    if sent_alerts_path is None:
+        return None
+    digits = re.sub(r"\D", "", to_number)
+    return sent_alerts_path.with_name(
+        f"{sent_alerts_path.stem}-{digits}{sent_alerts_path.suffix}"
+    )
+
+
+@dataclass
+class WatchStats:
+    """Counts of listings checked against the watches, and what the pre-checks ruled out"""
+
+    checked: int = 0
+    # listings ruled out for every watch by the pre-checks, so never sent to the LLM
+    ruled_out: int = 0
+    ruled_out_by_watch: Dict[str, int] = field(default_factory=dict)
+    alerts_by_watch: Dict[str, int] = field(default_factory=dict)
+
+
+class _CompiledWatch:
+    """A watch with its regexes compiled"""
+
+    def __init__(self, watch: WatchProfile):
+        self.watch = watch
+        self.bicycle_type = (
+            re.compile("|".join(f"(?:{p})" for p in watch.bicycle_types), re.I)
+            if watch.bicycle_types
+            else None
+        )
+        self.exclude = (
+            re.compile("|".join(f"(?:{p})" for p in watch.exclude), re.I)
+            if watch.exclude
+            else None
+        )
+
+    def rules_out(
+        self,
+        listing: BikeListingData,
+        price: Optional[float],
+        frame_size_cm: Optional[float],
+    ) -> bool:
+        """Whether the listing fails any of the watch's pre-checks. Missing attributes never rule a listing out"""
+        watch = self.watch
+        if (
+            self.bicycle_type
+            and listing.bicycle_type
+            and not self.bicycle_type.search(listing.bicycle_type)
+        ):
+            return True
+        if price is not None and (
+            (watch.min_price is not None and price < watch.min_price)
+            or (watch.max_price is not None and price > watch.max_price)
+        ):
+            return True
+        if frame_size_cm is not None and (
+            (
+                watch.min_frame_size_cm is not None
+                and frame_size_cm < watch.min_frame_size_cm
+            )
+            or (
+                watch.max_frame_size_cm is not None
+                and frame_size_cm > watch.max_frame_size_cm
+            )
+        ):
+            return True
+        return bool(
+            self.exclude
+            and (
+                self.exclude.search(listing.title) or self.exclude.search(listing.body)
+            )
+        )
+
+
+def past_candidates(
+    index: "ListingIndex", watch: WatchProfile, since: Optional[float] = None
+) -> List[BikeListingData]:
+    """
+    Find the indexed listings a watch would have been checked against, e.g. to alert a newly added watch on listings
+    posted before it was. The index narrows them down by the watch's price and frame size ranges, then the rest of its
+    pre-checks are applied to what's left.
+
+    :param index: Index of earlier listings
+    :param watch: Watch to find listings for
+    :param since: Unix epoch timestamp of the earliest listings to consider, all of them if None
+    :return: Listings passing the watch's pre-checks, most recently indexed first
+    """
+    listings = index.query(
+        ListingQuery(
+            min_price=watch.min_price,
+            max_price=watch.max_price,
+            min_frame_size_cm=watch.min_frame_size_cm,
+            max_frame_size_cm=watch.max_frame_size_cm,
+            since=since,
+            # like the pre-checks, missing numbers never rule a listing out
+            include_missing=True,
+            limit=None,
+        )
+    )
+    compiled = _CompiledWatch(watch)
+    return [
+        listing
+        for listing in listings
+        if not compiled.rules_out(
+            listing, parse_price(listing.price), parse_frame_size_cm(listing.frame_size)
+        )
+    ]
+
+
+class WatchSet:
+    """The configured watches, deciding which of them a listing is worth asking the LLM about and what to alert on"""
+
+    def __init__(self, watches: List[WatchProfile]):
+        """
+        :param watches: Watches to check listings against
+        """
+        self.watches = watches
+        self._compiled = [_CompiledWatch(watch) for watch in watches]
+        self._by_name = {watch.name: watch for watch in watches}
+        self.stats = WatchStats()
+        self._stats_lock = threading.Lock()
+
+    def candidates(self, listing: BikeListingData) -> List[WatchProfile]:
+        """
+        :param listing: Parsed listing
+        :return: Watches the listing passes the pre-checks of
+        """
+        # parse the numbers once for every watch
+        price = parse_price(listing.price)
+        frame_size_cm = parse_frame_size_cm(listing.frame_size)
+        candidates = []
+        ruled_out = []
+        for compiled in self._compiled:
+            if compiled.rules_out(listing, price, frame_size_cm):
+                ruled_out.append(compiled.watch.name)
+            else:
+                candidates.append(compiled.watch)
+        with self._stats_lock:
+            self.stats.checked += 1
+            self.stats.ruled_out += not candidates
+            for name in ruled_out:
+                self.stats.ruled_out_by_watch[name] = (
+                    self.stats.ruled_out_by_watch.get(name, 0) + 1
+                )
+        return candidates
+
+    def get(self, name: str) -> WatchProfile:
+        """
+        :param name: Watch name
+        :return: The watch with that name
+        """
+        return self._by_name[name]
+
+    def combine(self, verdicts: Dict[str, BikeClassification]) -> WatchVerdicts:
+        """
+        Sum a listing's verdicts up as one classification, e.g. for the archive. It's good if any watch's verdict is,
+        and a failed classification if every verdict is.
+
+        :param verdicts: Verdict per watch name
+        :return: WatchVerdicts holding the verdicts and the watches to alert
+        """
+        if not verdicts:
+            return WatchVerdicts(
+                is_good=False,
+                reason="Ruled out by the pre-checks of every watch",
+                confidence="high",
+            )
+        failed = [v for v in verdicts.values() if is_failed_classification(v)]
+        if len(failed) == len(verdicts):
+            return WatchVerdicts(
+                is_good=False,
+                reason=failed[0].reason,
+                confidence="low",
+                verdicts=verdicts,
+            )
+
+        alert_watches = [
+            name
+            for name, verdict in verdicts.items()
+            if verdict.is_good
+            and not is_failed_classification(verdict)
+            and _confidence_rank(verdict.confidence)
+            >= _confidence_rank(self.get(name).min_confidence)
+        ]
+        is_good = any(verdict.is_good for verdict in verdicts.values())
+        relevant = {
+            name: verdict
+            for name, verdict in verdicts.items()
+            if verdict.is_good == is_good and not is_failed_classification(verdict)
+        }
+        return WatchVerdicts(
+            is_good=is_good,
+            reason="; ".join(
+                f"{name}: {verdict.reason}" for name, verdict in relevant.items()
+            ),
+            confidence=max(
+                (verdict.confidence for verdict in relevant.values()),
+                key=_confidence_rank,
+            ),
+            verdicts=verdicts,
+            alert_watches=alert_watches,
+        )
+
+    def record_alert(self, watch: str) -> None:
+        with self._stats_lock:
+            self.stats.alerts_by_watch[watch] = (
+                self.stats.alerts_by_watch.get(watch, 0) + 1
+            )
+
+    def reset_stats(self) -> None:
+        """Start counting from zero, e.g. at the start of each run of a long-lived watch set"""
+        with self._stats_lock:
+            self.stats = WatchStats()
+
+    def log_stats(self) -> None:
+        """Log how many listings the pre-checks ruled out, and the alerts per watch"""
+        stats = self.stats
+        log.info(
+            f"Watches: {stats.checked} listings checked against {len(self.watches)} watches, {stats.ruled_out} "
+            f"ruled out for all of them by pre-checks. Ruled out per watch: {stats.ruled_out_by_watch}, alerts per "
+            f"watch: {stats.alerts_by_watch}"
+        )
+
+
+class WatchNotifier:
+    """
+    Sends each watch's alerts to its recipients, through an AlertDispatcher per phone number. A listing good for
+    several watches with the same recipient is only sent to them once, as each number keeps its own record of the
+    listings it was alerted on.
+    """
+
+    def __init__(
+        self,
+        watches: WatchSet,
+        dispatcher_for: Callable[[str], "AlertDispatcher"],
+    ):
+        """
+        :param watches: Watches to send alerts for
+        :param dispatcher_for: Builds the dispatcher sending to a phone number. Called the first time an alert goes
+            to that number
+        """
+        self.watches = watches
+        self.dispatcher_for = dispatcher_for
+        self.dispatchers: Dict[str, "AlertDispatcher"] = {}
+        self._lock = threading.Lock()
+
+    def _dispatcher(self, to_number: str) -> "AlertDispatcher":
+        with self._lock:
+            if to_number not in self.dispatchers:
+                self.dispatchers[to_number] = self.dispatcher_for(to_number)
+            return self.dispatchers[to_number]
+
+    def submit(
+        self,
+        listing: BikeListingData,
+        reason: str,
+        on_sent: Optional[Callable[[], None]] = None,
+        watch: Optional[str] = None,
+    ) -> bool:
+        """
+        Queue a watch's alert to each of its recipients.
+
+        :param listing: BikeListingData object
+        :param reason: The watch's classification reason
+        :param on_sent: Called once per recipient the alert is sent to
+        :param watch: Name of the watch the listing is good for
+        :return: True if the alert was queued for any recipient
+        """
+        profile = self.watches.get(watch)
+        queued = [
+            self._dispatcher(to_number).submit(
+                listing, f"{profile.name}: {reason}", on_sent
+            )
+            for to_number in profile.to_numbers
+        ]
+        if any(queued):
+            self.watches.record_alert(profile.name)
+        return any(queued)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for every alert queued so far to be sent or to fail, see `AlertDispatcher.flush`.
+
+        :param timeout: Max number of seconds to wait, over all dispatchers
+        :return: Whether every dispatcher's queued alerts got through a send attempt within the timeout
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        flushed = True
+        for dispatcher in list(self.dispatchers.values()):
+            flushed &= dispatcher.flush(
+                max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            )
+        return flushed
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Send every queued alert, then stop the dispatchers.
+
+        :param timeout: Max number of seconds to wait for queued alerts to be sent, over all dispatchers
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for dispatcher in list(self.dispatchers.values()):
+            dispatcher.close(
+                max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            )
+
+    def pending_urls(self) -> List[str]:
+        """
+        :return: URLs of the listings with an alert to any recipient that hasn't been sent, see
+            `AlertDispatcher.pending_urls`
+        """
+        return list(
+            {
+                url
+                for dispatcher in self.dispatchers.values()
+                for url in dispatcher.pending_urls()
+            }
+        )
+
+    def log_stats(self) -> None:
+        """Log what each dispatcher has sent"""
+        for to_number, dispatcher in self.dispatchers.items():
+            log.info(f"Alerts to ...{to_number[-4:]}:")
+            dispatcher.log_stats()
+        self.watches.log_stats()
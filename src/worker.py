@@ -0,0 +1,282 @@
+"""
+Long-running worker mode: runs the pipeline in a loop in one process instead of on the cloud function's fixed
+schedule, keeping clients, caches and CDC state warm between polls. Polls come faster while new listings are coming in
+quickly and slow down when they're not (e.g. overnight), going by the posting rate observed at each hour of the day,
+with jitter and a budget on SAPI requests.
+
+Usage:
+    python src/worker.py
+    python src/worker.py --max-polls 10  # e.g. against a local stand-in
+"""
+
+import argparse
+import logging
+import random
+import signal
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from config import Config, get_config
+from container import AppContainer
+from main import run_pipeline
+from rate_limit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+
+class PostingRateEstimator:
+    """
+    Exponentially weighted moving average of the rate new listings are posted at, kept per hour of the day (local
+    time) so we already know to slow down at night before a quiet poll tells us, plus one over all hours for hours
+    we haven't seen yet.
+    """
+
+    def __init__(self, smoothing: float = 0.3):
+        """
+        :param smoothing: Weight of each new observation, between 0 and 1. Higher adapts faster but is noisier
+        """
+        self.smoothing = smoothing
+        self._overall: Optional[float] = None
+        self._by_hour: List[Optional[float]] = [None] * 24
+
+    def _update(self, current: Optional[float], rate: float) -> float:
+        if current is None:
+            return rate
+        return current + self.smoothing * (rate - current)
+
+    def record(self, new_listings: int, elapsed_seconds: float, at: float) -> None:
+        """
+        :param new_listings: Number of new listings found by a poll
+        :param elapsed_seconds: Time since the last successful poll, i.e. the span the new listings were posted in
+        :param at: Unix epoch timestamp of the poll
+        """
+        if elapsed_seconds <= 0:
+            return
+        rate = new_listings / elapsed_seconds
+        hour = time.localtime(at).tm_hour
+        self._overall = self._update(self._overall, rate)
+        self._by_hour[hour] = self._update(self._by_hour[hour], rate)
+
+    def rate(self, at: float) -> Optional[float]:
+        """
+        :param at: Unix epoch timestamp to estimate the rate at
+        :return: Estimated new listings per second, or None before the first observation
+        """
+        by_hour = self._by_hour[time.localtime(at).tm_hour]
+        return by_hour if by_hour is not None else self._overall
+
+
+class PollScheduler:
+    """
+    Decides how long to wait between polls: long enough to expect `target_listings_per_poll` new listings at the
+    estimated posting rate, within [`min_interval_seconds`, `max_interval_seconds`], jittered by +/- `jitter`. A token
+    bucket of SAPI requests holds polls back once the hourly budget is used up.
+    """
+
+    def __init__(
+        self,
+        min_interval_seconds: float,
+        max_interval_seconds: float,
+        target_listings_per_poll: float = 1.0,
+        jitter: float = 0.2,
+        requests_per_poll: int = 1,
+        requests_per_hour: Optional[float] = None,
+        estimator: Optional[PostingRateEstimator] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        :param min_interval_seconds: Shortest time between polls
+        :param max_interval_seconds: Longest time between polls
+        :param target_listings_per_poll: Number of new listings to expect per poll
+        :param jitter: Fraction of each interval to randomly add or take away
+        :param requests_per_poll: Number of SAPI requests a poll makes, i.e. the number of searches
+        :param requests_per_hour: Budget on SAPI requests, unlimited if None
+        :param estimator: Posting rate estimator, a new one if not given
+        :param rng: Random number generator for the jitter
+        """
+        if min_interval_seconds > max_interval_seconds:
+            raise ValueError(
+                f"Min poll interval {min_interval_seconds}s is longer than the max, {max_interval_seconds}s"
+            )
+        self.min_interval_seconds = min_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.target_listings_per_poll = target_listings_per_poll
+        self.jitter = jitter
+        self.requests_per_poll = requests_per_poll
+        self.estimator = estimator or PostingRateEstimator()
+        self.rng = rng or random.Random()
+        self.budget = None
+        if requests_per_hour:
+            # allow a few polls back to back, but no more than five minutes' worth of the budget at once
+            self.budget = TokenBucket(
+                requests_per_hour / 3600,
+                capacity=max(requests_per_poll, requests_per_hour / 12),
+            )
+
+    def interval(self, at: float) -> float:
+        """
+        :param at: Unix epoch timestamp of the poll the interval starts at
+        :return: Time to wait until the next poll, before jitter
+        """
+        rate = self.estimator.rate(at)
+        if rate is None:
+            # nothing observed yet - start in the middle and let the first few polls tell us where to go
+            return (self.min_interval_seconds + self.max_interval_seconds) / 2
+        if rate <= 0:
+            return self.max_interval_seconds
+        return min(
+            self.max_interval_seconds,
+            max(self.min_interval_seconds, self.target_listings_per_poll / rate),
+        )
+
+    def next_delay(self, at: float) -> float:
+        """
+        :param at: Unix epoch timestamp of the poll the delay starts at
+        :return: Jittered time to wait until the next poll
+        """
+        interval = self.interval(at)
+        return max(0.0, interval * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def budget_wait(self) -> float:
+        """
+        :return: Seconds until the request budget allows another poll, 0 if it does now
+        """
+        if self.budget is None:
+            return 0.0
+        return self.budget.seconds_until_available(self.requests_per_poll)
+
+    def try_start_poll(self) -> bool:
+        """
+        Take a poll's worth of requests from the budget.
+
+        :return: True if the budget allowed the poll
+        """
+        return self.budget is None or self.budget.try_acquire(self.requests_per_poll)
+
+
+@dataclass
+class WorkerStats:
+    polls: int = 0
+    failed_polls: int = 0
+    budget_waits: int = 0
+    new_listings: int = 0
+    # time between the starts of consecutive polls
+    intervals: List[float] = field(default_factory=list)
+
+
+class Worker:
+    """Polls for new listings until stopped, running the whole pipeline on each poll"""
+
+    def __init__(
+        self,
+        scheduler: PollScheduler,
+        poll: Callable[[], int],
+    ):
+        """
+        :param scheduler: Decides when to poll
+        :param poll: Runs one poll, returning the number of new listings found
+        """
+        self.scheduler = scheduler
+        self.poll = poll
+        self.stats = WorkerStats()
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Stop after the poll in progress, if any"""
+        self._stop.set()
+
+    def run(self, max_polls: Optional[int] = None) -> WorkerStats:
+        """
+        Poll until stopped.
+
+        :param max_polls: Stop after this many polls
+        :return: WorkerStats for the run
+        """
+        last_success_at = None
+        last_poll_at = None
+        while not self._stop.is_set() and (
+            max_polls is None or self.stats.polls < max_polls
+        ):
+            if not self.scheduler.try_start_poll():
+                self.stats.budget_waits += 1
+                wait = self.scheduler.budget_wait()
+                log.info(f"SAPI request budget used up, waiting {wait:.0f}s")
+                self._stop.wait(wait)
+                continue
+
+            poll_at = time.time()
+            if last_poll_at is not None:
+                self.stats.intervals.append(poll_at - last_poll_at)
+            last_poll_at = poll_at
+            self.stats.polls += 1
+            try:
+                new_listings = self.poll()
+            except Exception as e:
+                self.stats.failed_polls += 1
+                log.error(f"Poll failed: {e}", exc_info=True)
+            else:
+                self.stats.new_listings += new_listings
+                # a failed poll doesn't advance our CDC state, so the next successful one covers the time since the
+                # last success
+                if last_success_at is not None:
+                    self.scheduler.estimator.record(
+                        new_listings, poll_at - last_success_at, at=poll_at
+                    )
+                last_success_at = poll_at
+
+            delay = self.scheduler.next_delay(poll_at)
+            log.info(f"Next poll in {delay:.0f}s")
+            self._stop.wait(max(0.0, poll_at + delay - time.time()))
+        return self.stats
+
+    def log_stats(self) -> None:
+        """Log how often the worker polled and what it found"""
+        stats = self.stats
+        intervals = (
+            f"{min(stats.intervals):.1f}s/{statistics.median(stats.intervals):.1f}s/{max(stats.intervals):.1f}s"
+            if stats.intervals
+            else "-"
+        )
+        log.info(
+            f"Worker: {stats.polls} polls ({stats.failed_polls} failed), {stats.new_listings} new listings, "
+            f"min/median/max interval {intervals}, {stats.budget_waits} waits on the request budget"
+        )
+
+
+def build_worker(container: AppContainer) -> Worker:
+    """
+    :param container: Config and clients to run the pipeline with
+    :return: Worker polling with the configured intervals and request budget
+    """
+    config: Config = container.config
+    scheduler = PollScheduler(
+        min_interval_seconds=config.worker_min_interval_seconds,
+        max_interval_seconds=config.worker_max_interval_seconds,
+        target_listings_per_poll=config.worker_target_listings_per_poll,
+        jitter=config.worker_interval_jitter,
+        requests_per_poll=len(config.get_search_profiles()),
+        requests_per_hour=config.worker_sapi_requests_per_hour,
+    )
+    return Worker(scheduler, poll=lambda: run_pipeline(container))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-polls", type=int, help="Stop after this many polls")
+    args = parser.parse_args()
+
+    # we're the only process writing our CDC state, so keep it in memory between polls
+    worker = build_worker(AppContainer(get_config(), cache_state=True))
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: worker.stop())
+    try:
+        worker.run(max_polls=args.max_polls)
+    finally:
+        worker.log_stats()
+
+
+if __name__ == "__main__":
+    main()